@@ -1,13 +1,83 @@
 from flask import Flask, render_template_string, request, send_file
-import subprocess
+import hashlib
 import os
-import tempfile
+import sys
+import time
 import urllib.request
+from contextlib import ExitStack
+from dataclasses import replace
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vertical_studio.content_store import ContentStore, DigestMismatch, StoreQuotaExceeded, UploadTooLarge
+from vertical_studio.frame_preview import FrameDecodeError, FramePreviewer
+from vertical_studio.jobqueue import DONE, FAILED, SQLiteJobQueue, conversion_payload
+from vertical_studio.output_store import OutputStore, output_key
+from vertical_studio.pipeline import (ConversionJob, Pipeline, StitchClip, StitchJob, validate_trim, ERROR_FFMPEG_FAILED,
+                                      ERROR_RESOURCE_LIMIT, ERROR_TIMEOUT, LOG_ERRORS, POSTER_FILENAME,
+                                      SPRITE_VTT_FILENAME)
+from vertical_studio.preview import preview_start
+from vertical_studio.profiles import get_profile
+from vertical_studio.resources import cpu_info, ffmpeg_rlimits, memory_budget_bytes, memory_limit_bytes
+from vertical_studio.segmented import SegmentedConversion
+from vertical_studio.sizing import TargetSizeError, convert_to_target_size
+from vertical_studio.scratch import ScratchStorage, ScratchQuotaExceeded, UnknownWorkspace
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB with chunked upload support
 
+# Per-job workspaces with a byte quota; abandoned uploads are reclaimed in the background.
+scratch = ScratchStorage()
+scratch.start_reaper()
+
+# Uploaded inputs keyed by SHA-256 so repeat conversions can skip the upload.
+content_store = ContentStore()
+
+# Converted outputs stay downloadable (with ETag/Range support) for a retention window.
+output_store = OutputStore()
+
+# Queued conversions (POST /jobs) are run by worker.py processes that share the
+# queue and both stores, so encode capacity scales separately from the web tier.
+job_queue = SQLiteJobQueue()
+
+# Raw-body uploads to /convert-stream are copied to disk block by block, so
+# they are not bound by MAX_CONTENT_LENGTH. Vercel rejects request bodies over
+# 4.5 MB, so the page keeps using chunked uploads there unless overridden.
+STREAM_UPLOAD_MAX_BYTES = int(os.environ.get('VS_STREAM_UPLOAD_MAX_MB', '2048')) * 1024 * 1024
+STREAM_UPLOADS = os.environ.get('VS_STREAM_UPLOADS', '0' if os.environ.get('VERCEL') else '1') == '1'
+
+# Bump whenever convert_video_file changes its output, so retained outputs are not reused.
+ENCODER_VERSION = 'api-4'
+
+FFMPEG_PATH = os.environ.get('VS_FFMPEG_PATH', '/tmp/ffmpeg')
+CONVERSION_TIMEOUT_SECONDS = 40
+FAILURE_LOG_LINES = 3  # Lines of the ffmpeg log tail shown when a failure was not recognized
+
+# Simplified conversion for better compatibility: letterbox on black, ultrafast,
+# mono audio to save space, limited to 60 seconds. Set VS_API_PROFILE to move
+# traffic to another profile (e.g. a cheaper one under load).
+API_PROFILE = get_profile(os.environ.get('VS_API_PROFILE', 'api'))
+ENCODER_SETTINGS = API_PROFILE.settings
+
+# Threads and lookahead shrink to fit the function's memory; optional rlimits make
+# runaway ffmpeg children fail fast with ERROR_RESOURCE_LIMIT.
+pipeline = Pipeline(ffmpeg=FFMPEG_PATH, memory_budget_bytes=memory_budget_bytes(), **ffmpeg_rlimits())
+
+# Still previews for the framing sliders, composited from in-memory frame and layer caches.
+frame_previewer = FramePreviewer(pipeline)
+
+# Conversions too long for one invocation run in segments through /convert-resumable,
+# each call encoding for at most RESUMABLE_BUDGET_SECONDS (vercel.json allows 60s).
+# The 60s output cap of single-shot conversions is raised, since that is the point of this mode.
+RESUMABLE_BUDGET_SECONDS = float(os.environ.get('VS_RESUMABLE_BUDGET_SECONDS', '45'))
+RESUMABLE_SETTINGS = replace(ENCODER_SETTINGS, max_duration=float(os.environ.get('VS_RESUMABLE_MAX_SECONDS', '600')))
+segmented = SegmentedConversion(pipeline)
+
+# /stitch joins stored clips (e.g. ~8s VEO3 renders) into one Short in a single encode.
+STITCH_MAX_CLIPS = int(os.environ.get('VS_STITCH_MAX_CLIPS', '20'))
+
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html>
@@ -32,6 +102,8 @@ HTML_TEMPLATE = '''
         .success { color: #28a745; font-weight: bold; }
         .error { color: #dc3545; font-weight: bold; }
         .file-info { background: #e8f5e8; padding: 15px; border-radius: 10px; margin: 15px 0; }
+        .preview { text-align: center; margin: 15px 0; }
+        .preview img { width: 180px; height: 320px; border-radius: 10px; background: #000; object-fit: contain; }
     </style>
 </head>
 <body>
@@ -50,6 +122,11 @@ HTML_TEMPLATE = '''
         <div id="fileInfo" class="file-info" style="display: none;"></div>
         
         <div id="videoSettings" style="display: none;">
+            <div class="preview">
+                <img id="previewImg" alt="Preview" style="display: none;">
+                <div id="previewNote"><small>Preview appears once the file is on the server</small></div>
+            </div>
+            
             <div class="settings">
                 <div class="slider-container">
                     <label><strong>✂️ Black Bar Removal:</strong> <span id="cropValue">5%</span></label>
@@ -62,6 +139,14 @@ HTML_TEMPLATE = '''
                     <input type="range" id="zoomSlider" class="slider" min="10" max="15" value="10">
                     <small>Zoom into the center of your video</small>
                 </div>
+                
+                <div class="slider-container">
+                    <label><strong>⏱️ Trim:</strong> <span id="trimValue">Full video</span></label>
+                    <input type="number" id="trimStart" min="0" step="0.1" placeholder="Start (s)" style="width: 100px;">
+                    –
+                    <input type="number" id="trimEnd" min="0" step="0.1" placeholder="End (s)" style="width: 100px;">
+                    <br><small>Only the selected part is converted (max 60 seconds)</small>
+                </div>
             </div>
             
             <button class="btn" id="convertBtn" onclick="convertVideo()">✨ Convert to Vertical Format</button>
@@ -84,8 +169,8 @@ HTML_TEMPLATE = '''
         document.getElementById('videoFile').addEventListener('change', function(e) {
             uploadedFile = e.target.files[0];
             if (uploadedFile) {
-                if (uploadedFile.size > 50 * 1024 * 1024) {
-                    alert('❌ File too large! Maximum 50MB allowed.');
+                if (uploadedFile.size > MAX_UPLOAD_BYTES) {
+                    alert(`❌ File too large! Maximum ${MAX_UPLOAD_BYTES / 1024 / 1024} MB allowed.`);
                     return;
                 }
                 
@@ -94,15 +179,109 @@ HTML_TEMPLATE = '''
                     `📁 <strong>${uploadedFile.name}</strong> (${fileSize} MB)`;
                 document.getElementById('fileInfo').style.display = 'block';
                 document.getElementById('videoSettings').style.display = 'block';
+                detectDuration(uploadedFile);
+                preparePreview(uploadedFile);
             }
         });
         
+        let previewHash = null;
+        let previewTimer = null;
+        
+        async function preparePreview(file) {
+            // Store the input once; every slider change then only fetches a small JPEG
+            previewHash = null;
+            document.getElementById('previewImg').style.display = 'none';
+            const fileHash = await sha256Hex(file);
+            if (!fileHash) return;
+            const check = await fetch('/api/inputs/' + fileHash);
+            if (!check.ok) {
+                if (file.size > 4 * 1024 * 1024 && !STREAM_UPLOADS) return;
+                const upload = await fetch('/api/inputs/' + fileHash, {
+                    method: 'PUT',
+                    headers: { 'Content-Type': 'application/octet-stream' },
+                    body: file
+                });
+                if (!upload.ok) return;
+            }
+            if (file !== uploadedFile) return;
+            previewHash = fileHash;
+            document.getElementById('previewNote').style.display = 'none';
+            updatePreview();
+        }
+        
+        function updatePreview() {
+            if (!previewHash) return;
+            clearTimeout(previewTimer);
+            previewTimer = setTimeout(function() {
+                const params = new URLSearchParams({ sha256: previewHash });
+                for (const [key, value] of Object.entries(conversionOptions())) {
+                    if (value !== '') params.append(key, value);
+                }
+                const img = document.getElementById('previewImg');
+                img.src = '/api/preview?' + params.toString();
+                img.style.display = 'inline-block';
+            }, 100);
+        }
+        
+        function detectDuration(file) {
+            // Read the duration from the file's metadata to pre-fill the trim range
+            const video = document.createElement('video');
+            video.preload = 'metadata';
+            video.onloadedmetadata = function() {
+                const duration = video.duration;
+                window.URL.revokeObjectURL(video.src);
+                if (!isFinite(duration)) return;
+                document.getElementById('trimStart').value = 0;
+                document.getElementById('trimEnd').value = Math.min(duration, 60).toFixed(1);
+                document.getElementById('trimStart').max = duration.toFixed(1);
+                document.getElementById('trimEnd').max = duration.toFixed(1);
+                updateTrimLabel();
+            };
+            video.src = window.URL.createObjectURL(file);
+        }
+        
+        function updateTrimLabel() {
+            const start = parseFloat(document.getElementById('trimStart').value || '0');
+            const end = parseFloat(document.getElementById('trimEnd').value);
+            document.getElementById('trimValue').textContent = isNaN(end)
+                ? 'From ' + start.toFixed(1) + 's'
+                : start.toFixed(1) + 's – ' + end.toFixed(1) + 's (' + (end - start).toFixed(1) + 's)';
+        }
+        
+        document.getElementById('trimStart').addEventListener('input', updateTrimLabel);
+        document.getElementById('trimStart').addEventListener('change', updatePreview);
+        document.getElementById('trimEnd').addEventListener('input', updateTrimLabel);
+        document.getElementById('trimEnd').addEventListener('change', updatePreview);
+        
+        const STREAM_UPLOADS = {{ 'true' if stream_uploads else 'false' }};
+        // Streamed uploads have their own, much larger limit than multipart ones
+        const MAX_UPLOAD_BYTES = {{ max_upload_bytes }};
+        // Hashing reads the whole file into memory; larger files are uploaded without a hash
+        const MAX_HASH_BYTES = 512 * 1024 * 1024;
+        
+        function conversionOptions() {
+            return {
+                crop: document.getElementById('cropSlider').value,
+                zoom: document.getElementById('zoomSlider').value,
+                start: document.getElementById('trimStart').value,
+                end: document.getElementById('trimEnd').value
+            };
+        }
+        
+        function appendOptions(formData, options) {
+            for (const [key, value] of Object.entries(options)) {
+                if (value !== '') formData.append(key, value);
+            }
+        }
+        
         document.getElementById('cropSlider').addEventListener('input', function(e) {
             document.getElementById('cropValue').textContent = e.target.value + '%';
+            updatePreview();
         });
         
         document.getElementById('zoomSlider').addEventListener('input', function(e) {
             document.getElementById('zoomValue').textContent = (e.target.value / 10).toFixed(1) + 'x';
+            updatePreview();
         });
         
         async function convertVideo() {
@@ -114,14 +293,22 @@ HTML_TEMPLATE = '''
             document.getElementById('result').innerHTML = '';
             
             try {
-                const crop = document.getElementById('cropSlider').value;
-                const zoom = document.getElementById('zoomSlider').value;
+                const options = conversionOptions();
+                
+                // Skip the upload entirely if the server already has this file
+                document.getElementById('convertBtn').textContent = '🔍 Checking file...';
+                const fileHash = await sha256Hex(uploadedFile);
+                if (fileHash && await convertByHash(fileHash, options)) {
+                    return;
+                }
                 
-                // For files > 4MB, use chunked upload
-                if (uploadedFile.size > 4 * 1024 * 1024) {
-                    await uploadLargeFile(uploadedFile, crop, zoom);
+                // For files > 4MB, stream the raw file where the host allows it, else use chunked upload
+                if (uploadedFile.size > 4 * 1024 * 1024 && STREAM_UPLOADS) {
+                    await uploadStreamed(uploadedFile, options, fileHash);
+                } else if (uploadedFile.size > 4 * 1024 * 1024) {
+                    await uploadLargeFile(uploadedFile, options, fileHash);
                 } else {
-                    await uploadSmallFile(uploadedFile, crop, zoom);
+                    await uploadSmallFile(uploadedFile, options, fileHash);
                 }
             } catch (error) {
                 document.getElementById('result').innerHTML = 
@@ -132,11 +319,51 @@ HTML_TEMPLATE = '''
             }
         }
         
-        async function uploadSmallFile(file, crop, zoom) {
+        async function sha256Hex(file) {
+            // crypto.subtle is only available in secure contexts
+            if (!window.crypto || !window.crypto.subtle || file.size > MAX_HASH_BYTES) return null;
+            const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+            return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        }
+        
+        async function convertByHash(fileHash, options) {
+            const check = await fetch('/api/inputs/' + fileHash);
+            if (!check.ok) return false;
+            
+            document.getElementById('convertBtn').textContent = '🔄 Converting...';
+            document.getElementById('progressBar').style.width = '50%';
+            
+            const formData = new FormData();
+            formData.append('sha256', fileHash);
+            appendOptions(formData, options);
+            
+            const response = await fetch('/api/convert', {
+                method: 'POST',
+                body: formData
+            });
+            
+            // The input may have been evicted since the check; fall back to uploading
+            if (response.status === 404) return false;
+            
+            document.getElementById('progressBar').style.width = '100%';
+            
+            if (response.ok) {
+                const blob = await response.blob();
+                downloadFile(blob, 'vertical_video.mp4');
+                document.getElementById('result').innerHTML = 
+                    '<p class="success">✅ Conversion successful (no upload needed)!' + fastPathNote(response) + '</p>';
+                return true;
+            } else {
+                const errorText = await response.text();
+                throw new Error(errorText || 'Conversion failed');
+            }
+        }
+        
+        async function uploadSmallFile(file, options, fileHash) {
             const formData = new FormData();
             formData.append('video', file);
-            formData.append('crop', crop);
-            formData.append('zoom', zoom);
+            appendOptions(formData, options);
+            if (fileHash) formData.append('sha256', fileHash);
             
             document.getElementById('progressBar').style.width = '50%';
             
@@ -151,17 +378,56 @@ HTML_TEMPLATE = '''
                 const blob = await response.blob();
                 downloadFile(blob, 'vertical_video.mp4');
                 document.getElementById('result').innerHTML = 
-                    '<p class="success">✅ Conversion successful!</p>';
+                    '<p class="success">✅ Conversion successful!' + fastPathNote(response) + '</p>';
+            } else {
+                const errorText = await response.text();
+                throw new Error(errorText || 'Conversion failed');
+            }
+        }
+        
+        async function uploadStreamed(file, options, fileHash) {
+            const params = new URLSearchParams();
+            for (const [key, value] of Object.entries(options)) {
+                if (value !== '') params.append(key, value);
+            }
+            if (fileHash) params.append('sha256', fileHash);
+            
+            document.getElementById('progressBar').style.width = '50%';
+            
+            // The browser sends the file straight from disk as the request body
+            const response = await fetch('/api/convert-stream?' + params.toString(), {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file
+            });
+            
+            document.getElementById('progressBar').style.width = '100%';
+            
+            if (response.ok) {
+                const blob = await response.blob();
+                downloadFile(blob, 'vertical_video.mp4');
+                document.getElementById('result').innerHTML = 
+                    '<p class="success">✅ Large file conversion successful!' + fastPathNote(response) + '</p>';
             } else {
                 const errorText = await response.text();
                 throw new Error(errorText || 'Conversion failed');
             }
         }
         
-        async function uploadLargeFile(file, crop, zoom) {
+        async function uploadLargeFile(file, options, fileHash) {
             const chunkSize = 3 * 1024 * 1024; // 3MB chunks
             const totalChunks = Math.ceil(file.size / chunkSize);
-            const uploadId = Date.now().toString();
+            
+            // Ask the server for a unique upload workspace
+            const initResponse = await fetch('/api/upload-init', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, fileSize: file.size })
+            });
+            if (!initResponse.ok) {
+                throw new Error(await initResponse.text() || 'Upload could not be started');
+            }
+            const uploadId = (await initResponse.json()).uploadId;
             
             document.getElementById('convertBtn').textContent = '📤 Uploading chunks...';
             
@@ -199,9 +465,9 @@ HTML_TEMPLATE = '''
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
+                    ...options,
                     uploadId: uploadId,
-                    crop: crop,
-                    zoom: zoom
+                    sha256: fileHash
                 })
             });
             
@@ -211,13 +477,17 @@ HTML_TEMPLATE = '''
                 const blob = await convertResponse.blob();
                 downloadFile(blob, 'vertical_video.mp4');
                 document.getElementById('result').innerHTML = 
-                    '<p class="success">✅ Large file conversion successful!</p>';
+                    '<p class="success">✅ Large file conversion successful!' + fastPathNote(convertResponse) + '</p>';
             } else {
                 const errorText = await convertResponse.text();
                 throw new Error(errorText || 'Conversion failed');
             }
         }
         
+        function fastPathNote(response) {
+            return response.headers.get('X-Fast-Path') ? ' ⚡ Already vertical, remuxed without re-encoding.' : '';
+        }
+        
         function downloadFile(blob, filename) {
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
@@ -277,7 +547,7 @@ HTML_TEMPLATE = '''
 
 def download_ffmpeg():
     """Download FFmpeg binary."""
-    ffmpeg_path = "/tmp/ffmpeg"
+    ffmpeg_path = FFMPEG_PATH
     if os.path.exists(ffmpeg_path):
         return True
     
@@ -291,85 +561,509 @@ def download_ffmpeg():
     except:
         return False
 
-def convert_video_file(input_path, output_path, crop_percent, zoom_level):
-    """Convert video to vertical format."""
+def convert_video_file(input_path, output_path, crop_percent, zoom_level, start_time=None, end_time=None,
+                       target_bytes=None, assets_dir=None):
+    """Convert video to vertical format. Returns (success, message, extra) where extra is output metadata.
+    
+    With assets_dir, a poster and seek sprite (with WebVTT index) are written there in the same ffmpeg run.
+    """
     if not download_ffmpeg():
-        return False, "FFmpeg download failed"
+        return False, "FFmpeg download failed", None
     
-    # Simplified conversion for better compatibility
-    cmd = [
-        '/tmp/ffmpeg', '-i', input_path,
-        '-vf', f'crop=in_w:in_h*{1-2*crop_percent}:0:in_h*{crop_percent},scale=1080:1920:force_original_aspect_ratio=decrease,pad=1080:1920:(ow-iw)/2:(oh-ih)/2:black',
-        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '32',
-        '-c:a', 'aac', '-b:a', '32k', '-ac', '1',  # Mono audio to save space
-        '-t', '60',  # Limit to 60 seconds
-        '-y', output_path
-    ]
+    job = ConversionJob(
+        input_path, output_path, crop_percent, zoom_level, ENCODER_SETTINGS,
+        start_time=start_time, end_time=end_time, assets_dir=assets_dir
+    )
+    if target_bytes:
+        # Short sample encodes pick the CRF that fits the requested size
+        try:
+            result, plan = convert_to_target_size(pipeline, job, target_bytes, timeout=CONVERSION_TIMEOUT_SECONDS)
+        except TargetSizeError as e:
+            return False, str(e), None
+        extra = {'target_bytes': plan.target_bytes, 'predicted_bytes': plan.predicted_bytes, 'crf': plan.crf}
+    else:
+        result = pipeline.run(job, timeout=CONVERSION_TIMEOUT_SECONDS)
+        extra = {'fast_path': result.fast_path}
+    if result.success:
+        extra.update(peak_rss_bytes=result.peak_rss_bytes, cpu_seconds=result.cpu_seconds)
+        return True, "Success", extra
+    return False, failure_message(result), None
+
+def failure_message(result):
+    """User-facing message for a failed ConversionResult."""
+    if result.error == ERROR_RESOURCE_LIMIT:
+        return result.log.splitlines()[0]
+    if result.error in LOG_ERRORS:
+        return f"{result.log.splitlines()[0]} ({result.error})"
+    if result.error == ERROR_FFMPEG_FAILED:
+        # ffmpeg prints the actual cause last, after the input banner
+        return f"FFmpeg error: {' | '.join(result.log.splitlines()[-FAILURE_LOG_LINES:])}"
+    if result.error == ERROR_TIMEOUT:
+        return f"Conversion timeout ({CONVERSION_TIMEOUT_SECONDS}s limit)"
+    return f"System error: {result.log}"
+
+def conversion_options(values):
+    """Read crop, zoom and trim from form or JSON values. Raises ValueError for invalid input."""
+    start_time, end_time = validate_trim(values.get('start'), values.get('end'))
+    target_mb = float(values['target_mb']) if values.get('target_mb') not in (None, '') else None
+    if target_mb is not None and target_mb <= 0:
+        raise ValueError("Target size must be positive")
+    return {
+        'crop': float(values.get('crop', 5)) / 100.0,
+        'zoom': float(values.get('zoom', 10)) / 10.0,
+        'start_time': start_time,
+        'end_time': end_time,
+        'target_bytes': int(target_mb * 1024 * 1024) if target_mb else None,
+        'thumbnails': str(values.get('thumbnails', '')).lower() in ('1', 'true', 'on')
+    }
+
+def conversion_params(options):
+    """Parameters that determine the output bytes, used to derive the output id."""
+    return {
+        'crop': round(options['crop'], 4), 'zoom': round(options['zoom'], 4),
+        'start': options['start_time'], 'end': options['end_time'], 'encoder': ENCODER_VERSION,
+        'profile': API_PROFILE.name,
+        'target_bytes': options['target_bytes'], 'thumbnails': options['thumbnails']
+    }
+
+def convert_stored_input(input_hash, work_dir, options):
+    """Convert an input from the content store, reusing a retained output when possible."""
+    output_id = output_key(input_hash, conversion_params(options))
+    meta = output_store.get(output_id)
+    if meta is not None:
+        return meta, "Reused retained output"
     
-    try:
-        result = subprocess.run(cmd, timeout=40, capture_output=True, text=True)
-        if result.returncode == 0:
-            return True, "Success"
-        else:
-            return False, f"FFmpeg error: {result.stderr[:200]}"
-    except subprocess.TimeoutExpired:
-        return False, "Conversion timeout (40s limit)"
-    except Exception as e:
-        return False, f"System error: {str(e)}"
+    output_path = os.path.join(work_dir, 'output.mp4')
+    assets_dir = os.path.join(work_dir, 'assets') if options['thumbnails'] else None
+    with content_store.hold(input_hash) as input_path:
+        success, message, extra = convert_video_file(
+            input_path, output_path, options['crop'], options['zoom'], options['start_time'], options['end_time'],
+            options['target_bytes'], assets_dir
+        )
+    
+    if success and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        asset_paths = [os.path.join(assets_dir, name) for name in sorted(os.listdir(assets_dir))] if assets_dir else []
+        return output_store.put(output_id, output_path, extra=extra, asset_paths=asset_paths), message
+    return None, message
+
+def serve_output(meta):
+    """Send a retained output with a stable ETag, conditional GET and Range support."""
+    response = send_file(
+        meta['path'], mimetype='video/mp4', as_attachment=True,
+        download_name=meta['download_name'], conditional=True, etag=meta['etag'],
+        last_modified=meta['created'], max_age=output_store.retention_seconds
+    )
+    response.headers['X-Output-Id'] = meta['output_id']
+    response.headers['Content-Location'] = f"/outputs/{meta['output_id']}"
+    if meta.get('fast_path'):
+        # The input was already vertical and was remuxed instead of re-encoded
+        response.headers['X-Fast-Path'] = meta['fast_path']
+    if meta.get('peak_rss_bytes'):
+        response.headers['X-Peak-Memory-MB'] = f"{meta['peak_rss_bytes'] / 1048576:.0f}"
+        response.headers['X-CPU-Seconds'] = f"{meta['cpu_seconds']:.1f}"
+    if POSTER_FILENAME in meta.get('assets', ()):
+        response.headers['X-Poster-Url'] = f"/outputs/{meta['output_id']}/{POSTER_FILENAME}"
+    if SPRITE_VTT_FILENAME in meta.get('assets', ()):
+        response.headers['X-Sprite-Vtt-Url'] = f"/outputs/{meta['output_id']}/{SPRITE_VTT_FILENAME}"
+    if meta.get('target_bytes'):
+        # Requested budget, the sample-based prediction and what the encode produced
+        response.headers['X-Target-Bytes'] = str(meta['target_bytes'])
+        response.headers['X-Predicted-Bytes'] = str(meta['predicted_bytes'])
+        response.headers['X-Size-Error-Percent'] = f"{100.0 * (meta['size'] - meta['predicted_bytes']) / meta['predicted_bytes']:.1f}"
+        response.headers['X-CRF'] = str(meta['crf'])
+    return response
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    max_upload_bytes = STREAM_UPLOAD_MAX_BYTES if STREAM_UPLOADS else app.config['MAX_CONTENT_LENGTH']
+    return render_template_string(HTML_TEMPLATE, stream_uploads=STREAM_UPLOADS, max_upload_bytes=max_upload_bytes)
 
 @app.route('/debug')
 def debug():
     """Debug endpoint to check FFmpeg status."""
-    ffmpeg_exists = os.path.exists('/tmp/ffmpeg')
+    ffmpeg_exists = os.path.exists(FFMPEG_PATH)
     ffmpeg_downloaded = download_ffmpeg()
     
     debug_info = {
         'ffmpeg_exists': ffmpeg_exists,
         'ffmpeg_downloaded': ffmpeg_downloaded,
-        'tmp_contents': os.listdir('/tmp') if os.path.exists('/tmp') else 'No /tmp directory'
+        'tmp_contents': os.listdir('/tmp') if os.path.exists('/tmp') else 'No /tmp directory',
+        'scratch_usage_bytes': scratch.usage(),
+        'scratch_quota_bytes': scratch.quota_bytes,
+        'content_store_usage_bytes': content_store.usage(),
+        'content_store_quota_bytes': content_store.quota_bytes,
+        'output_store_usage_bytes': output_store.usage(),
+        'output_retention_seconds': output_store.retention_seconds,
+        'job_queue_path': job_queue.path,
+        'memory_limit_bytes': memory_limit_bytes(),
+        'memory_budget_bytes': pipeline.memory_budget_bytes,
+        'memory_model_correction': round(pipeline.memory_model.correction, 3),
+        'cpu': cpu_info()
     }
     
     return debug_info
 
+@app.route('/inputs/<digest>', methods=['GET'])
+def input_status(digest):
+    """Report whether an input with this SHA-256 is already stored on the server."""
+    digest = digest.lower()
+    if not content_store.has(digest):
+        return {'exists': False}, 404
+    return {'exists': True, 'sha256': digest, 'size': content_store.size(digest)}, 200
+
+@app.route('/inputs/<digest>', methods=['PUT'])
+def put_input(digest):
+    """Store an input (raw request body) under its SHA-256 without converting it, e.g. for previews."""
+    digest = digest.lower()
+    if content_store.has(digest):
+        return {'exists': True, 'sha256': digest, 'size': content_store.size(digest)}, 200
+    try:
+        stream = get_input_stream(request.environ, safe_fallback=False, max_content_length=STREAM_UPLOAD_MAX_BYTES)
+        content_store.put_stream(stream, expected_digest=digest, expected_bytes=request.content_length or 0,
+                                 max_bytes=STREAM_UPLOAD_MAX_BYTES)
+    except (RequestEntityTooLarge, UploadTooLarge):
+        return f'File too large (limit {STREAM_UPLOAD_MAX_BYTES // (1024 * 1024)} MB)', 413
+    except DigestMismatch as e:
+        return f'Upload corrupted: {str(e)}', 400
+    except StoreQuotaExceeded as e:
+        return f'Server busy: {str(e)}', 503
+    except ValueError as e:
+        return f'Upload failed: {str(e)}', 400
+    return {'exists': True, 'sha256': digest, 'size': content_store.size(digest)}, 201
+
+@app.route('/preview', methods=['GET'])
+def preview():
+    """Proxy-resolution JPEG of a stored input framed with the given crop and zoom."""
+    digest = request.args.get('sha256', '').lower()
+    try:
+        options = conversion_options(request.args)
+        at = float(request.args['t']) if request.args.get('t') else preview_start(
+            options['end_time'], options['start_time'], seconds=0
+        )
+    except ValueError as e:
+        return f'Invalid settings: {str(e)}', 400
+    if not content_store.has(digest):
+        return 'Unknown input hash, please upload the file', 404
+    if not download_ffmpeg():
+        return 'FFmpeg download failed', 500
+    
+    try:
+        with content_store.hold(digest) as input_path:
+            jpeg, etag, cache_hit = frame_previewer.render(
+                digest, input_path, options['crop'], options['zoom'], ENCODER_SETTINGS, at
+            )
+    except FrameDecodeError as e:
+        return f'Could not decode a frame: {str(e)}', 422
+    except KeyError:
+        return 'Unknown input hash, please upload the file', 404
+    
+    response = app.response_class(jpeg, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.cache_control.max_age = 3600
+    response.headers['X-Preview-Cache'] = 'hit' if cache_hit else 'miss'
+    return response.make_conditional(request)
+
+@app.route('/outputs/<output_id>', methods=['GET'])
+def get_output(output_id):
+    """Resumable, seekable download of a previously converted output."""
+    meta = output_store.get(output_id)
+    if meta is None:
+        return 'Output not found or expired', 404
+    return serve_output(meta)
+
+def job_status(job_id, job):
+    """JSON body describing a queued job."""
+    status = {'job_id': job_id, 'status': job.status, 'attempts': job.attempts}
+    if job.status == DONE:
+        status['output_url'] = f"/outputs/{job.result['output_id']}"
+    elif job.status == FAILED:
+        status['error'] = job.error
+    return status
+
+@app.route('/jobs', methods=['POST'])
+def enqueue_job():
+    """Queue a conversion of a stored input (by sha256) for the worker pool."""
+    values = request.get_json(silent=True) or request.form
+    input_hash = (values.get('sha256') or '').lower()
+    try:
+        options = conversion_options(values)
+    except ValueError as e:
+        return f'Invalid settings: {str(e)}', 400
+    
+    output_id = output_key(input_hash, conversion_params(options))
+    if output_store.get(output_id) is not None:
+        return {'job_id': None, 'status': DONE, 'output_url': f"/outputs/{output_id}"}, 200
+    if not content_store.has(input_hash):
+        return 'Unknown input hash, please upload the file', 404
+    
+    payload = conversion_payload(input_hash, output_id, options, ENCODER_SETTINGS, timeout=CONVERSION_TIMEOUT_SECONDS)
+    job_id = job_queue.enqueue(payload)
+    return {'job_id': job_id, 'status': 'queued', 'status_url': f"/jobs/{job_id}"}, 202, {'Location': f"/jobs/{job_id}"}
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a queued conversion; finished jobs link to their retained output."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return 'Job not found', 404
+    return job_status(job_id, job), 200
+
+@app.route('/outputs/<output_id>/<name>', methods=['GET'])
+def get_output_asset(output_id, name):
+    """Poster, sprite sheet or sprite WebVTT generated alongside an output."""
+    path = output_store.asset_path(output_id, name)
+    if path is None:
+        return 'Asset not found or expired', 404
+    mimetype = 'text/vtt' if name.endswith('.vtt') else 'image/jpeg'
+    return send_file(path, mimetype=mimetype, conditional=True, max_age=output_store.retention_seconds)
+
 @app.route('/convert', methods=['POST'])
 def convert():
-    if 'video' not in request.files:
-        return 'No file uploaded', 400
+    file = request.files.get('video')
+    declared_hash = request.form.get('sha256', '').lower() or None
     
-    file = request.files['video']
-    if file.filename == '':
+    if file is None and declared_hash is None:
+        return 'No file uploaded', 400
+    if file is not None and file.filename == '':
         return 'No file selected', 400
     
     # Skip size validation for regular convert (chunked handles large files separately)
     
-    crop = float(request.form.get('crop', 5)) / 100.0
-    zoom = float(request.form.get('zoom', 10)) / 10.0
+    try:
+        options = conversion_options(request.form)
+    except ValueError as e:
+        return f'Invalid settings: {str(e)}', 400
     
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            # Save input file
-            input_path = os.path.join(temp_dir, 'input.mp4')
-            file.save(input_path)
-            
-            # Check if file was saved properly
-            if not os.path.exists(input_path) or os.path.getsize(input_path) == 0:
-                return 'File upload failed', 400
+    try:
+        # Serve a retained output for a hash-only request without touching the input
+        if file is None:
+            meta = output_store.get(output_key(declared_hash, conversion_params(options)))
+            if meta is not None:
+                return serve_output(meta)
+        
+        # Reserve room for the upload plus an output of similar size
+        expected_bytes = request.content_length or content_store.size(declared_hash) or 0
+        with scratch.job(expected_bytes=2 * expected_bytes) as (job_id, temp_dir):
+            if file is not None:
+                # Save input file
+                upload_path = os.path.join(temp_dir, 'input.mp4')
+                file.save(upload_path)
+                
+                # Check if file was saved properly
+                if not os.path.exists(upload_path) or os.path.getsize(upload_path) == 0:
+                    return 'File upload failed', 400
+                
+                input_hash = content_store.put_file(upload_path, expected_digest=declared_hash, move=True)
+            elif content_store.has(declared_hash):
+                input_hash = declared_hash
+            else:
+                return 'Unknown input hash, please upload the file', 404
             
             # Convert video
-            output_path = os.path.join(temp_dir, 'output.mp4')
-            success, message = convert_video_file(input_path, output_path, crop, zoom)
+            meta, message = convert_stored_input(input_hash, temp_dir, options)
             
-            if success and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                return send_file(output_path, as_attachment=True, download_name='vertical_video.mp4')
+            if meta is not None:
+                return serve_output(meta)
             else:
                 return f'Conversion failed: {message}', 500
                 
-        except Exception as e:
-            return f'Server error: {str(e)}', 500
+    except DigestMismatch as e:
+        return f'Upload corrupted: {str(e)}', 400
+    except (ScratchQuotaExceeded, StoreQuotaExceeded) as e:
+        return f'Server busy: {str(e)}', 503
+    except Exception as e:
+        return f'Server error: {str(e)}', 500
+
+@app.route('/stitch', methods=['POST'])
+def stitch():
+    """Frame and join stored inputs, in order, into one vertical video with a single encode.
+    
+    JSON body: {"clips": [{"sha256": ..., "crop": 5, "zoom": 10, "start": 0, "end": 8}, ...]}
+    with crop, zoom and trim per clip as for /convert. Upload each clip first
+    with PUT /inputs/<sha256>.
+    """
+    data = request.get_json(silent=True) or {}
+    clips = data.get('clips')
+    if not isinstance(clips, list) or not clips:
+        return 'No clips given', 400
+    if len(clips) > STITCH_MAX_CLIPS:
+        return f'Too many clips (limit {STITCH_MAX_CLIPS})', 400
+    try:
+        hashes = [str(clip.get('sha256') or '').lower() for clip in clips]
+        options = [conversion_options(clip) for clip in clips]
+    except (AttributeError, ValueError) as e:
+        return f'Invalid settings: {str(e)}', 400
+    
+    output_id = output_key(hashes, {'stitch': [conversion_params(clip_options) for clip_options in options]})
+    meta = output_store.get(output_id)
+    if meta is not None:
+        return serve_output(meta)
+    missing = [digest for digest in hashes if not content_store.has(digest)]
+    if missing:
+        return f'Unknown input hash {missing[0]}, please upload the file', 404
+    if not download_ffmpeg():
+        return 'FFmpeg download failed', 500
+    
+    try:
+        expected_bytes = sum(content_store.size(digest) or 0 for digest in set(hashes))
+        with scratch.job(expected_bytes=expected_bytes) as (job_id, work_dir), ExitStack() as held:
+            output_path = os.path.join(work_dir, 'output.mp4')
+            job = StitchJob([
+                StitchClip(held.enter_context(content_store.hold(digest)), clip_options['crop'], clip_options['zoom'],
+                           clip_options['start_time'], clip_options['end_time'])
+                for digest, clip_options in zip(hashes, options)
+            ], output_path, ENCODER_SETTINGS)
+            try:
+                result = pipeline.stitch(job, timeout=CONVERSION_TIMEOUT_SECONDS)
+            except ValueError as e:
+                return f'Invalid clips: {str(e)}', 400
+            if not result.success or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+                return f'Stitching failed: {failure_message(result)}', 500
+            meta = output_store.put(output_id, output_path, 'stitched_video.mp4', extra={
+                'peak_rss_bytes': result.peak_rss_bytes, 'cpu_seconds': result.cpu_seconds
+            })
+        return serve_output(meta)
+    except KeyError:
+        return 'Input evicted, please upload the file again', 404
+    except ScratchQuotaExceeded as e:
+        return f'Server busy: {str(e)}', 503
+    except Exception as e:
+        return f'Server error: {str(e)}', 500
+
+@app.route('/convert-stream', methods=['POST', 'PUT'])
+def convert_stream():
+    """Convert a video sent as the raw request body, with options in the query string.
+    
+    The body is read in fixed-size blocks straight into the content store while
+    it is hashed, so memory use stays constant whatever the file size.
+    """
+    try:
+        options = conversion_options(request.args)
+    except ValueError as e:
+        return f'Invalid settings: {str(e)}', 400
+    declared_hash = request.args.get('sha256', '').lower() or None
+    
+    try:
+        # Bypass MAX_CONTENT_LENGTH (meant for buffered form parsing) in favor of the streaming limit
+        stream = get_input_stream(request.environ, safe_fallback=False, max_content_length=STREAM_UPLOAD_MAX_BYTES)
+        input_hash = content_store.put_stream(
+            stream, expected_digest=declared_hash, expected_bytes=request.content_length or 0,
+            max_bytes=STREAM_UPLOAD_MAX_BYTES
+        )
+        
+        # Reserve room for an output of similar size to the input
+        with scratch.job(expected_bytes=content_store.size(input_hash) or 0) as (job_id, temp_dir):
+            meta, message = convert_stored_input(input_hash, temp_dir, options)
+            
+            if meta is not None:
+                return serve_output(meta)
+            else:
+                return f'Conversion failed: {message}', 500
+    
+    except (RequestEntityTooLarge, UploadTooLarge):
+        return f'File too large (limit {STREAM_UPLOAD_MAX_BYTES // (1024 * 1024)} MB)', 413
+    except DigestMismatch as e:
+        return f'Upload corrupted: {str(e)}', 400
+    except (ScratchQuotaExceeded, StoreQuotaExceeded) as e:
+        return f'Server busy: {str(e)}', 503
+    except ValueError as e:
+        return f'Upload failed: {str(e)}', 400
+    except Exception as e:
+        return f'Server error: {str(e)}', 500
+
+@app.route('/convert-resumable', methods=['POST'])
+def convert_resumable():
+    """Convert in time-boxed segments; repeat with the returned token until the video comes back.
+    
+    Start with a stored input's sha256 (or a 'video' upload) and the usual
+    options. While segments remain the answer is 202 with a token; POST
+    {"token": ...} again to continue. The final call joins the segments
+    without re-encoding and returns the video.
+    """
+    deadline = time.monotonic() + RESUMABLE_BUDGET_SECONDS
+    values = request.get_json(silent=True) or request.form
+    token = values.get('token')
+    
+    try:
+        if not download_ffmpeg():
+            return 'FFmpeg download failed', 500
+        if token:
+            manifest = segmented.load(token)
+            if manifest is None:
+                return 'Unknown or expired token', 404
+            job_meta = manifest['meta']
+        else:
+            options = conversion_options(values)
+            file = request.files.get('video')
+            if file is not None:
+                with scratch.job(expected_bytes=request.content_length or 0) as (_job_id, temp_dir):
+                    upload_path = os.path.join(temp_dir, 'input.mp4')
+                    file.save(upload_path)
+                    input_hash = content_store.put_file(upload_path, move=True)
+            else:
+                input_hash = (values.get('sha256') or '').lower()
+                if not content_store.has(input_hash):
+                    return 'Unknown input hash, please upload the file', 404
+            
+            # Segment joins make the bytes differ from a single-pass output
+            output_id = output_key(input_hash, dict(conversion_params(options), segmented=True))
+            meta = output_store.get(output_id)
+            if meta is not None:
+                return serve_output(meta)
+            
+            with content_store.hold(input_hash) as input_path:
+                duration = pipeline.duration(input_path)
+                if duration is None:
+                    return 'Could not read the video duration', 400
+                job = ConversionJob(
+                    input_path, None, options['crop'], options['zoom'], RESUMABLE_SETTINGS,
+                    start_time=options['start_time'], end_time=options['end_time']
+                )
+                token = segmented.create(job, duration, meta={'input_hash': input_hash, 'output_id': output_id})
+            job_meta = segmented.load(token)['meta']
+        
+        with content_store.hold(job_meta['input_hash']) as input_path, \
+                scratch.job(expected_bytes=content_store.size(job_meta['input_hash']) or 0) as (_job_id, work_dir):
+            output_path = os.path.join(work_dir, 'output.mp4')
+            progress = segmented.advance(token, input_path, output_path, deadline)
+            if progress.finished:
+                meta = output_store.put(job_meta['output_id'], output_path)
+                segmented.discard(token)
+                return serve_output(meta)
+        
+        if progress.result is not None:
+            segmented.discard(token)
+            return f'Conversion failed: {failure_message(progress.result)}', 500
+        return {
+            'status': 'in_progress', 'token': token,
+            'done_segments': progress.done_segments, 'total_segments': progress.total_segments
+        }, 202
+    
+    except KeyError:
+        # The input was evicted from the content store between invocations
+        if token:
+            segmented.discard(token)
+        return 'Input expired, please upload the file again', 410
+    except ValueError as e:
+        return f'Invalid settings: {str(e)}', 400
+    except (ScratchQuotaExceeded, StoreQuotaExceeded) as e:
+        return f'Server busy: {str(e)}', 503
+    except Exception as e:
+        return f'Server error: {str(e)}', 500
+
+@app.route('/upload-init', methods=['POST'])
+def upload_init():
+    """Allocate a unique workspace for a chunked upload."""
+    try:
+        data = request.get_json() or {}
+        file_size = int(data.get('fileSize', 0))
+        # Reserve room for the chunks, the reassembled input and the output
+        upload_id = scratch.allocate(expected_bytes=3 * file_size)
+        return {'uploadId': upload_id}, 200
+    except ScratchQuotaExceeded as e:
+        return f'Server busy: {str(e)}', 503
+    except Exception as e:
+        return f'Upload init error: {str(e)}', 500
 
 @app.route('/upload-chunk', methods=['POST'])
 def upload_chunk():
@@ -381,16 +1075,18 @@ def upload_chunk():
         total_chunks = int(request.form['totalChunks'])
         filename = request.form['filename']
         
-        # Create upload directory
-        upload_dir = f'/tmp/upload_{upload_id}'
-        os.makedirs(upload_dir, exist_ok=True)
+        if not 0 <= chunk_index < total_chunks:
+            return 'Invalid chunk index', 400
         
-        # Save chunk
-        chunk_path = os.path.join(upload_dir, f'chunk_{chunk_index:04d}')
-        chunk.save(chunk_path)
+        # Save chunk into the workspace allocated by /upload-init
+        with scratch.hold(upload_id) as upload_dir:
+            chunk_path = os.path.join(upload_dir, f'chunk_{chunk_index:04d}')
+            chunk.save(chunk_path)
         
         return {'status': 'success', 'chunk': chunk_index}, 200
         
+    except UnknownWorkspace:
+        return 'Unknown or expired upload', 404
     except Exception as e:
         return f'Chunk upload error: {str(e)}', 500
 
@@ -400,35 +1096,45 @@ def convert_chunked():
     try:
         data = request.get_json()
         upload_id = data['uploadId']
-        crop = float(data['crop']) / 100.0
-        zoom = float(data['zoom']) / 10.0
-        
-        upload_dir = f'/tmp/upload_{upload_id}'
+        try:
+            options = conversion_options(data)
+        except ValueError as e:
+            return f'Invalid settings: {str(e)}', 400
+        declared_hash = (data.get('sha256') or '').lower() or None
         
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Reassemble file from chunks
-            input_path = os.path.join(temp_dir, 'input.mp4')
-            
-            with open(input_path, 'wb') as outfile:
-                chunk_files = sorted([f for f in os.listdir(upload_dir) if f.startswith('chunk_')])
-                for chunk_file in chunk_files:
-                    chunk_path = os.path.join(upload_dir, chunk_file)
-                    with open(chunk_path, 'rb') as chunk:
-                        outfile.write(chunk.read())
-            
-            # Clean up chunks
-            for chunk_file in os.listdir(upload_dir):
-                os.remove(os.path.join(upload_dir, chunk_file))
-            os.rmdir(upload_dir)
-            
-            # Convert video
-            output_path = os.path.join(temp_dir, 'output.mp4')
-            success, message = convert_video_file(input_path, output_path, crop, zoom)
-            
-            if success and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                return send_file(output_path, as_attachment=True, download_name='vertical_video.mp4')
-            else:
-                return f'Chunked conversion failed: {message}', 500
+        try:
+            with scratch.hold(upload_id) as upload_dir:
+                # Reassemble file from chunks, hashing as we go
+                assembled_path = os.path.join(upload_dir, 'input.mp4')
+                digest = hashlib.sha256()
+                
+                with open(assembled_path, 'wb') as outfile:
+                    chunk_files = sorted([f for f in os.listdir(upload_dir) if f.startswith('chunk_')])
+                    for chunk_file in chunk_files:
+                        chunk_path = os.path.join(upload_dir, chunk_file)
+                        with open(chunk_path, 'rb') as chunk:
+                            data_block = chunk.read()
+                        digest.update(data_block)
+                        outfile.write(data_block)
+                        # Free each chunk as soon as it is copied
+                        os.remove(chunk_path)
+                
+                input_hash = digest.hexdigest()
+                if declared_hash and declared_hash != input_hash:
+                    return f'Upload corrupted: hash {input_hash} does not match {declared_hash}', 400
+                content_store.adopt(assembled_path, input_hash, move=True)
+                
+                # Convert video
+                meta, message = convert_stored_input(input_hash, upload_dir, options)
+                
+                if meta is not None:
+                    return serve_output(meta)
+                else:
+                    return f'Chunked conversion failed: {message}', 500
+        finally:
+            scratch.release(upload_id)
                 
+    except UnknownWorkspace:
+        return 'Unknown or expired upload', 404
     except Exception as e:
         return f'Chunked conversion error: {str(e)}', 500
\ No newline at end of file
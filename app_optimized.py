@@ -1,173 +1,45 @@
 import streamlit as st
-import subprocess
 import os
 import tempfile
-import json
-from PIL import Image, ImageFilter
-import io
-import multiprocessing
+
+from vertical_studio.pipeline import ConversionJob, Pipeline, validate_trim
+from vertical_studio.preview import PreviewCache, preview_start, upload_key
+from vertical_studio.profiles import PROFILES, describe, load_benchmarks
+from vertical_studio.resources import cpu_count
 
 # --- Configuration ---
 MAX_FILE_SIZE_MB = 200
 MAX_VIDEO_DURATION_SECONDS = 300  # 5 minutes
 
-# --- Helper Functions ---
-
-def is_ffmpeg_installed():
-    """Check if FFmpeg is installed and accessible in the system's PATH."""
-    try:
-        subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
-
-def get_video_info(input_path):
-    """Uses ffprobe to get video stream information."""
-    command = [
-        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-        '-show_entries', 'stream=width,height,duration', '-of', 'json', input_path
-    ]
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)['streams'][0]
-        if all(k in info for k in ['width', 'height', 'duration']):
-            info['duration'] = float(info['duration'])
-            return info
-        return None
-    except (subprocess.CalledProcessError, json.JSONDecodeError, IndexError, KeyError):
-        return None
-
-def extract_frame(input_path, temp_dir):
-    """Extracts a single frame from the middle of the video."""
-    frame_output_path = os.path.join(temp_dir, "preview_frame.jpg")
-    command = [
-        'ffmpeg', '-i', input_path, '-ss', '00:00:01.000', # Grab frame from 1s mark
-        '-vframes', '1', '-q:v', '2', frame_output_path, '-y'
-    ]
-    try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return Image.open(frame_output_path)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return None
-
-def generate_preview(image, crop_percent, zoom_level):
-    """Applies crop and zoom to a preview image using Pillow."""
-    if image is None:
-        return None
-
-    original_width, original_height = image.size
+# Profiles offered by the speed selector, fastest first; 'interactive' is the default.
+SPEED_PROFILES = ('interactive-draft', 'interactive', 'interactive-balanced')
+DEFAULT_SPEED_PROFILE = 'interactive'
 
-    # 1. Crop the input image to remove black bars.
-    crop_pixels = int(original_height * crop_percent)
-    top = crop_pixels
-    bottom = original_height - crop_pixels
-    cropped_image = image.crop((0, top, original_width, bottom))
-    
-    if cropped_image.height == 0: # Avoid division by zero if crop is 100%
-        return None
-
-    # --- Create the blurred background ---
-    canvas_width = 1080
-    canvas_height = 1920
-    
-    # Stretch the cropped image to fill the entire vertical canvas and blur it.
-    bg_image = cropped_image.resize((canvas_width, canvas_height), Image.Resampling.LANCZOS)
-    bg_image = bg_image.filter(ImageFilter.GaussianBlur(20))
-
-    # --- Create the foreground ---
-    # Determine the aspect ratio of the content *after* cropping.
-    cropped_aspect_ratio = cropped_image.width / cropped_image.height
-    
-    # Scale the foreground to fit the output width (1080px) while maintaining its aspect ratio.
-    # This is the base size at 1x zoom.
-    base_fg_width = canvas_width
-    base_fg_height = int(base_fg_width / cropped_aspect_ratio)
-
-    # Apply the zoom factor to the base size.
-    zoomed_fg_width = int(base_fg_width * zoom_level)
-    zoomed_fg_height = int(base_fg_height * zoom_level)
-    
-    # Resize the original cropped image to the new zoomed dimensions.
-    resized_main = cropped_image.resize((zoomed_fg_width, zoomed_fg_height), Image.Resampling.LANCZOS)
+pipeline = Pipeline()
+preview_cache = PreviewCache(pipeline)
 
-    # --- Combine foreground and background ---
-    # Calculate coordinates to paste the foreground in the center of the canvas.
-    paste_x = (canvas_width - zoomed_fg_width) // 2
-    paste_y = (canvas_height - zoomed_fg_height) // 2
-    
-    # Paste the sharp, zoomed foreground onto the blurred background.
-    bg_image.paste(resized_main, (paste_x, paste_y), resized_main if resized_main.mode == 'RGBA' else None)
-    
-    return bg_image
+# --- Helper Functions ---
 
-def convert_to_vertical_optimized(input_path, output_path, crop_percent, zoom_level, progress_bar):
-    """OPTIMIZED: Converts a horizontal video to a 9:16 vertical format with speed improvements."""
-    output_width = 1080
-    output_height = 1920
-    scaled_main_width = int(output_width * zoom_level)
-    
-    # Get number of CPU cores for optimal threading
-    cpu_cores = multiprocessing.cpu_count()
-    threads = min(cpu_cores, 8)  # Cap at 8 threads for optimal performance
-    
-    # OPTIMIZED COMMAND with multiple performance improvements
-    cmd = [
-        'ffmpeg', 
-        '-i', input_path,
-        
-        # THREADING OPTIMIZATIONS
-        '-threads', str(threads),               # Use multiple CPU cores
-        '-thread_type', 'slice',               # Enable slice-based threading
-        
-        # PERFORMANCE FLAGS
-        '-preset', 'faster',                   # Changed from 'medium' to 'faster' (2-3x speed boost)
-        '-tune', 'fastdecode',                 # Optimize for fast decoding
-        
-        # FILTER OPTIMIZATIONS
-        '-filter_complex',
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={scaled_main_width}:-1:flags=bilinear[main];'  # Use bilinear scaling (faster)
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={output_width}:{output_height}:force_original_aspect_ratio=increase:flags=bilinear,boxblur=20:10,crop={output_width}:{output_height}[bg];'  # Reduced blur quality for speed
-        '[bg][main]overlay=(W-w)/2:(H-h)/2',
-        
-        # ENCODING OPTIMIZATIONS
-        '-c:v', 'libx264',                     # Keep H.264 for compatibility
-        '-crf', '25',                          # Slightly higher CRF (was 23) for faster encoding
-        '-pix_fmt', 'yuv420p',
-        
-        # ADDITIONAL SPEED OPTIMIZATIONS
-        '-movflags', '+faststart',             # Fast start for better streaming
-        '-x264-params', f'threads={threads}:sliced-threads=1:sync-lookahead=0:rc-lookahead=10',  # x264 specific optimizations
-        
-        # AUDIO OPTIMIZATIONS (faster audio encoding)
-        '-c:a', 'aac', '-b:a', '128k',         # Reduced audio bitrate for speed
-        '-ac', '2',                            # Force stereo
-        
-        '-y', output_path
-    ]
+def convert_to_vertical_optimized(input_path, output_path, crop_percent, zoom_level, progress_bar,
+                                  start_time=None, end_time=None, assets_dir=None, profile=DEFAULT_SPEED_PROFILE):
+    """OPTIMIZED: Converts a horizontal video to a 9:16 vertical format with speed improvements.
+
+    profile names the encoding profile (see vertical_studio.profiles).
+    Returns (success, log, assets); with assets_dir, assets holds the poster and
+    seek sprite paths rendered in the same ffmpeg run.
+    """
+    job = ConversionJob(
+        input_path, output_path, crop_percent, zoom_level, PROFILES[profile].settings,
+        start_time=start_time, end_time=end_time, assets_dir=assets_dir
+    )
     
     progress_bar.progress(10, text="Starting optimized FFmpeg conversion...")
-    try:
-        # Use Popen for better control and potential progress tracking
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Wait for completion
-        stdout, stderr = process.communicate()
-        
-        if process.returncode == 0:
-            progress_bar.progress(100, text="Optimized conversion successful!")
-            return True, stderr
-        return False, stderr
-    except FileNotFoundError:
-        return False, "FFmpeg command not found."
-    except Exception as e:
-        return False, f"An unexpected error occurred: {str(e)}"
+    result = pipeline.run(job)
+    if result.success and result.fast_path:
+        progress_bar.progress(100, text="⚡ Already vertical: remuxed without re-encoding!")
+    elif result.success:
+        progress_bar.progress(100, text="Optimized conversion successful!")
+    return result.success, result.log, result.assets
 
 # --- Streamlit UI ---
 
@@ -190,7 +62,7 @@ with st.expander("⚡ Performance Optimizations Applied"):
     **Quality maintained** while significantly improving speed!
     """)
 
-if not is_ffmpeg_installed():
+if not pipeline.is_available():
     st.error("🔴 FFmpeg is not installed or not found in your system's PATH.")
 else:
     uploaded_file = st.file_uploader(
@@ -209,11 +81,9 @@ else:
                 with open(input_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
 
-                video_info = get_video_info(input_path)
+                video_info = pipeline.probe(input_path)
                 if video_info is None:
                     st.error("Could not read video metadata.")
-                elif video_info['duration'] > MAX_VIDEO_DURATION_SECONDS:
-                    st.error(f"Video is too long ({video_info['duration']:.0f}s).")
                 else:
                     # Show video info
                     col_info1, col_info2, col_info3 = st.columns(3)
@@ -222,7 +92,7 @@ else:
                     with col_info2:
                         st.metric("⏱️ Duration", f"{video_info['duration']:.1f}s")
                     with col_info3:
-                        cpu_cores = multiprocessing.cpu_count()
+                        cpu_cores = cpu_count()
                         st.metric("🖥️ CPU Cores", f"{cpu_cores} threads")
                     
                     # --- Main Layout with Preview ---
@@ -240,21 +110,46 @@ else:
                         )
                         crop_percent_decimal = crop_amount / 100.0
 
-                        # Speed mode selector
+                        # Only the selected range is decoded and encoded, so long uploads stay fast
+                        duration = video_info['duration']
+                        trim_start, trim_end = st.slider(
+                            "⏱️ Trim (seconds)", 0.0, duration,
+                            (0.0, min(duration, float(MAX_VIDEO_DURATION_SECONDS))), 0.1, "%.1fs",
+                            help=f"Select the part to convert (up to {MAX_VIDEO_DURATION_SECONDS // 60} minutes)."
+                        )
+                        try:
+                            start_time, end_time = validate_trim(
+                                trim_start, trim_end, duration, MAX_VIDEO_DURATION_SECONDS
+                            )
+                            trim_valid = True
+                        except ValueError as e:
+                            st.error(f"✂️ {str(e)}")
+                            trim_valid = False
+
+                        # Speed mode selector; measured speed and size come from benchmark_profiles.py
+                        benchmarks = load_benchmarks()
                         speed_mode = st.selectbox(
-                            "🚀 Conversion Speed",
-                            ["🚀 Ultra Fast (Optimized)", "⚡ Fast (Faster preset)", "🎯 Balanced (Medium preset)"],
+                            "🚀 Conversion Speed", SPEED_PROFILES,
+                            index=SPEED_PROFILES.index(DEFAULT_SPEED_PROFILE),
+                            format_func=lambda name: describe(name, benchmarks),
                             help="Choose conversion speed vs quality balance"
                         )
 
-                        if st.button("✨ Convert to Vertical (Optimized)", type="primary"):
+                        make_assets = st.checkbox(
+                            "🖼️ Also create poster & seek sprite",
+                            help="Rendered from the same decode as the video, so it costs almost nothing extra."
+                        )
+
+                        if st.button("✨ Convert to Vertical (Optimized)", type="primary", disabled=not trim_valid):
                             output_filename = f"vertical_optimized_{os.path.splitext(uploaded_file.name)[0]}.mp4"
                             output_path = os.path.join(temp_dir, output_filename)
                             progress_bar = st.progress(0, text="Preparing optimized conversion...")
                             
                             # Use optimized conversion function
-                            success, ffmpeg_output = convert_to_vertical_optimized(
-                                input_path, output_path, crop_percent_decimal, zoom_level, progress_bar
+                            success, ffmpeg_output, assets = convert_to_vertical_optimized(
+                                input_path, output_path, crop_percent_decimal, zoom_level, progress_bar,
+                                start_time, end_time, os.path.join(temp_dir, 'assets') if make_assets else None,
+                                profile=speed_mode
                             )
 
                             if success:
@@ -274,6 +169,17 @@ else:
                                     st.metric("📁 Original Size", f"{original_size:.1f} MB")
                                 with col_size2:
                                     st.metric("📁 Optimized Size", f"{optimized_size:.1f} MB")
+
+                                if assets:
+                                    with st.expander("🖼️ Poster & Seek Sprite"):
+                                        if assets['poster']:
+                                            st.image(assets['poster'], caption="Poster", width=180)
+                                        for sprite in assets['sprites']:
+                                            if os.path.exists(sprite):
+                                                st.image(sprite, caption=os.path.basename(sprite))
+                                        with open(assets['sprite_vtt']) as vtt_file:
+                                            st.download_button("⬇️ Download Sprite WebVTT", vtt_file.read(),
+                                                               "sprite.vtt", "text/vtt")
                                 
                             else:
                                 st.error("❌ Conversion Failed.")
@@ -282,13 +188,15 @@ else:
 
                     with col2:
                         st.subheader("🔍 Live Preview")
-                        # Generate and display the preview
-                        preview_image = extract_frame(input_path, temp_dir)
-                        if preview_image:
-                            final_preview = generate_preview(preview_image, crop_percent_decimal, zoom_level)
-                            st.image(final_preview, width="stretch")
+                        # Render a short low-res excerpt through the real conversion graph
+                        preview = preview_cache.render(
+                            input_path, crop_percent_decimal, zoom_level, PROFILES[speed_mode].settings,
+                            start=preview_start(trim_end, trim_start), input_key=upload_key(uploaded_file)
+                        )
+                        if preview.success:
+                            st.video(preview.output_path, loop=True, autoplay=True, muted=True)
                         else:
-                            st.warning("Could not extract a frame for preview.")
+                            st.warning("Could not render a preview clip.")
 
 st.markdown("---")
 st.markdown("Made with ❤️ using [Streamlit](https://streamlit.io) and [FFmpeg](https://ffmpeg.org) | **⚡ Speed Optimized Version**")
\ No newline at end of file
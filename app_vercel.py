@@ -2,188 +2,62 @@ import streamlit as st
 import subprocess
 import os
 import tempfile
-import json
-from PIL import Image, ImageFilter
-import io
-import multiprocessing
-import shutil
+
+from vertical_studio.pipeline import (ConversionJob, Pipeline, validate_trim, ERROR_FFMPEG_MISSING,
+                                      ERROR_RESOURCE_LIMIT, ERROR_TIMEOUT, LOG_ERRORS)
+from vertical_studio.preview import PreviewCache, preview_start, upload_key
+from vertical_studio.profiles import get_profile
+from vertical_studio.resources import cpu_count, ffmpeg_rlimits, memory_budget_bytes
 
 # --- Configuration ---
 MAX_FILE_SIZE_MB = 200
 MAX_VIDEO_DURATION_SECONDS = 300  # 5 minutes
+CONVERSION_TIMEOUT_SECONDS = 240  # 4 minutes
 
-# --- Helper Functions ---
+# Serverless settings: ultrafast preset, fewer threads, shorter lookahead, lighter audio.
+ENCODER_SETTINGS = get_profile(os.environ.get('VS_CLOUD_PROFILE', 'serverless')).settings
 
-def is_ffmpeg_installed():
-    """Check if FFmpeg is installed and accessible in the system's PATH."""
-    try:
-        subprocess.run(["ffmpeg", "-version"], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+# Threads and lookahead shrink further when a large input would not fit the instance's memory
+pipeline = Pipeline(memory_budget_bytes=memory_budget_bytes(), **ffmpeg_rlimits())
+preview_cache = PreviewCache(pipeline)
+
+# --- Helper Functions ---
 
 def install_ffmpeg_if_needed():
     """Try to install FFmpeg if not available (for serverless environments)."""
-    if not is_ffmpeg_installed():
+    if not pipeline.is_available():
         try:
             # Try to install via apt (if running on Linux)
             subprocess.run(["apt", "update"], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             subprocess.run(["apt", "install", "-y", "ffmpeg"], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            return is_ffmpeg_installed()
+            return pipeline.is_available()
         except:
             return False
     return True
 
-def get_video_info(input_path):
-    """Uses ffprobe to get video stream information."""
-    command = [
-        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-        '-show_entries', 'stream=width,height,duration', '-of', 'json', input_path
-    ]
-    try:
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        info = json.loads(result.stdout)['streams'][0]
-        if all(k in info for k in ['width', 'height', 'duration']):
-            info['duration'] = float(info['duration'])
-            return info
-        return None
-    except (subprocess.CalledProcessError, json.JSONDecodeError, IndexError, KeyError):
-        return None
-
-def extract_frame(input_path, temp_dir):
-    """Extracts a single frame from the middle of the video."""
-    frame_output_path = os.path.join(temp_dir, "preview_frame.jpg")
-    command = [
-        'ffmpeg', '-i', input_path, '-ss', '00:00:01.000', # Grab frame from 1s mark
-        '-vframes', '1', '-q:v', '2', frame_output_path, '-y'
-    ]
-    try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return Image.open(frame_output_path)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return None
-
-def generate_preview(image, crop_percent, zoom_level):
-    """Applies crop and zoom to a preview image using Pillow."""
-    if image is None:
-        return None
-
-    original_width, original_height = image.size
-
-    # 1. Crop the input image to remove black bars.
-    crop_pixels = int(original_height * crop_percent)
-    top = crop_pixels
-    bottom = original_height - crop_pixels
-    cropped_image = image.crop((0, top, original_width, bottom))
-    
-    if cropped_image.height == 0: # Avoid division by zero if crop is 100%
-        return None
-
-    # --- Create the blurred background ---
-    canvas_width = 1080
-    canvas_height = 1920
-    
-    # Stretch the cropped image to fill the entire vertical canvas and blur it.
-    bg_image = cropped_image.resize((canvas_width, canvas_height), Image.Resampling.LANCZOS)
-    bg_image = bg_image.filter(ImageFilter.GaussianBlur(20))
-
-    # --- Create the foreground ---
-    # Determine the aspect ratio of the content *after* cropping.
-    cropped_aspect_ratio = cropped_image.width / cropped_image.height
-    
-    # Scale the foreground to fit the output width (1080px) while maintaining its aspect ratio.
-    # This is the base size at 1x zoom.
-    base_fg_width = canvas_width
-    base_fg_height = int(base_fg_width / cropped_aspect_ratio)
-
-    # Apply the zoom factor to the base size.
-    zoomed_fg_width = int(base_fg_width * zoom_level)
-    zoomed_fg_height = int(base_fg_height * zoom_level)
-    
-    # Resize the original cropped image to the new zoomed dimensions.
-    resized_main = cropped_image.resize((zoomed_fg_width, zoomed_fg_height), Image.Resampling.LANCZOS)
-
-    # --- Combine foreground and background ---
-    # Calculate coordinates to paste the foreground in the center of the canvas.
-    paste_x = (canvas_width - zoomed_fg_width) // 2
-    paste_y = (canvas_height - zoomed_fg_height) // 2
-    
-    # Paste the sharp, zoomed foreground onto the blurred background.
-    bg_image.paste(resized_main, (paste_x, paste_y), resized_main if resized_main.mode == 'RGBA' else None)
-    
-    return bg_image
-
-def convert_to_vertical(input_path, output_path, crop_percent, zoom_level, progress_bar):
+def convert_to_vertical(input_path, output_path, crop_percent, zoom_level, progress_bar,
+                        start_time=None, end_time=None):
     """OPTIMIZED: Converts a horizontal video to a 9:16 vertical format with speed improvements."""
-    output_width = 1080
-    output_height = 1920
-    scaled_main_width = int(output_width * zoom_level)
-    
-    # Get number of CPU cores for optimal threading (limit for serverless)
-    cpu_cores = min(multiprocessing.cpu_count(), 4)  # Limit to 4 cores for Vercel
-    threads = cpu_cores
-    
-    cmd = [
-        'ffmpeg', 
-        '-i', input_path,
-        
-        # THREADING OPTIMIZATIONS (limited for serverless)
-        '-threads', str(threads),               # Use limited CPU cores
-        '-thread_type', 'slice',               # Enable slice-based threading
-        
-        # PERFORMANCE FLAGS
-        '-preset', 'ultrafast',                # Use ultrafast for serverless (was 'faster')
-        '-tune', 'fastdecode',                 # Optimize for fast decoding
-        
-        # FILTER OPTIMIZATIONS
-        '-filter_complex',
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={scaled_main_width}:-1:flags=bilinear[main];'  # Use bilinear scaling (faster)
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={output_width}:{output_height}:force_original_aspect_ratio=increase:flags=bilinear,boxblur=20:10,crop={output_width}:{output_height}[bg];'  # Reduced blur for serverless
-        '[bg][main]overlay=(W-w)/2:(H-h)/2',
-        
-        # ENCODING OPTIMIZATIONS
-        '-c:v', 'libx264',                     # Keep H.264 for compatibility
-        '-crf', '26',                          # Higher CRF for faster encoding in serverless
-        '-pix_fmt', 'yuv420p',
-        
-        # ADDITIONAL SPEED OPTIMIZATIONS
-        '-movflags', '+faststart',             # Fast start for better streaming
-        '-x264-params', f'threads={threads}:sliced-threads=1:sync-lookahead=0:rc-lookahead=5',  # Reduced lookahead for serverless
-        
-        # AUDIO OPTIMIZATIONS (faster audio encoding)
-        '-c:a', 'aac', '-b:a', '96k',          # Lower audio bitrate for serverless
-        '-ac', '2',                            # Force stereo
-        
-        '-y', output_path
-    ]
+    job = ConversionJob(
+        input_path, output_path, crop_percent, zoom_level, ENCODER_SETTINGS,
+        start_time=start_time, end_time=end_time
+    )
     
     progress_bar.progress(10, text="Starting optimized conversion for cloud...")
-    try:
-        # Use Popen for better control in serverless environment
-        process = subprocess.Popen(
-            cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
-        
-        # Wait for completion with timeout for serverless
-        try:
-            stdout, stderr = process.communicate(timeout=240)  # 4 minute timeout
-        except subprocess.TimeoutExpired:
-            process.kill()
-            return False, "Conversion timed out (4 min limit for cloud deployment)"
-        
-        if process.returncode == 0:
+    result = pipeline.run(job, timeout=CONVERSION_TIMEOUT_SECONDS)
+    if result.success:
+        if result.fast_path:
+            progress_bar.progress(100, text="⚡ Already vertical: remuxed without re-encoding!")
+        else:
             progress_bar.progress(100, text="Cloud conversion successful!")
-            return True, stderr
-        return False, stderr
-    except FileNotFoundError:
+        return True, result.log
+    if result.error == ERROR_TIMEOUT:
+        return False, "Conversion timed out (4 min limit for cloud deployment)"
+    if result.error == ERROR_FFMPEG_MISSING:
         return False, "FFmpeg command not found. Please contact support."
-    except Exception as e:
-        return False, f"An unexpected error occurred: {str(e)}"
+    if result.error == ERROR_RESOURCE_LIMIT or result.error in LOG_ERRORS:
+        return False, result.log.splitlines()[0]
+    return False, result.log
 
 # --- Streamlit UI ---
 
@@ -200,7 +74,7 @@ if is_cloud_deployed:
 
 # Performance info
 with st.expander("⚡ Performance Optimizations Applied"):
-    cpu_cores = min(multiprocessing.cpu_count(), 4) if is_cloud_deployed else multiprocessing.cpu_count()
+    cpu_cores = min(cpu_count(), 4) if is_cloud_deployed else cpu_count()
     st.markdown(f"""
     **Cloud-Optimized Performance:**
     - 🔥 **Multi-threading**: Using {cpu_cores} CPU cores {'(cloud-limited)' if is_cloud_deployed else ''}
@@ -214,7 +88,7 @@ with st.expander("⚡ Performance Optimizations Applied"):
     """)
 
 # Check FFmpeg availability
-ffmpeg_available = is_ffmpeg_installed()
+ffmpeg_available = pipeline.is_available()
 
 if not ffmpeg_available:
     st.warning("⚠️ FFmpeg not detected. Attempting to install...")
@@ -253,11 +127,9 @@ else:
                 with open(input_path, "wb") as f:
                     f.write(uploaded_file.getbuffer())
 
-                video_info = get_video_info(input_path)
+                video_info = pipeline.probe(input_path)
                 if video_info is None:
                     st.error("Could not read video metadata. Please ensure the file is a valid video.")
-                elif video_info['duration'] > MAX_VIDEO_DURATION_SECONDS:
-                    st.error(f"Video is too long ({video_info['duration']:.0f}s). Maximum duration is {MAX_VIDEO_DURATION_SECONDS}s.")
                 else:
                     # Show video info
                     col_info1, col_info2, col_info3 = st.columns(3)
@@ -266,7 +138,7 @@ else:
                     with col_info2:
                         st.metric("⏱️ Duration", f"{video_info['duration']:.1f}s")
                     with col_info3:
-                        cpu_cores = min(multiprocessing.cpu_count(), 4) if is_cloud_deployed else multiprocessing.cpu_count()
+                        cpu_cores = min(cpu_count(), 4) if is_cloud_deployed else cpu_count()
                         st.metric("🖥️ CPU Cores", f"{cpu_cores} {'(cloud)' if is_cloud_deployed else '(local)'}")
                     
                     # --- Main Layout with Preview ---
@@ -284,21 +156,38 @@ else:
                         )
                         crop_percent_decimal = crop_amount / 100.0
 
-                        if st.button("✨ Convert to Vertical (Cloud-Optimized)", type="primary"):
+                        # Only the selected range is decoded and encoded, so long uploads stay fast
+                        duration = video_info['duration']
+                        trim_start, trim_end = st.slider(
+                            "⏱️ Trim (seconds)", 0.0, duration,
+                            (0.0, min(duration, float(MAX_VIDEO_DURATION_SECONDS))), 0.1, "%.1fs",
+                            help=f"Select the part to convert (up to {MAX_VIDEO_DURATION_SECONDS // 60} minutes)."
+                        )
+                        try:
+                            start_time, end_time = validate_trim(
+                                trim_start, trim_end, duration, MAX_VIDEO_DURATION_SECONDS
+                            )
+                            trim_valid = True
+                        except ValueError as e:
+                            st.error(f"✂️ {str(e)}")
+                            trim_valid = False
+
+                        if st.button("✨ Convert to Vertical (Cloud-Optimized)", type="primary", disabled=not trim_valid):
                             output_filename = f"vertical_cloud_{os.path.splitext(uploaded_file.name)[0]}.mp4"
                             output_path = os.path.join(temp_dir, output_filename)
                             progress_bar = st.progress(0, text="Preparing cloud-optimized conversion...")
                             
                             # Use optimized conversion function
                             success, ffmpeg_output = convert_to_vertical(
-                                input_path, output_path, crop_percent_decimal, zoom_level, progress_bar
+                                input_path, output_path, crop_percent_decimal, zoom_level, progress_bar,
+                                start_time, end_time
                             )
 
                             if success:
                                 st.success("✅ Cloud Conversion Complete!")
                                 
                                 # Show performance metrics
-                                cpu_cores = min(multiprocessing.cpu_count(), 4) if is_cloud_deployed else multiprocessing.cpu_count()
+                                cpu_cores = min(cpu_count(), 4) if is_cloud_deployed else cpu_count()
                                 st.info(f"⚡ Processed using {cpu_cores} CPU threads with cloud optimizations!")
                                 with open(output_path, 'rb') as video_file:
                                     video_bytes = video_file.read()
@@ -324,16 +213,15 @@ else:
 
                     with col2:
                         st.subheader("🔍 Live Preview")
-                        # Generate and display the preview
-                        preview_image = extract_frame(input_path, temp_dir)
-                        if preview_image:
-                            final_preview = generate_preview(preview_image, crop_percent_decimal, zoom_level)
-                            if final_preview:
-                                st.image(final_preview, width="stretch")
-                            else:
-                                st.warning("Could not generate preview with current settings.")
+                        # Render a short low-res excerpt through the real conversion graph
+                        preview = preview_cache.render(
+                            input_path, crop_percent_decimal, zoom_level, ENCODER_SETTINGS,
+                            start=preview_start(trim_end, trim_start), input_key=upload_key(uploaded_file)
+                        )
+                        if preview.success:
+                            st.video(preview.output_path, loop=True, autoplay=True, muted=True)
                         else:
-                            st.warning("Could not extract a frame for preview. Video might be corrupted or in unsupported format.")
+                            st.warning("Could not render a preview clip. Video might be corrupted or in unsupported format.")
 
 st.markdown("---")
 
@@ -1,68 +1,371 @@
 #!/usr/bin/env python3
 """
-Batch video conversion script for testing multiple video processing
+Batch video conversion script for converting many videos to vertical format.
+
+Inputs can be files, directories (optionally recursive), glob patterns or a
+CSV/JSON manifest with per-file crop/zoom/profile/trim. Completed jobs are recorded
+in a checkpoint keyed by input hash and parameters, so reruns skip work that
+is already done and only convert new or changed inputs.
+
+Examples:
+    python batch_convert.py clips/ -r -o vertical/
+    python batch_convert.py "renders/*.mp4" --crop 0.05 --zoom 1.2
+    python batch_convert.py long_take.mp4 --start 95 --end 125
+    python batch_convert.py clips/ --target-size 8
+    python batch_convert.py --manifest jobs.csv -o vertical/
+    python batch_convert.py --watch incoming/ -o vertical/ --workers 2
+    python batch_convert.py --manifest short.csv --stitch short.mp4
 """
+import argparse
+import csv
+import glob
+import hashlib
+import json
 import os
-import subprocess
+import signal
 import sys
-from pathlib import Path
-
-def convert_to_vertical(input_path, output_path, crop_percent=0.09, zoom_level=1.0):
-    """Convert a horizontal video to vertical format."""
-    output_width = 1080
-    output_height = 1920
-    scaled_main_width = int(output_width * zoom_level)
-
-    cmd = [
-        'ffmpeg', '-i', input_path, '-filter_complex',
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={scaled_main_width}:-1[main];'
-        f'[0:v]crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent},scale={output_width}:{output_height}:force_original_aspect_ratio=increase,boxblur=40:20,crop={output_width}:{output_height}[bg];'
-        '[bg][main]overlay=(W-w)/2:(H-h)/2',
-        '-c:v', 'libx264', '-preset', 'medium', '-crf', '23', '-pix_fmt', 'yuv420p',
-        '-y', output_path
-    ]
+import threading
+import time
+
+from vertical_studio.hashing import sha256_file
+from vertical_studio.pipeline import ConversionJob, Pipeline, StitchClip, StitchJob, validate_trim
+from vertical_studio.profiles import PROFILES
+from vertical_studio.resources import cpu_count, ffmpeg_rlimits, memory_budget_bytes, threads_per_worker
+from vertical_studio.sizing import TargetSizeError, convert_to_target_size
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+CHECKPOINT_FILENAME = '.batch_checkpoint.jsonl'
+LEDGER_FILENAME = 'watch_ledger.json'
+
+# Bump whenever convert_to_vertical changes its output, so old checkpoints are not trusted.
+# batch-2: remux fast path for vertical inputs, memory-fitted and CPU-budgeted x264 threads.
+# batch-3: a CPU budget alone no longer switches the default profile to sliced threads.
+ENCODER_VERSION = 'batch-3'
+
+pipeline = Pipeline(memory_budget_bytes=memory_budget_bytes(), **ffmpeg_rlimits())
+
+
+def convert_to_vertical(input_path, output_path, crop_percent=0.09, zoom_level=1.0, profile='default',
+                        start_time=None, end_time=None, target_mb=None):
+    """Convert a horizontal video (or the start_time..end_time part of it) to vertical format.
+
+    With target_mb the CRF is chosen from short sample encodes so the output fits
+    that many megabytes; on success the message reports predicted vs actual size.
+    """
+    job = ConversionJob(
+        input_path, output_path, crop_percent, zoom_level, PROFILES[profile].settings,
+        start_time=start_time, end_time=end_time
+    )
+    if not target_mb:
+        result = pipeline.run(job)
+        return result.success, result.log
+    try:
+        result, plan = convert_to_target_size(pipeline, job, int(target_mb * 1024 * 1024))
+    except TargetSizeError as e:
+        return False, str(e)
+    if not result.success:
+        return False, result.log
+    return True, (f"CRF {plan.crf:g}: predicted {plan.predicted_bytes / 1048576:.2f} MB, "
+                  f"actual {plan.actual_bytes / 1048576:.2f} MB ({plan.error_percent:+.1f}%) "
+                  f"for a {target_mb:g} MB target")
+
+# --- Job discovery ---
+
+def expand_inputs(patterns, recursive=False):
+    """Expands files, directories and glob patterns into a sorted list of video paths."""
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            if recursive:
+                for dirpath, _dirnames, filenames in os.walk(pattern):
+                    found.update(os.path.join(dirpath, f) for f in filenames)
+            else:
+                found.update(os.path.join(pattern, f) for f in os.listdir(pattern))
+        elif os.path.isfile(pattern):
+            found.add(pattern)
+        else:
+            found.update(glob.glob(pattern, recursive=recursive))
+    return sorted(
+        os.path.abspath(path) for path in found
+        if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS)
+    )
+
+def load_manifest(manifest_path):
+    """Reads a CSV (with an 'input' column) or JSON manifest into a list of job dicts."""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith('.json'):
+        with open(manifest_path) as f:
+            data = json.load(f)
+        rows = data['jobs'] if isinstance(data, dict) else data
+    else:
+        with open(manifest_path, newline='') as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for row in rows:
+        if isinstance(row, str):
+            row = {'input': row}
+        job = {key: value for key, value in row.items() if value not in (None, '')}
+        if 'input' not in job:
+            raise ValueError(f"Manifest row without an 'input': {row}")
+        job['input'] = os.path.join(base_dir, job['input'])
+        if 'output' in job:
+            job['output'] = os.path.join(base_dir, job['output'])
+        jobs.append(job)
+    return jobs
+
+def build_jobs(args):
+    """Combines manifest rows and positional inputs into fully specified jobs."""
+    rows = load_manifest(args.manifest) if args.manifest else []
+    patterns = args.inputs
+    if not patterns and not rows:
+        # Original behavior: pick up the test clips in the current directory
+        patterns = glob.glob('test_horizontal*.mp4')
+    rows.extend({'input': path} for path in expand_inputs(patterns, args.recursive))
+
+    jobs = []
+    for row in rows:
+        profile = row.get('profile', args.profile)
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile '{profile}' for {row['input']}")
+        start, end = validate_trim(row.get('start', args.start), row.get('end', args.end))
+        target_mb = row.get('target_mb') or args.target_size
+        jobs.append({
+            'input': os.path.abspath(row['input']),
+            'crop': float(row.get('crop', args.crop)),
+            'zoom': float(row.get('zoom', args.zoom)),
+            'profile': profile,
+            'start': start,
+            'end': end,
+            'target_mb': float(target_mb) if target_mb else None,
+            'output': row.get('output'),
+        })
+    return jobs
+
+# --- Checkpoint ---
+
+class Checkpoint:
+    """Append-only JSON-lines record of completed jobs and cached input hashes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = {}
+        self.hashes = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Partially written last line from an interrupted run
+                    if record.get('type') == 'hash':
+                        self.hashes[record['path']] = record
+                    elif record.get('type') == 'done':
+                        self.completed[record['key']] = record
+
+    def input_hash(self, path):
+        """Returns the file's SHA-256, reusing the cached value while size and mtime match."""
+        stats = os.stat(path)
+        cached = self.hashes.get(path)
+        if cached and cached['size'] == stats.st_size and cached['mtime_ns'] == stats.st_mtime_ns:
+            return cached['sha256']
+        digest = sha256_file(path)
+        self._append({'type': 'hash', 'path': path, 'size': stats.st_size,
+                      'mtime_ns': stats.st_mtime_ns, 'sha256': digest})
+        return digest
+
+    def is_done(self, key, output_path):
+        record = self.completed.get(key)
+        return record is not None and record['output'] == output_path and os.path.exists(output_path)
+
+    def mark_done(self, key, job, output_path):
+        self._append({'type': 'done', 'key': key, 'input': job['input'], 'output': output_path,
+                      'completed_at': time.time()})
+
+    def _append(self, record):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+            if record['type'] == 'hash':
+                self.hashes[record['path']] = record
+            else:
+                self.completed[record['key']] = record
+
+def job_key(input_digest, job):
+    """Returns a stable key for an input digest plus everything that affects the output."""
+    params = {'input': input_digest, 'crop': round(job['crop'], 4), 'zoom': round(job['zoom'], 4),
+              'profile': job['profile'], 'encoder': ENCODER_VERSION}
+    if job['start'] is not None or job['end'] is not None:
+        params.update(start=job['start'], end=job['end'])
+    if job.get('target_mb'):
+        params['target_mb'] = job['target_mb']
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+def output_path_for(job, key, output_dir):
+    """Names outputs by input stem and job key, so the same job always maps to the same file."""
+    if job['output']:
+        return os.path.abspath(job['output'])
+    stem = os.path.splitext(os.path.basename(job['input']))[0]
+    return os.path.join(os.path.abspath(output_dir), f"{stem}_vertical_{key[:10]}.mp4")
+
+def run_job(job, checkpoint, output_dir, force=False):
+    """Converts one job unless the checkpoint has it. Returns (status, message, output_path)."""
+    key = job_key(checkpoint.input_hash(job['input']), job)
+    output_file = output_path_for(job, key, output_dir)
+    
+    if not force and checkpoint.is_done(key, output_file):
+        return 'skipped', 'Already up to date', output_file
     
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    partial_file = output_file + '.partial'
+    success, error_msg = convert_to_vertical(
+        job['input'], partial_file, job['crop'], job['zoom'], job['profile'], job['start'], job['end'],
+        job.get('target_mb')
+    )
+    
+    if success:
+        os.replace(partial_file, output_file)
+        checkpoint.mark_done(key, job, output_file)
+        return 'converted', error_msg if job.get('target_mb') else 'Success', output_file
+    if os.path.exists(partial_file):
+        os.remove(partial_file)
+    return 'failed', error_msg, output_file
+
+def watch(args, checkpoint):
+    """Long-running mode: convert clips as they finish landing in the watched directories."""
+    from vertical_studio.watcher import FolderWatcher
+    
+    def handle(path):
+        start, end = validate_trim(args.start, args.end)
+        job = {'input': path, 'crop': args.crop, 'zoom': args.zoom, 'profile': args.profile,
+               'start': start, 'end': end, 'target_mb': args.target_size, 'output': None}
+        status, message, output_file = run_job(job, checkpoint, args.output_dir)
+        print(f"[{'FAIL' if status == 'failed' else 'OK'}] {path} -> {output_file} ({message if status == 'failed' else status})")
+        return status != 'failed', message, output_file
+    
+    watcher = FolderWatcher(
+        args.inputs, handle, os.path.join(args.output_dir, LEDGER_FILENAME),
+        extensions=VIDEO_EXTENSIONS, workers=args.workers, recursive=args.recursive,
+        ignore_dirs=[args.output_dir], settle_seconds=args.settle
+    )
+    # Parallel conversions share the CPU budget instead of each sizing for every core
+    pipeline.max_threads = threads_per_worker(args.workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    print(f"Watching {', '.join(watcher.directories)} with {args.workers} workers, "
+          f"{pipeline.max_threads} ffmpeg thread(s) each (Ctrl+C to stop)...")
+    watcher.run()
+
+def stitch(jobs, output_path, profile):
+    """Joins jobs, in order and each with its own framing and trim, into one output with a single encode."""
+    clips = [StitchClip(job['input'], job['crop'], job['zoom'], job['start'], job['end']) for job in jobs]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        return result.returncode == 0, result.stderr
-    except FileNotFoundError:
-        return False, "FFmpeg command not found."
-    except Exception as e:
-        return False, f"An unexpected error occurred: {str(e)}"
-
-def main():
-    # Find all test horizontal videos
-    input_files = [f for f in os.listdir('.') if f.startswith('test_horizontal') and f.endswith('.mp4')]
+        result = pipeline.stitch(StitchJob(clips, output_path, PROFILES[profile].settings))
+    except ValueError as e:
+        return False, str(e)
+    if not result.success:
+        return False, result.log
+    return True, f"{len(clips)} clips in {result.elapsed_seconds:.1f}s"
+
+# --- Main ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert horizontal videos to 9:16 vertical format in bulk.")
+    parser.add_argument('inputs', nargs='*', help="Video files, directories or glob patterns")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Descend into directories and '**' globs")
+    parser.add_argument('-m', '--manifest', help="CSV or JSON manifest with input[,crop,zoom,profile,start,end,target_mb,output]")
+    parser.add_argument('-o', '--output-dir', default='vertical_output', help="Directory for converted videos")
+    parser.add_argument('--crop', type=float, default=0.09, help="Black bar crop fraction per side (default 0.09)")
+    parser.add_argument('--zoom', type=float, default=1.0, help="Foreground zoom factor (default 1.0)")
+    parser.add_argument('--start', type=float, help="Convert from this many seconds into each input")
+    parser.add_argument('--end', type=float, help="Stop converting at this many seconds into each input")
+    parser.add_argument('--target-size', type=float, metavar='MB', help="Pick the CRF so each output fits this many megabytes")
+    # Any profile from vertical_studio.profiles is selectable; 'default' matches the original batch output
+    parser.add_argument('--profile', default='default', choices=sorted(PROFILES), help="Encoder profile")
+    parser.add_argument('--checkpoint', help=f"Checkpoint file (default <output-dir>/{CHECKPOINT_FILENAME})")
+    parser.add_argument('--force', action='store_true', help="Convert again even if the checkpoint says done")
+    parser.add_argument('--watch', action='store_true', help="Keep running and convert clips as they land in the input directories")
+    parser.add_argument('--workers', type=int, default=min(2, cpu_count()),
+                        help="Parallel conversions in --watch mode (default 2, or 1 with a single CPU)")
+    parser.add_argument('--settle', type=float, default=2.0, help="Seconds a file must stay unchanged before it is converted")
+    parser.add_argument('--stitch', metavar='OUTPUT',
+                        help="Join all inputs (manifest order, then sorted inputs) into this one video with --profile")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    
+    if args.watch:
+        if not args.inputs or not all(os.path.isdir(d) for d in args.inputs):
+            print("[FAIL] --watch needs one or more existing directories")
+            sys.exit(2)
+        try:
+            validate_trim(args.start, args.end)
+        except ValueError as e:
+            print(f"[FAIL] {e}")
+            sys.exit(2)
+        os.makedirs(args.output_dir, exist_ok=True)
+        watch(args, Checkpoint(args.checkpoint or os.path.join(args.output_dir, CHECKPOINT_FILENAME)))
+        return
     
-    if not input_files:
-        print("No test horizontal videos found!")
+    try:
+        jobs = build_jobs(args)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[FAIL] Could not read jobs: {e}")
+        sys.exit(2)
+    
+    if not jobs:
+        print("No input videos found!")
         return
     
-    print(f"Found {len(input_files)} videos to convert:")
-    for f in input_files:
-        print(f"  - {f}")
+    if args.stitch:
+        if any(job['target_mb'] for job in jobs):
+            print("[FAIL] --target-size is not supported with --stitch")
+            sys.exit(2)
+        output_dir = os.path.dirname(os.path.abspath(args.stitch))
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"Stitching {len(jobs)} videos into {args.stitch}...")
+        success, message = stitch(jobs, args.stitch, args.profile)
+        if not success:
+            print(f"[FAIL] Stitching failed: {message}")
+            sys.exit(1)
+        print(f"[OK] Stitched {message} -> {args.stitch}")
+        return
     
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output_dir, CHECKPOINT_FILENAME))
+    
+    print(f"Found {len(jobs)} videos to convert.")
     print("\nStarting batch conversion...")
     
     success_count = 0
-    for i, input_file in enumerate(input_files, 1):
-        output_file = f"vertical_batch_{i}.mp4"
-        print(f"\n[{i}/{len(input_files)}] Converting {input_file} -> {output_file}")
-        
-        success, error_msg = convert_to_vertical(input_file, output_file)
+    skipped_count = 0
+    failed = []
+    for i, job in enumerate(jobs, 1):
+        print(f"\n[{i}/{len(jobs)}] {job['input']}")
+        try:
+            status, error_msg, output_file = run_job(job, checkpoint, args.output_dir, args.force)
+        except OSError as e:
+            status, error_msg = 'failed', f"Cannot read input: {e}"
         
-        if success:
-            print(f"[OK] Successfully converted {input_file}")
+        if status == 'converted':
+            print(f"[OK] Successfully converted -> {output_file}")
+            if job.get('target_mb'):
+                print(f"     {error_msg}")
             success_count += 1
+        elif status == 'skipped':
+            print(f"[OK] Already up to date -> {output_file}")
+            skipped_count += 1
         else:
-            print(f"[FAIL] Failed to convert {input_file}: {error_msg}")
+            print(f"[FAIL] Failed to convert {job['input']}: {error_msg}")
+            failed.append(job['input'])
     
     print(f"\n[DONE] Batch conversion complete!")
-    print(f"[OK] Successfully converted: {success_count}/{len(input_files)} videos")
+    print(f"[OK] Converted: {success_count}, already up to date: {skipped_count}, total: {len(jobs)}")
     
-    if success_count < len(input_files):
-        print(f"[FAIL] Failed: {len(input_files) - success_count} videos")
+    if failed:
+        print(f"[FAIL] Failed: {len(failed)} videos")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark every encoding profile on this machine.
+
+Each profile converts the same reference clip; the wall time, CPU time,
+peak memory and output size are recorded in the profile benchmark file
+that the front ends read (vertical_studio/profile_benchmarks.json, or
+$VS_PROFILE_BENCHMARKS). Without --input a synthetic 1080p clip with
+audio is generated with ffmpeg's lavfi sources, so runs are comparable
+across machines. Results only describe the machine they were taken on;
+rerun after changing profiles or hardware.
+
+Examples:
+    python benchmark_profiles.py
+    python benchmark_profiles.py --input sample.mp4 --repeat 3 --profiles draft fast default
+"""
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from vertical_studio.fsutil import atomic_write_json
+from vertical_studio.pipeline import ConversionJob, Pipeline
+from vertical_studio.profiles import BENCHMARKS_PATH, PROFILES, load_benchmarks
+from vertical_studio.resources import cpu_info
+
+REFERENCE_SECONDS = 10
+REFERENCE_SIZE = '1920x1080'
+REFERENCE_RATE = 30
+
+
+def make_reference_clip(pipeline, path, seconds=REFERENCE_SECONDS):
+    """Renders a synthetic landscape clip (moving test pattern plus a tone) to path."""
+    cmd = [
+        pipeline.ffmpeg, '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={REFERENCE_SIZE}:rate={REFERENCE_RATE}:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '18', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest', '-y', path
+    ]
+    return pipeline.execute(cmd, path)
+
+
+def ffmpeg_version(pipeline):
+    try:
+        result = subprocess.run([pipeline.ffmpeg, '-version'], capture_output=True, text=True)
+        return result.stdout.splitlines()[0] if result.stdout else None
+    except OSError:
+        return None
+
+
+def benchmark_profile(pipeline, profile, input_path, duration, work_dir, repeat):
+    """Converts input_path repeat times with profile; returns its record, or None if a run failed."""
+    output_path = os.path.join(work_dir, f'{profile.name}.mp4')
+    runs = []
+    for _ in range(repeat):
+        job = ConversionJob(input_path, output_path, settings=profile.settings)
+        result = pipeline.run(job, allow_remux=False)
+        if not result.success:
+            print(f"[FAIL] {profile.name}: {result.error}\n{result.log[-500:]}")
+            return None
+        runs.append(result)
+
+    # An output-side duration cap (e.g. the API's 60s) shortens what was encoded
+    seconds = min(duration, profile.settings.max_duration or duration)
+    elapsed = statistics.median(result.elapsed_seconds for result in runs)
+    size = os.path.getsize(output_path)
+    cpu_times = [result.cpu_seconds for result in runs if result.cpu_seconds is not None]
+    peaks = [result.peak_rss_bytes for result in runs if result.peak_rss_bytes is not None]
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'speed': round(seconds / elapsed, 3) if elapsed else None,
+        'cpu_seconds': round(statistics.median(cpu_times), 3) if cpu_times else None,
+        'peak_rss_bytes': max(peaks) if peaks else None,
+        'output_bytes': size,
+        'megabytes_per_minute': round(size / (1024 * 1024) / (seconds / 60), 3),
+        'encoded_seconds': seconds,
+        'runs': len(runs),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the speed and output size of every encoding profile.")
+    parser.add_argument('--input', help="Reference clip (default: a synthetic 10s 1080p clip)")
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=sorted(PROFILES),
+                        help="Profiles to benchmark (default: all)")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per profile; the median time is kept (default 1)")
+    parser.add_argument('--output', default=BENCHMARKS_PATH, help=f"Results file (default {BENCHMARKS_PATH})")
+    parser.add_argument('--ffmpeg', default='ffmpeg', help="ffmpeg binary (default: from PATH)")
+    parser.add_argument('--ffprobe', default='ffprobe', help="ffprobe binary (default: from PATH)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pipeline = Pipeline(ffmpeg=args.ffmpeg, ffprobe=args.ffprobe)
+    if not pipeline.is_available():
+        print("[FAIL] FFmpeg is not installed or not found in your system's PATH.")
+        sys.exit(2)
+
+    with tempfile.TemporaryDirectory(prefix='vs_bench_') as work_dir:
+        input_path = args.input
+        if input_path is None:
+            input_path = os.path.join(work_dir, 'reference.mp4')
+            result = make_reference_clip(pipeline, input_path)
+            if not result.success:
+                print(f"[FAIL] Could not render the reference clip:\n{result.log[-500:]}")
+                sys.exit(1)
+        duration = pipeline.duration(input_path)
+        if not duration:
+            print(f"[FAIL] Could not read the duration of {input_path}")
+            sys.exit(1)
+
+        records = {}
+        for name in args.profiles:
+            print(f"Benchmarking {name}...")
+            record = benchmark_profile(pipeline, PROFILES[name], input_path, duration, work_dir, args.repeat)
+            if record is not None:
+                records[name] = record
+                print(f"[OK] {name}: {record['speed']:.2f}x realtime, {record['megabytes_per_minute']:.2f} MB/min")
+
+    # Profiles left out of this run keep their previous results
+    profiles = load_benchmarks(args.output)
+    profiles.update(records)
+    atomic_write_json(args.output, {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'machine': {'platform': platform.platform(), 'ffmpeg': ffmpeg_version(pipeline), 'cpu': cpu_info()},
+        'input': {'path': args.input or f'synthetic {REFERENCE_SIZE}@{REFERENCE_RATE}', 'duration': duration},
+        'profiles': profiles,
+    })
+    print(f"Wrote {len(records)} profile result(s) to {args.output}")
+    if len(records) < len(args.profiles):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
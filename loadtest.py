@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP API (api/index.py).
+
+Virtual users repeatedly run conversion scenarios at a fixed concurrency:
+
+- convert: POST /convert with a multipart upload;
+- chunked: POST /upload-init, POST /upload-chunk per chunk, then
+  POST /convert-chunked.
+
+Unless --url points at a running deployment, the API is started locally in
+a child process with its own temporary stores and one of two encoder
+backends:
+
+- stub: a fake ffmpeg that burns --stub-cpu seconds of CPU and writes
+  --stub-output-kb of output, so server overhead and queueing can be
+  measured in CI without real encodes;
+- ffmpeg: the real encoder on a tiny lavfi clip.
+
+Each request gets a slightly different crop, so retained outputs are not
+reused (pass --reuse-outputs to measure cache hits instead). The report
+lists count, error rate, throughput and p50/p95/p99 latency per endpoint
+as JSON; with --baseline, a previous report is compared and the exit
+status is 1 when p95 latency or error rate regress beyond --tolerance.
+
+Examples:
+    python loadtest.py --concurrency 8 --requests 200
+    python loadtest.py --backend ffmpeg --scenario convert --output report.json
+    python loadtest.py --url https://example.vercel.app/api --requests 20
+    python loadtest.py --baseline report.json --tolerance 0.25
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ('convert', 'chunked')
+STUB_INPUT_BYTES = 256 * 1024
+CHUNK_BYTES = 64 * 1024
+TINY_CLIP_SECONDS = 2
+REQUEST_TIMEOUT_SECONDS = 120
+SERVER_START_TIMEOUT_SECONDS = 30
+
+
+# --- Stub encoder ---
+
+def stub_encoder(argv):
+    """Acts as ffmpeg: burns VS_STUB_CPU_SECONDS of CPU and writes VS_STUB_OUTPUT_BYTES to the last argument."""
+    if argv[:1] == ['-version']:
+        print("ffmpeg version stub (loadtest.py)")
+        return 0
+    deadline = time.process_time() + float(os.environ.get('VS_STUB_CPU_SECONDS', '0.2'))
+    while time.process_time() < deadline:
+        pass
+    output_path = argv[-1] if argv else None
+    if output_path and output_path != '-':
+        with open(output_path, 'wb') as f:
+            f.write(os.urandom(int(os.environ.get('VS_STUB_OUTPUT_BYTES', str(512 * 1024)))))
+    return 0
+
+
+def install_stub(directory):
+    """Writes an executable wrapper that runs stub_encoder; returns its path."""
+    path = os.path.join(directory, 'ffmpeg')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" --stub-encoder "$@"\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+# --- Local server ---
+
+def serve(port):
+    """Runs the API on localhost:port with a threaded server (child process entry point)."""
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+    import index
+    make_server('127.0.0.1', port, index.app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(work_dir, ffmpeg_path, args):
+    """Starts the API in a child process with stores under work_dir; returns (process, base url)."""
+    port = free_port()
+    env = dict(os.environ, TMPDIR=work_dir, VS_FFMPEG_PATH=ffmpeg_path,
+               VS_STUB_CPU_SECONDS=str(args.stub_cpu), VS_STUB_OUTPUT_BYTES=str(int(args.stub_output_kb * 1024)))
+    for name in ('VS_CONTENT_STORE_DIR', 'VS_OUTPUT_STORE_DIR', 'VS_JOB_QUEUE_PATH', 'VS_SEGMENT_DIR'):
+        env.pop(name, None)
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)], env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(url + '/', timeout=1).close()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("API server did not start in time")
+
+
+def make_tiny_clip(ffmpeg_path, path):
+    """Renders a small landscape clip with audio for the ffmpeg backend."""
+    subprocess.run([
+        ffmpeg_path, '-v', 'error', '-f', 'lavfi', '-i', f'testsrc2=size=320x180:rate=15:duration={TINY_CLIP_SECONDS}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={TINY_CLIP_SECONDS}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# --- Client ---
+
+def multipart(fields, files):
+    """Encodes form fields and (name, filename, bytes) files; returns (body, content type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Collects (latency, ok) samples per endpoint from many threads."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, url, body=None, content_type=None):
+        """POSTs body to url, records the latency under endpoint and returns (ok, response bytes)."""
+        request = urllib.request.Request(url, data=body, method='POST')
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+                data = response.read()
+            ok = True
+        except (urllib.error.URLError, OSError):
+            data, ok = b'', False
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((time.perf_counter() - started, ok))
+        return ok, data
+
+
+def options(args):
+    # A unique crop per request keeps retained outputs from short-circuiting the encode
+    crop = 5.0 if args.reuse_outputs else round(random.uniform(4.0, 6.0), 4)
+    return {'crop': crop, 'zoom': 10}
+
+
+def run_convert(recorder, url, video, args):
+    body, content_type = multipart(options(args), [('video', 'input.mp4', video)])
+    return recorder.request('/convert', url + '/convert', body, content_type)[0]
+
+
+def run_chunked(recorder, url, video, args):
+    ok, data = recorder.request('/upload-init', url + '/upload-init',
+                                json.dumps({'fileSize': len(video)}).encode(), 'application/json')
+    if not ok:
+        return False
+    upload_id = json.loads(data)['uploadId']
+    chunks = [video[i:i + args.chunk_kb * 1024] for i in range(0, len(video), args.chunk_kb * 1024)]
+    for index, chunk in enumerate(chunks):
+        body, content_type = multipart(
+            {'uploadId': upload_id, 'chunkIndex': index, 'totalChunks': len(chunks), 'filename': 'input.mp4'},
+            [('chunk', 'blob', chunk)]
+        )
+        if not recorder.request('/upload-chunk', url + '/upload-chunk', body, content_type)[0]:
+            return False
+    payload = dict(options(args), uploadId=upload_id)
+    return recorder.request('/convert-chunked', url + '/convert-chunked',
+                            json.dumps(payload).encode(), 'application/json')[0]
+
+
+RUNNERS = {'convert': run_convert, 'chunked': run_chunked}
+
+
+# --- Report ---
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / wall_seconds, 3) if wall_seconds else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Returns regression messages for endpoints whose p95 or error rate got worse than the baseline allows."""
+    problems = []
+    for endpoint, current in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(endpoint)
+        if not previous:
+            continue
+        if previous.get('p95_ms') and current['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            problems.append(f"{endpoint}: p95 {current['p95_ms']}ms vs {previous['p95_ms']}ms")
+        if current['error_rate'] > previous.get('error_rate', 0) + tolerance / 10:
+            problems.append(f"{endpoint}: error rate {current['error_rate']} vs {previous.get('error_rate', 0)}")
+    return problems
+
+
+# --- Main ---
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API latency and throughput under concurrent load.")
+    parser.add_argument('--url', help="Base URL of a running API (default: start one locally)")
+    parser.add_argument('--backend', choices=('stub', 'ffmpeg'), default='stub',
+                        help="Encoder for the local API (default stub)")
+    parser.add_argument('--ffmpeg', default='ffmpeg', help="ffmpeg binary for --backend ffmpeg")
+    parser.add_argument('--scenario', choices=SCENARIOS + ('mixed',), default='mixed',
+                        help="Scenario each virtual user runs; mixed alternates them (default)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Virtual users (default 4)")
+    parser.add_argument('--requests', type=int, default=40, help="Scenario runs in total (default 40)")
+    parser.add_argument('--stub-cpu', type=float, default=0.2, help="CPU seconds per stub encode (default 0.2)")
+    parser.add_argument('--stub-output-kb', type=float, default=512, help="Stub output size in KB (default 512)")
+    parser.add_argument('--chunk-kb', type=int, default=CHUNK_BYTES // 1024, help="Chunk size for the chunked scenario")
+    parser.add_argument('--reuse-outputs', action='store_true', help="Send identical settings, so outputs are reused")
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--baseline', help="Previous report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative p95 increase, and a tenth of it in error rate (default 0.2)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='vs_loadtest_')
+    server = None
+    try:
+        url = args.url.rstrip('/') if args.url else None
+        if args.backend == 'ffmpeg':
+            video = make_tiny_clip(args.ffmpeg, os.path.join(work_dir, 'clip.mp4'))
+        else:
+            video = os.urandom(STUB_INPUT_BYTES)
+        if url is None:
+            if args.backend == 'ffmpeg':
+                ffmpeg_path = shutil.which(args.ffmpeg) or args.ffmpeg
+            else:
+                ffmpeg_path = install_stub(work_dir)
+            server, url = start_server(work_dir, ffmpeg_path, args)
+
+        scenarios = SCENARIOS if args.scenario == 'mixed' else (args.scenario,)
+        recorder = Recorder()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(
+                lambda i: RUNNERS[scenarios[i % len(scenarios)]](recorder, url, video, args), range(args.requests)
+            ))
+        wall_seconds = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        'config': {'backend': 'remote' if args.url else args.backend, 'scenario': args.scenario,
+                   'concurrency': args.concurrency, 'requests': args.requests, 'input_bytes': len(video),
+                   'stub_cpu_seconds': args.stub_cpu, 'stub_output_kb': args.stub_output_kb,
+                   'reuse_outputs': args.reuse_outputs},
+        'wall_seconds': round(wall_seconds, 3),
+        'scenarios_completed': sum(outcomes),
+        'scenarios_failed': len(outcomes) - sum(outcomes),
+        'endpoints': {endpoint: summarize(samples, wall_seconds)
+                      for endpoint, samples in sorted(recorder.samples.items())},
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"[REGRESSION] {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--stub-encoder']:
+        sys.exit(stub_encoder(sys.argv[2:]))
+    if sys.argv[1:2] == ['--serve']:
+        serve(int(sys.argv[2]))
+    else:
+        main()
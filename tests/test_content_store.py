@@ -0,0 +1,25 @@
+import io
+
+import pytest
+
+from vertical_studio.content_store import ContentStore, StoreQuotaExceeded
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = ContentStore(str(tmp_path / 'store'), quota_bytes=10)
+    first = store.put_stream(io.BytesIO(b'a' * 6))
+    second = store.put_stream(io.BytesIO(b'b' * 6))
+    assert not store.has(first)
+    assert store.has(second)
+
+
+def test_refuses_objects_that_cannot_fit(tmp_path):
+    store = ContentStore(str(tmp_path / 'store'), quota_bytes=10)
+    digest = store.put_stream(io.BytesIO(b'a' * 6))
+    with store.hold(digest):
+        with pytest.raises(StoreQuotaExceeded):
+            store.put_stream(io.BytesIO(b'b' * 6))
+    with pytest.raises(StoreQuotaExceeded):
+        store.put_stream(io.BytesIO(b'c' * 11))
+    assert store.has(digest)
+    assert store.usage() == 6
@@ -0,0 +1,47 @@
+"""CLI and worker processes must start fast and never load the UI frameworks."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+HEAVY_MODULES = ('streamlit', 'flask', 'PIL')
+# Generous enough for a cold, loaded CI machine; a warm import takes a small fraction of this
+IMPORT_BUDGET_SECONDS = 1.0
+API_IMPORT_BUDGET_SECONDS = 3.0
+
+PROBE = '''
+import json, sys, time
+sys.path.insert(0, sys.argv[2])
+started = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'modules': sorted(m for m in sys.modules if '.' not in m)}))
+'''
+
+
+def import_in_subprocess(module, path, tmp_path):
+    env = dict(os.environ,
+               VS_CONTENT_STORE_DIR=str(tmp_path / 'inputs'), VS_OUTPUT_STORE_DIR=str(tmp_path / 'outputs'),
+               VS_JOB_QUEUE_PATH=str(tmp_path / 'jobs.db'), VS_SEGMENT_DIR=str(tmp_path / 'segments'))
+    result = subprocess.run([sys.executable, '-c', PROBE, module, path], capture_output=True, text=True,
+                            cwd=str(tmp_path), env=env, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize('module', ['vertical_studio.pipeline', 'batch_convert', 'worker'])
+def test_cli_imports_stay_light(module, tmp_path):
+    report = import_in_subprocess(module, ROOT, tmp_path)
+    assert not set(HEAVY_MODULES) & set(report['modules'])
+    assert report['seconds'] < IMPORT_BUDGET_SECONDS
+
+
+def test_api_import_skips_ui_and_pillow(tmp_path):
+    pytest.importorskip('flask')
+    report = import_in_subprocess('index', os.path.join(ROOT, 'api'), tmp_path)
+    assert not {'streamlit', 'PIL'} & set(report['modules'])
+    assert report['seconds'] < API_IMPORT_BUDGET_SECONDS
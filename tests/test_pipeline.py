@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+
+import pytest
+
+import vertical_studio.pipeline as pipeline_module
+from vertical_studio.ffmpeg_log import ERROR_INVALID_INPUT, ERROR_IO
+from vertical_studio.pipeline import (ERROR_FFMPEG_FAILED, ERROR_TIMEOUT, FAST_PATH_REMUX, SPRITE_COLUMNS, SPRITE_PATTERN,
+                                      SPRITE_ROWS, ConversionJob, Pipeline, write_sprite_vtt)
+from vertical_studio.profiles import get_profile
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="stub ffmpeg is a shell script")
+
+
+def stub_ffmpeg(tmp_path, body):
+    """Writes a shell script standing in for ffmpeg and returns its path."""
+    path = tmp_path / 'ffmpeg'
+    path.write_text('#!/bin/sh\n' + body)
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_fatal_line_sets_classified_error(tmp_path):
+    # The kill on the fatal line races the process's own exit; this used to lose the result
+    ffmpeg = stub_ffmpeg(tmp_path, 'echo "in.mp4: No such file or directory" >&2\nexit 1\n')
+    pipeline = Pipeline(ffmpeg=ffmpeg)
+    for _ in range(100):
+        result = pipeline.execute([ffmpeg])
+        assert not result.success
+        assert result.error == ERROR_IO, result.log
+        assert result.log.splitlines()[0].startswith("A file could not be opened")
+        if hasattr(os, 'wait4'):
+            assert result.cpu_seconds is not None
+
+
+def test_fatal_line_kills_running_process(tmp_path):
+    ffmpeg = stub_ffmpeg(tmp_path, 'echo "[mov,mp4 @ 0x1] moov atom not found" >&2\nexec sleep 30\n')
+    started = time.monotonic()
+    result = Pipeline(ffmpeg=ffmpeg).execute([ffmpeg], timeout=20)
+    assert result.error == ERROR_INVALID_INPUT
+    assert time.monotonic() - started < 10
+
+
+def test_timeout(tmp_path):
+    ffmpeg = stub_ffmpeg(tmp_path, 'echo starting >&2\nexec sleep 30\n')
+    result = Pipeline(ffmpeg=ffmpeg).execute([ffmpeg], timeout=0.5)
+    assert result.error == ERROR_TIMEOUT
+
+
+def test_log_is_bounded(tmp_path):
+    ffmpeg = stub_ffmpeg(tmp_path, 'i=0; while [ $i -lt 1000 ]; do echo "frame= $i" >&2; i=$((i+1)); done\nexit 1\n')
+    result = Pipeline(ffmpeg=ffmpeg).execute([ffmpeg])
+    assert result.error == ERROR_FFMPEG_FAILED
+    lines = result.log.splitlines()
+    assert lines[0] == "[... 800 earlier lines omitted]"
+    assert lines[-1] == "frame= 999"
+
+
+def test_cpu_budget_keeps_frame_threading(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 16)
+    monkeypatch.setattr(pipeline_module, 'cpu_count', lambda: 2)
+    pipeline = Pipeline()
+
+    cmd = pipeline.build_command(ConversionJob('in.mp4', 'out.mp4', settings=get_profile('default').settings))
+    assert cmd[cmd.index('-threads') + 1] == '2'
+    assert '-thread_type' not in cmd
+    assert cmd[cmd.index('-x264-params') + 1] == 'threads=2'
+
+    cmd = pipeline.build_command(ConversionJob('in.mp4', 'out.mp4', settings=get_profile('interactive').settings))
+    assert cmd[cmd.index('-thread_type') + 1] == 'slice'
+    assert 'sliced-threads=1' in cmd[cmd.index('-x264-params') + 1]
+
+
+VERTICAL_BANNER = '''Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'in.mp4':
+  Duration: 00:00:10.00, start: 0.000000, bitrate: 2128 kb/s
+  Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(tv, bt709, progressive), \
+1080x1920 [SAR 1:1 DAR 9:16], 2000 kb/s, 30 fps, 30 tbr, 15360 tbn (default)
+    Metadata:
+      handler_name    : VideoHandler
+{rotation}  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706d), 48000 Hz, stereo, fltp, 128 kb/s (default)
+At least one output file must be specified
+'''
+ROTATED = '''    Side data:
+      displaymatrix: rotation of -90.00 degrees
+'''
+
+
+def banner_ffmpeg(tmp_path, rotation=''):
+    """A stub ffmpeg that prints VERTICAL_BANNER for `ffmpeg -i` and records every other command line."""
+    (tmp_path / 'banner.txt').write_text(VERTICAL_BANNER.format(rotation=rotation))
+    return stub_ffmpeg(tmp_path, f'''case "$*" in *-hide_banner*) cat "{tmp_path}/banner.txt" >&2; exit 1;; esac
+echo "$*" >> "{tmp_path}/commands.txt"
+for arg in "$@"; do last=$arg; done
+echo video > "$last"
+''')
+
+
+def test_probe_without_ffprobe_reads_the_banner(tmp_path):
+    pipeline = Pipeline(ffmpeg=banner_ffmpeg(tmp_path, ROTATED), ffprobe=str(tmp_path / 'missing-ffprobe'))
+    info = pipeline.probe(str(tmp_path / 'in.mp4'))
+    assert (info['width'], info['height'], info['duration']) == (1080, 1920, 10.0)
+    assert (info['codec_name'], info['pix_fmt'], info['audio_codec']) == ('h264', 'yuv420p', 'aac')
+    assert info['rotation'] == 270
+
+
+def test_remux_fast_path_without_ffprobe(tmp_path):
+    pipeline = Pipeline(ffmpeg=banner_ffmpeg(tmp_path), ffprobe=str(tmp_path / 'missing-ffprobe'))
+    job = ConversionJob(str(tmp_path / 'in.mp4'), str(tmp_path / 'out.mp4'), crop_percent=0, zoom_level=1)
+    result = pipeline.run(job)
+    assert result.success and result.fast_path == FAST_PATH_REMUX
+    assert '-c:v copy' in (tmp_path / 'commands.txt').read_text()
+
+
+def test_rotated_input_is_not_remuxed_without_ffprobe(tmp_path):
+    pipeline = Pipeline(ffmpeg=banner_ffmpeg(tmp_path, ROTATED), ffprobe=str(tmp_path / 'missing-ffprobe'))
+    job = ConversionJob(str(tmp_path / 'in.mp4'), str(tmp_path / 'out.mp4'), crop_percent=0, zoom_level=1)
+    result = pipeline.run(job)
+    assert result.success and result.fast_path is None
+
+
+def test_sprite_index_uses_output_duration_without_ffprobe(tmp_path):
+    assets_dir = tmp_path / 'assets'
+    assets_dir.mkdir()
+    (assets_dir / (SPRITE_PATTERN % 0)).write_bytes(b'jpeg')
+    pipeline = Pipeline(ffmpeg=banner_ffmpeg(tmp_path), ffprobe=str(tmp_path / 'missing-ffprobe'))
+    job = ConversionJob(str(tmp_path / 'in.mp4'), str(tmp_path / 'out.mp4'),
+                        settings=get_profile('api').settings, assets_dir=str(assets_dir))
+    assets = pipeline._index_assets(job)
+    cues = [line for line in open(assets['sprite_vtt']) if '-->' in line]
+    assert len(cues) == 5  # 10 s at one thumbnail every 2 s, not the profile's 60 s cap
+    assert assets['sprites'] == [str(assets_dir / (SPRITE_PATTERN % 0))]
+
+
+def test_sprite_index_stops_at_written_sheets(tmp_path):
+    (tmp_path / (SPRITE_PATTERN % 0)).write_bytes(b'jpeg')
+    assets = write_sprite_vtt(str(tmp_path), 300)
+    cues = [line for line in open(assets['sprite_vtt']) if '-->' in line]
+    assert len(cues) == SPRITE_COLUMNS * SPRITE_ROWS
+    assert len(assets['sprites']) == 1
+
+
+@pytest.mark.skipif(not hasattr(pipeline_module.resource, 'prlimit'), reason="rlimits are set with prlimit")
+def test_rlimits_reach_ffmpeg(tmp_path):
+    ffmpeg = stub_ffmpeg(tmp_path, 'sleep 0.2\necho "as=$(ulimit -v) cpu=$(ulimit -t)" >&2\n')
+    result = Pipeline(ffmpeg=ffmpeg, memory_limit_bytes=512 * 1024 * 1024, cpu_limit_seconds=30).execute([ffmpeg])
+    assert result.success
+    assert 'as=524288 cpu=30' in result.log
+
+
+def test_memory_fitting_without_ffprobe(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_module, 'cpu_count', lambda: 4)
+    pipeline = Pipeline(ffmpeg=banner_ffmpeg(tmp_path), ffprobe=str(tmp_path / 'missing-ffprobe'),
+                        memory_budget_bytes=64 * 1024 * 1024)
+    job = ConversionJob(str(tmp_path / 'in.mp4'), str(tmp_path / 'out.mp4'), settings=get_profile('default').settings)
+    assert pipeline.run(job).success
+    assert 'rc-lookahead=10' in (tmp_path / 'commands.txt').read_text()
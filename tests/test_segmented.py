@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+import pytest
+
+from vertical_studio.pipeline import ConversionJob, Pipeline
+from vertical_studio.segmented import MAX_JOIN_ATTEMPTS, SegmentedConversion, plan_segments
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="stub ffmpeg is a shell script")
+
+# Segment encodes write their output at once; the concat join hangs until killed
+STUB_FFMPEG = '''#!/bin/sh
+case "$*" in *"-f concat"*) exec sleep 30;; esac
+for arg in "$@"; do last=$arg; done
+echo segment > "$last"
+'''
+
+
+@pytest.fixture
+def segmented(tmp_path):
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(STUB_FFMPEG)
+    ffmpeg.chmod(0o755)
+    pipeline = Pipeline(ffmpeg=str(ffmpeg), ffprobe=str(tmp_path / 'missing-ffprobe'))
+    return SegmentedConversion(pipeline, root=str(tmp_path / 'segments'), segment_seconds=2)
+
+
+def test_join_timeout_keeps_segments_for_the_next_call(segmented, tmp_path):
+    input_path = str(tmp_path / 'in.mp4')
+    output_path = str(tmp_path / 'out.mp4')
+    token = segmented.create(ConversionJob(input_path, None), duration=4)
+
+    progress = segmented.advance(token, input_path, output_path, time.monotonic() + 3)
+    assert progress.done_segments == progress.total_segments == 2
+    assert progress.result is None  # Too little time left to start the join
+
+    for _ in range(MAX_JOIN_ATTEMPTS - 1):
+        progress = segmented.advance(token, input_path, output_path, time.monotonic() + 0.5)
+        assert progress.result is None and not progress.finished
+        assert segmented.load(token) is not None
+        assert len([name for name in os.listdir(segmented._dir(token)) if name.startswith('seg_')]) == 2
+
+    progress = segmented.advance(token, input_path, output_path, time.monotonic() + 0.5)
+    assert progress.result is not None and not progress.result.success
+
+
+def test_segments_never_exceed_the_segment_length():
+    segments = plan_segments(0, 14, 10)
+    assert len(segments) == 2
+    assert all(segment['end'] - segment['start'] <= 10 for segment in segments)
+    assert len(plan_segments(0, 20, 10)) == 2
+    assert segments[-1]['end'] == 14
+
+
+def test_slow_segment_is_split_instead_of_skipped(tmp_path):
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(STUB_FFMPEG)
+    ffmpeg.chmod(0o755)
+    segmented = SegmentedConversion(Pipeline(ffmpeg=str(ffmpeg), ffprobe=str(tmp_path / 'missing-ffprobe')),
+                                    root=str(tmp_path / 'segments'), segment_seconds=10)
+    input_path = str(tmp_path / 'in.mp4')
+    token = segmented.create(ConversionJob(input_path, None), duration=10)
+    manifest = segmented.load(token)
+    manifest['seconds_per_second'] = 1.0  # A whole 10 s segment would need more than the 5 s budget
+    segmented._save(token, manifest)
+
+    progress = segmented.advance(token, input_path, str(tmp_path / 'out.mp4'), time.monotonic() + 5)
+    assert progress.total_segments == 3
+    assert progress.done_segments == 3
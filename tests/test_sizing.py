@@ -0,0 +1,58 @@
+import sys
+from dataclasses import replace
+
+import pytest
+
+import vertical_studio.pipeline as pipeline_module
+from vertical_studio.pipeline import ConversionJob, Pipeline
+from vertical_studio.profiles import get_profile
+from vertical_studio.sizing import SAMPLE_CRFS, TargetSizeError, _audio_bytes_per_second, plan_target_size
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="stub ffmpeg is a shell script")
+
+# Records each command line and writes every output with a size falling with its CRF
+STUB_FFMPEG = '''#!/bin/sh
+echo "$*" >> "{commands}"
+crf=23
+next=
+for arg in "$@"; do
+  case "$next" in
+    crf) crf=$arg;;
+    out) head -c $((4000000 / crf)) /dev/zero > "$arg";;
+  esac
+  next=
+  case "$arg" in -crf) next=crf;; -y) next=out;; esac
+done
+'''
+
+
+def test_samples_use_the_final_encode_arguments(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_module, 'cpu_count', lambda: 4)
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(STUB_FFMPEG.format(commands=tmp_path / 'commands.txt'))
+    ffmpeg.chmod(0o755)
+    pipeline = Pipeline(ffmpeg=str(ffmpeg), max_threads=4)
+    settings = replace(get_profile('interactive').settings, max_bitrate_kbps=3000)
+    job = ConversionJob('in.mp4', 'out.mp4', settings=settings)
+
+    plan = plan_target_size(pipeline, job, 10_000_000, 30, has_audio=False)
+
+    commands = (tmp_path / 'commands.txt').read_text().splitlines()
+    assert len(commands) == 3
+    for command in commands:
+        assert '-threads 4 -thread_type slice' in command
+        assert 'sliced-threads=1:sync-lookahead=0:rc-lookahead=10' in command
+        assert command.count('-maxrate 3000k') == len(SAMPLE_CRFS)
+    assert plan.samples[0][1] > plan.samples[1][1]
+
+
+@pytest.mark.parametrize('bitrate, expected', [('128k', 16000), ('1M', 125000), ('128000', 16000), ('16KiB', 16384)])
+def test_audio_bitrate_suffixes(bitrate, expected):
+    settings = replace(get_profile('default').settings, audio_bitrate=bitrate)
+    assert _audio_bytes_per_second(settings, True) == expected
+
+
+def test_empty_range_is_refused_before_sampling(tmp_path):
+    pipeline = Pipeline(ffmpeg=str(tmp_path / 'missing-ffmpeg'))
+    with pytest.raises(TargetSizeError):
+        plan_target_size(pipeline, ConversionJob('in.mp4', 'out.mp4'), 10_000_000, 0)
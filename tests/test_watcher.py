@@ -0,0 +1,35 @@
+import os
+
+from vertical_studio.watcher import FolderWatcher
+
+
+def run_once(watcher, now):
+    """One main-loop pass followed by converting whatever was queued, without threads."""
+    for path in watcher._scan():
+        watcher._observe(path, now)
+    watcher._dispatch_settled(now + watcher.settle_seconds)
+    watcher.queue.put(None)
+    watcher._worker()
+
+
+def test_failed_file_is_only_retried_after_it_changes(tmp_path):
+    inbox = tmp_path / 'in'
+    inbox.mkdir()
+    clip = inbox / 'clip.mp4'
+    clip.write_bytes(b'broken')
+    calls = []
+
+    def handler(path):
+        calls.append(path)
+        return False, "FFmpeg error", None
+
+    watcher = FolderWatcher([str(inbox)], handler, str(tmp_path / 'ledger.json'), ('.mp4',), workers=1)
+    run_once(watcher, 100.0)
+    run_once(watcher, 200.0)
+    assert calls == [str(clip)]
+    assert watcher._ledger[str(clip)]['status'] == 'failed'
+
+    clip.write_bytes(b'fixed upload')
+    os.utime(clip, ns=(1, 1))
+    run_once(watcher, 300.0)
+    assert calls == [str(clip), str(clip)]
@@ -0,0 +1,29 @@
+"""
+Shared building blocks for the VEO3 Vertical Studio front ends.
+
+The public names below are resolved lazily on first access, so
+``import vertical_studio`` stays cheap for CLI tools and workers.
+"""
+import importlib
+
+_LAZY_EXPORTS = {
+    'Pipeline': 'pipeline',
+    'ConversionJob': 'pipeline',
+    'ConversionResult': 'pipeline',
+    'EncoderSettings': 'pipeline',
+}
+
+__all__ = sorted(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
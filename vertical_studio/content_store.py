@@ -0,0 +1,210 @@
+"""
+Content-addressed store for uploaded inputs.
+
+Inputs are filed under their SHA-256 digest, so a client that already
+uploaded a clip can reference it by hash and skip the upload entirely.
+The store is bounded by a byte quota and evicts the least recently used
+objects first. The quota is a hard limit: when eviction cannot make room
+(objects pinned by running jobs, or a file larger than the quota), the
+new object is refused with StoreQuotaExceeded.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+from .hashing import HASH_BLOCK_SIZE, is_sha256, sha256_file
+
+# --- Configuration ---
+DEFAULT_STORE_ROOT = os.environ.get(
+    'VS_CONTENT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'vs_content')
+)
+DEFAULT_QUOTA_BYTES = int(os.environ.get('VS_CONTENT_STORE_QUOTA_MB', '2048')) * 1024 * 1024
+
+
+class DigestMismatch(ValueError):
+    """Raised when stored content does not match the digest the client claimed."""
+
+
+class UploadTooLarge(ValueError):
+    """Raised when a streamed upload exceeds the allowed size."""
+
+
+class StoreQuotaExceeded(Exception):
+    """Raised when an object cannot fit inside the store quota, even after eviction."""
+
+
+class ContentStore:
+    """Stores files by SHA-256 digest with LRU eviction under a byte quota."""
+
+    def __init__(self, root=DEFAULT_STORE_ROOT, quota_bytes=DEFAULT_QUOTA_BYTES):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self._lock = threading.RLock()
+        self._pinned = {}
+
+    def object_path(self, digest):
+        """Returns where the object for digest lives (whether or not it exists)."""
+        if not is_sha256(digest):
+            raise ValueError(f"Invalid SHA-256 digest: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        """Returns True if the store holds digest, marking it as recently used."""
+        try:
+            path = self.object_path(digest)
+        except ValueError:
+            return False
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def size(self, digest):
+        """Returns the stored object's size in bytes, or None if it is missing."""
+        try:
+            return os.path.getsize(self.object_path(digest))
+        except (OSError, ValueError):
+            return None
+
+    def put_file(self, src_path, expected_digest=None, move=False):
+        """Adds a file to the store and returns its digest.
+
+        The digest is always computed server-side; if expected_digest is given
+        and does not match, DigestMismatch is raised and nothing is stored.
+        """
+        digest = sha256_file(src_path)
+        if expected_digest and expected_digest != digest:
+            raise DigestMismatch(f"Upload hash {digest} does not match declared hash {expected_digest}")
+        self.adopt(src_path, digest, move=move)
+        return digest
+
+    def put_stream(self, stream, expected_digest=None, expected_bytes=0, max_bytes=None,
+                   block_size=HASH_BLOCK_SIZE):
+        """Adds the bytes read from a file-like stream and returns their digest.
+
+        The stream is copied to disk in block_size pieces and hashed on the
+        way, so memory use does not depend on the upload size. The bytes are
+        staged inside the store, so filing them is a rename, not a copy.
+        Raises DigestMismatch like put_file, UploadTooLarge once more than
+        max_bytes arrive, and StoreQuotaExceeded if the bytes cannot fit.
+        """
+        self.ensure_capacity(expected_bytes)
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f'.incoming-{uuid.uuid4().hex}')
+        hasher = hashlib.sha256()
+        received = 0
+        try:
+            with open(staging, 'wb') as f:
+                while True:
+                    block = stream.read(block_size)
+                    if not block:
+                        break
+                    received += len(block)
+                    if max_bytes is not None and received > max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {max_bytes // (1024 * 1024)} MB")
+                    hasher.update(block)
+                    f.write(block)
+            digest = hasher.hexdigest()
+            if expected_digest and expected_digest != digest:
+                raise DigestMismatch(f"Upload hash {digest} does not match declared hash {expected_digest}")
+            if received == 0:
+                raise ValueError("Upload is empty")
+            self.adopt(staging, digest, move=True)
+            return digest
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+
+    def adopt(self, src_path, digest, move=False):
+        """Files src_path under an already verified digest. Raises StoreQuotaExceeded if it cannot fit."""
+        dest = self.object_path(digest)
+        if self.has(digest):
+            if move:
+                os.remove(src_path)
+            return dest
+        self.ensure_capacity(os.path.getsize(src_path))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        staging = os.path.join(os.path.dirname(dest), f'.incoming-{uuid.uuid4().hex}')
+        try:
+            if move:
+                shutil.move(src_path, staging)
+            else:
+                shutil.copyfile(src_path, staging)
+            os.replace(staging, dest)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        return dest
+
+    @contextmanager
+    def hold(self, digest):
+        """Yields the object's path, pinned against eviction while the block runs."""
+        if not self.has(digest):
+            raise KeyError(digest)
+        with self._lock:
+            self._pinned[digest] = self._pinned.get(digest, 0) + 1
+        try:
+            yield self.object_path(digest)
+        finally:
+            with self._lock:
+                self._pinned[digest] -= 1
+                if not self._pinned[digest]:
+                    del self._pinned[digest]
+
+    def usage(self):
+        """Returns the total size in bytes of all stored objects."""
+        return sum(size for _digest, _path, size, _atime in self._objects())
+
+    def ensure_capacity(self, needed_bytes):
+        """Evicts unpinned objects, least recently used first, until needed_bytes fit.
+
+        Raises StoreQuotaExceeded if they still do not fit.
+        """
+        with self._lock:
+            objects = sorted(self._objects(), key=lambda o: o[3])
+            used = sum(o[2] for o in objects)
+            pinned = sum(o[2] for o in objects if o[0] in self._pinned)
+            # Refuse before evicting anything if even evicting every unpinned object would not do
+            if pinned + needed_bytes > self.quota_bytes:
+                raise self._quota_exceeded(needed_bytes, pinned)
+            for digest, path, size, _atime in objects:
+                if used + needed_bytes <= self.quota_bytes:
+                    break
+                if digest in self._pinned:
+                    continue
+                try:
+                    os.remove(path)
+                    used -= size
+                except OSError:
+                    pass
+            if used + needed_bytes > self.quota_bytes:  # An eviction failed
+                raise self._quota_exceeded(needed_bytes, used)
+
+    def _quota_exceeded(self, needed_bytes, used):
+        return StoreQuotaExceeded(
+            f"Input store quota exceeded: {needed_bytes} bytes requested, "
+            f"{max(self.quota_bytes - used, 0)} of {self.quota_bytes} bytes available"
+        )
+
+    def _objects(self):
+        """Yields (digest, path, size, last_used) for every stored object."""
+        try:
+            shards = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(shard.path):
+                if not is_sha256(entry.name):
+                    continue
+                try:
+                    stats = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                yield entry.name, entry.path, stats.st_size, stats.st_mtime
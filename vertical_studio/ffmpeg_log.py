@@ -0,0 +1,103 @@
+"""
+Bounded, incremental capture of ffmpeg's stderr with early failure detection.
+
+ffmpeg can log for as long as it runs, so FFmpegLog keeps only the last
+max_lines lines (each cut to MAX_LINE_CHARS). Every line is checked against
+FATAL_PATTERNS as it arrives: the first match records a structured error
+code and the offending line and calls on_fatal, which lets the pipeline
+kill a doomed encode right away instead of waiting for it to exit or time
+out. Decode errors are normal in small numbers (ffmpeg conceals them), so
+they only count as fatal once there are more than decode_error_limit.
+"""
+import os
+import re
+from collections import deque
+
+# --- Configuration ---
+DEFAULT_MAX_LINES = int(os.environ.get('VS_FFMPEG_LOG_LINES', '200'))
+DEFAULT_DECODE_ERROR_LIMIT = int(os.environ.get('VS_FFMPEG_DECODE_ERROR_LIMIT', '200'))
+MAX_LINE_CHARS = 1000
+
+# Error codes for failures recognized in the log (ConversionResult.error)
+ERROR_INVALID_INPUT = 'invalid_input'
+ERROR_CORRUPT_INPUT = 'corrupt_input'
+ERROR_UNSUPPORTED_CODEC = 'unsupported_codec'
+ERROR_MISSING_STREAM = 'missing_stream'
+ERROR_FILTER = 'filter_error'
+ERROR_IO = 'io_error'
+ERROR_DISK_FULL = 'disk_full'
+ERROR_OUT_OF_MEMORY = 'out_of_memory'
+
+# (pattern, error code, description); the first match wins
+FATAL_PATTERNS = (
+    (re.compile(r'moov atom not found|^(?!.*Error while decoding).*Invalid data found when processing input'),
+     ERROR_INVALID_INPUT, "The input is not a readable video"),
+    # Not "Unsupported codec with id ...": ffmpeg only warns about that for ignored data streams
+    (re.compile(r'(?:Decoder|Encoder) \(codec \S+\) not found|Unknown (?:en|de)coder|'
+                r'Decoding requested, but no decoder found'),
+     ERROR_UNSUPPORTED_CODEC, "The input uses a codec this ffmpeg cannot handle"),
+    (re.compile(r'Stream specifier .* matches no streams|does not contain any stream'),
+     ERROR_MISSING_STREAM, "The input has no usable video stream"),
+    (re.compile(r'No such filter|Error (?:initializing|reinitializing|configuring) (?:complex )?filter|'
+                r'Failed to configure (?:input|output) pad'),
+     ERROR_FILTER, "The filter graph could not be set up"),
+    (re.compile(r'No space left on device'), ERROR_DISK_FULL, "The disk is full"),
+    (re.compile(r'No such file or directory|Permission denied'), ERROR_IO, "A file could not be opened"),
+    (re.compile(r'Cannot allocate memory|[Oo]ut of memory'), ERROR_OUT_OF_MEMORY, "FFmpeg ran out of memory"),
+)
+DECODE_ERROR_PATTERN = re.compile(r'Error while decoding|error while decoding|Invalid NAL unit|corrupt decoded frame')
+
+
+class FFmpegLog:
+    """Collects ffmpeg stderr lines into a ring buffer and classifies fatal errors as they appear."""
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, decode_error_limit=DEFAULT_DECODE_ERROR_LIMIT, on_fatal=None):
+        self.lines = deque(maxlen=max_lines)
+        self.decode_error_limit = decode_error_limit
+        self.on_fatal = on_fatal
+        self.total_lines = 0
+        self.decode_errors = 0
+        self.error = None          # One of the ERROR_* codes above once a fatal line was seen
+        self.description = None
+        self.fatal_line = None
+
+    def consume(self, stream):
+        """Feeds every line of a text stream until it closes."""
+        for line in stream:
+            self.feed(line)
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')[:MAX_LINE_CHARS]
+        if not line:
+            return
+        self.total_lines += 1
+        self.lines.append(line)
+        if self.error is not None:
+            return
+        for pattern, code, description in FATAL_PATTERNS:
+            if pattern.search(line):
+                self._fatal(code, description, line)
+                return
+        if DECODE_ERROR_PATTERN.search(line):
+            self.decode_errors += 1
+            if self.decode_errors > self.decode_error_limit:
+                self._fatal(ERROR_CORRUPT_INPUT, f"More than {self.decode_error_limit} decode errors", line)
+
+    def _fatal(self, code, description, line):
+        self.error, self.description, self.fatal_line = code, description, line
+        if self.on_fatal is not None:
+            self.on_fatal()
+
+    def summary(self):
+        """One line naming the recognized error and the log line that showed it, or None."""
+        if self.error is None:
+            return None
+        return f"{self.description}: {self.fatal_line.strip()}"
+
+    def text(self):
+        """The retained tail of the log, noting how many earlier lines were dropped."""
+        dropped = self.total_lines - len(self.lines)
+        lines = list(self.lines)
+        if dropped:
+            lines.insert(0, f"[... {dropped} earlier lines omitted]")
+        return '\n'.join(lines)
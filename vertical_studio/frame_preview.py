@@ -0,0 +1,164 @@
+"""
+Still-frame previews composited in-process for interactive framing.
+
+The first preview of an input decodes one source frame with ffmpeg. Every
+later slider change is composited with Pillow from cached layers. The
+layout reproduces build_filter_graph (crop, cover-scaled blurred background
+or black pad, centered foreground) at proxy resolution, so a crop or zoom
+change costs a few milliseconds instead of an upload and an encode.
+
+Layers are cached in memory with LRU eviction:
+
+- decoded source frames, keyed by input and timestamp;
+- base layers (the cropped frame and its blurred background), which do not
+  depend on zoom, keyed by input, timestamp, crop and background settings;
+- the finished JPEGs, keyed by everything.
+
+Pillow is imported on first use, so the API starts without it.
+"""
+import hashlib
+import io
+import subprocess
+import threading
+from collections import OrderedDict
+
+from .pipeline import OUTPUT_HEIGHT, OUTPUT_WIDTH, PREVIEW_SCALE, _even, _scaled_blur
+
+PREVIEW_WIDTH = _even(OUTPUT_WIDTH * PREVIEW_SCALE)
+PREVIEW_HEIGHT = _even(OUTPUT_HEIGHT * PREVIEW_SCALE)
+# Sources are decoded wide enough for the largest zoom without upscaling artifacts
+SOURCE_WIDTH = PREVIEW_WIDTH * 2
+JPEG_QUALITY = 80
+FRAME_TIMEOUT_SECONDS = 15
+
+# ffmpeg scale flags -> name of the closest Pillow resampling filter
+RESAMPLING = {
+    'fast_bilinear': 'BILINEAR', 'bilinear': 'BILINEAR', 'bicubic': 'BICUBIC',
+    'lanczos': 'LANCZOS', 'neighbor': 'NEAREST', 'area': 'BOX',
+}
+
+
+class FrameDecodeError(RuntimeError):
+    """Raised when ffmpeg cannot produce a frame at the requested time."""
+
+
+class _LRU:
+    """A small thread-safe LRU mapping."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FramePreviewer:
+    """Composites proxy-resolution JPEG previews from cached frames and layers."""
+
+    def __init__(self, pipeline, max_frames=16, max_layers=64, max_images=256):
+        self.pipeline = pipeline
+        self.frames = _LRU(max_frames)
+        self.layers = _LRU(max_layers)
+        self.images = _LRU(max_images)
+
+    def render(self, input_key, input_path, crop_percent, zoom_level, settings, at=0.0):
+        """Returns (jpeg_bytes, etag, cache_hit) for the framing at time `at` of the input.
+
+        input_key identifies the input content (its SHA-256 in the API).
+        Raises FrameDecodeError if no frame can be decoded at that time.
+        """
+        at = round(at, 2)
+        crop_percent = round(crop_percent, 4)
+        zoom_level = round(zoom_level, 4)
+        layer_key = (input_key, at, crop_percent, settings.background, settings.blur, settings.scale_flags)
+        image_key = layer_key + (zoom_level,)
+        etag = hashlib.sha256(repr(image_key).encode('utf-8')).hexdigest()[:32]
+
+        jpeg = self.images.get(image_key)
+        if jpeg is not None:
+            return jpeg, etag, True
+
+        layers = self.layers.get(layer_key)
+        if layers is None:
+            layers = self._base_layers(self._frame(input_key, input_path, at), crop_percent, settings)
+            self.layers.put(layer_key, layers)
+        canvas = self._composite(layers, zoom_level, settings)
+
+        buffer = io.BytesIO()
+        canvas.save(buffer, 'JPEG', quality=JPEG_QUALITY)
+        jpeg = buffer.getvalue()
+        self.images.put(image_key, jpeg)
+        return jpeg, etag, False
+
+    def _frame(self, input_key, input_path, at):
+        """Decodes (or recalls) the source frame at `at`, scaled to SOURCE_WIDTH at most."""
+        frame = self.frames.get((input_key, at))
+        if frame is not None:
+            return frame
+        cmd = [
+            self.pipeline.ffmpeg, '-v', 'error', '-ss', f'{at:.3f}', '-i', input_path, '-frames:v', '1',
+            '-vf', f"scale='min({SOURCE_WIDTH},iw)':-2", '-c:v', 'bmp', '-f', 'image2pipe', '-'
+        ]
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=FRAME_TIMEOUT_SECONDS)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise FrameDecodeError(f"Could not run ffmpeg: {e}")
+        if result.returncode != 0 or not result.stdout:
+            raise FrameDecodeError(result.stderr.decode('utf-8', 'replace')[-200:] or f"No frame at {at:.1f}s")
+        from PIL import Image
+        frame = Image.open(io.BytesIO(result.stdout)).convert('RGB')
+        self.frames.put((input_key, at), frame)
+        return frame
+
+    def _base_layers(self, frame, crop_percent, settings):
+        """Returns (cropped frame, background) as the graph's crop and background branches produce them."""
+        width, height = frame.size
+        top = int(height * crop_percent)
+        cropped = frame.crop((0, top, width, top + max(1, int(height * (1 - 2 * crop_percent)))))
+        if settings.background == 'black':
+            return cropped, None
+
+        # scale=W:H:force_original_aspect_ratio=increase, boxblur, centered crop=W:H
+        from PIL import Image, ImageFilter
+        resample = getattr(Image, RESAMPLING.get(settings.scale_flags, 'BICUBIC'))
+        factor = max(PREVIEW_WIDTH / cropped.width, PREVIEW_HEIGHT / cropped.height)
+        covered = cropped.resize((max(PREVIEW_WIDTH, round(cropped.width * factor)),
+                                  max(PREVIEW_HEIGHT, round(cropped.height * factor))), resample)
+        radius, _, power = _scaled_blur(settings.blur, PREVIEW_WIDTH / OUTPUT_WIDTH).partition(':')
+        for _ in range(int(power or 2)):
+            covered = covered.filter(ImageFilter.BoxBlur(int(radius)))
+        left = (covered.width - PREVIEW_WIDTH) // 2
+        top = (covered.height - PREVIEW_HEIGHT) // 2
+        return cropped, covered.crop((left, top, left + PREVIEW_WIDTH, top + PREVIEW_HEIGHT))
+
+    def _composite(self, layers, zoom_level, settings):
+        """Scales the foreground for zoom_level and centers it on the background (or black)."""
+        from PIL import Image
+        cropped, background = layers
+        resample = getattr(Image, RESAMPLING.get(settings.scale_flags, 'BICUBIC'))
+        main_width = int(PREVIEW_WIDTH * zoom_level)
+        main_height = max(1, round(cropped.height * main_width / cropped.width))
+        if settings.background == 'black':
+            main_height = _even(main_height)  # scale=W:-2
+        main = cropped.resize((main_width, main_height), resample)
+
+        canvas = background.copy() if background is not None else Image.new('RGB', (PREVIEW_WIDTH, PREVIEW_HEIGHT))
+        # Negative offsets clip the oversized foreground like overlay (and crop+pad) do
+        canvas.paste(main, ((PREVIEW_WIDTH - main_width) // 2, (PREVIEW_HEIGHT - main_height) // 2))
+        return canvas
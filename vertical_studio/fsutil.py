@@ -0,0 +1,20 @@
+"""Small filesystem helpers shared by the CLI tools."""
+import json
+import os
+import tempfile
+
+
+def atomic_write_json(path, data):
+    """Writes data as JSON so readers only ever see the old or the new file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,21 @@
+"""Content hashing helpers shared by the upload, storage and batch code."""
+import hashlib
+import re
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def is_sha256(value):
+    """Returns True if value is a lowercase hex SHA-256 digest."""
+    return isinstance(value, str) and bool(_SHA256_RE.match(value))
+
+
+def sha256_file(path, block_size=HASH_BLOCK_SIZE):
+    """Returns the hex SHA-256 digest of a file, read in fixed-size blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,222 @@
+"""
+Durable conversion job queue.
+
+API nodes enqueue jobs; any number of worker processes, on any machine that
+shares the queue and the content/output stores, claim them under a lease.
+A worker renews its lease with heartbeats while it encodes. If it crashes,
+the lease runs out and the job is handed to another worker, up to
+max_attempts claims.
+
+JobQueue is the interface a network broker would implement; SQLiteJobQueue
+keeps the queue in a local (or shared-filesystem) SQLite file.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+
+# --- Configuration ---
+DEFAULT_QUEUE_PATH = os.environ.get(
+    'VS_JOB_QUEUE_PATH', os.path.join(tempfile.gettempdir(), 'vs_jobs.sqlite3')
+)
+DEFAULT_LEASE_SECONDS = int(os.environ.get('VS_JOB_LEASE_SECONDS', '60'))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get('VS_JOB_MAX_ATTEMPTS', '3'))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@dataclass
+class QueuedJob:
+    """A job as stored in the queue. payload and result are JSON-serializable dicts."""
+    job_id: str
+    payload: dict
+    status: str
+    attempts: int = 0
+    worker_id: str = None
+    lease_expires: float = None
+    result: dict = None
+    error: str = None
+    created: float = None
+    updated: float = None
+
+
+def conversion_payload(input_hash, output_id, options, settings, timeout=None, download_name='vertical_video.mp4'):
+    """Builds the payload for converting a stored input into output_id with EncoderSettings settings.
+
+    options holds crop, zoom, start_time, end_time and optionally target_bytes and thumbnails.
+    """
+    return {
+        'input_hash': input_hash, 'output_id': output_id,
+        'crop': options['crop'], 'zoom': options['zoom'],
+        'start_time': options['start_time'], 'end_time': options['end_time'],
+        'target_bytes': options.get('target_bytes'), 'thumbnails': options.get('thumbnails', False),
+        'settings': asdict(settings), 'timeout': timeout, 'download_name': download_name,
+    }
+
+
+class JobQueue(ABC):
+    """Interface for durable job queues; see SQLiteJobQueue."""
+
+    @abstractmethod
+    def enqueue(self, payload, job_id=None):
+        """Adds a job and returns its id. Enqueuing an existing id returns it unchanged."""
+
+    @abstractmethod
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Leases the oldest runnable job to worker_id and returns it, or None if there is none."""
+
+    @abstractmethod
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extends worker_id's lease; returns False if the worker no longer holds the job."""
+
+    @abstractmethod
+    def complete(self, job_id, worker_id, result=None):
+        """Marks a leased job done; returns False if the worker no longer holds the job."""
+
+    @abstractmethod
+    def fail(self, job_id, worker_id, error, retry=True):
+        """Releases a leased job after an error, requeuing it if retry and attempts remain."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Returns the QueuedJob for job_id, or None."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """JobQueue backed by a SQLite file; safe across threads and processes.
+
+    Every operation opens its own connection and claims run in an IMMEDIATE
+    transaction, so concurrent workers never lease the same job. Place the
+    file on storage every node can lock (a local disk for one machine).
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            # WAL lets status polls read while a claim writes (it needs a local, not NFS, filesystem)
+            db.execute('PRAGMA journal_mode=WAL')
+        finally:
+            db.close()
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' job_id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT, lease_expires REAL,'
+                ' result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, lease_expires, created)')
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return _Transaction(db)
+
+    def enqueue(self, payload, job_id=None):
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR IGNORE INTO jobs (job_id, payload, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+                (job_id, json.dumps(payload), QUEUED, now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._connect() as db:
+            # Jobs whose worker stopped heartbeating are runnable again
+            while True:
+                row = db.execute(
+                    'SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?)'
+                    ' ORDER BY created LIMIT 1', (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row['attempts'] < self.max_attempts:
+                    break
+                db.execute(
+                    'UPDATE jobs SET status = ?, worker_id = NULL, lease_expires = NULL, updated = ?,'
+                    ' error = COALESCE(error, ?) WHERE job_id = ?',
+                    (FAILED, now, f"Gave up after {row['attempts']} attempts", row['job_id'])
+                )
+            db.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, worker_id = ?, lease_expires = ?,'
+                ' updated = ? WHERE job_id = ?',
+                (RUNNING, worker_id, now + lease_seconds, now, row['job_id'])
+            )
+            return self._job(db.execute('SELECT * FROM jobs WHERE job_id = ?', (row['job_id'],)).fetchone())
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                'UPDATE jobs SET lease_expires = ?, updated = ? WHERE job_id = ? AND worker_id = ? AND status = ?',
+                (now + lease_seconds, now, job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        with self._connect() as db:
+            cursor = db.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated = ?'
+                ' WHERE job_id = ? AND worker_id = ? AND status = ?',
+                (DONE, json.dumps(result), time.time(), job_id, worker_id, RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error, retry=True):
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT attempts FROM jobs WHERE job_id = ? AND worker_id = ? AND status = ?',
+                (job_id, worker_id, RUNNING)
+            ).fetchone()
+            if row is None:
+                return False
+            status = QUEUED if retry and row['attempts'] < self.max_attempts else FAILED
+            db.execute(
+                'UPDATE jobs SET status = ?, error = ?, worker_id = NULL, lease_expires = NULL, updated = ?'
+                ' WHERE job_id = ?', (status, error, time.time(), job_id)
+            )
+            return True
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    @staticmethod
+    def _job(row):
+        return QueuedJob(
+            row['job_id'], json.loads(row['payload']), row['status'], row['attempts'], row['worker_id'],
+            row['lease_expires'], json.loads(row['result']) if row['result'] else None, row['error'],
+            row['created'], row['updated']
+        )
+
+
+class _Transaction:
+    """Runs a block in one IMMEDIATE transaction and closes the connection afterwards."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.db.close()
@@ -0,0 +1,151 @@
+"""
+Retention store for converted outputs.
+
+Each output is kept for a retention window under a deterministic id derived
+from the input digest and the conversion parameters, together with a strong
+ETag (the SHA-256 of the output bytes). That lets the HTTP layer serve
+conditional and Range requests, so interrupted downloads resume and players
+seek without converting again, and an identical request within the window is
+answered from the store.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from .hashing import sha256_file
+
+# --- Configuration ---
+DEFAULT_OUTPUT_ROOT = os.environ.get(
+    'VS_OUTPUT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'vs_outputs')
+)
+DEFAULT_RETENTION_SECONDS = int(os.environ.get('VS_OUTPUT_RETENTION_SECONDS', '3600'))
+DEFAULT_QUOTA_BYTES = int(os.environ.get('VS_OUTPUT_STORE_QUOTA_MB', '2048')) * 1024 * 1024
+META_FILENAME = 'meta.json'
+OUTPUT_FILENAME = 'output.mp4'
+
+
+def output_key(input_digest, params):
+    """Returns a stable output id for an input digest and its conversion parameters."""
+    canonical = json.dumps({'input': input_digest, 'params': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class OutputStore:
+    """Keeps converted outputs addressable for a retention window."""
+
+    def __init__(self, root=DEFAULT_OUTPUT_ROOT, retention_seconds=DEFAULT_RETENTION_SECONDS,
+                 quota_bytes=DEFAULT_QUOTA_BYTES):
+        self.root = root
+        self.retention_seconds = retention_seconds
+        self.quota_bytes = quota_bytes
+        self._lock = threading.Lock()
+
+    def get(self, output_id):
+        """Returns the metadata (including 'path') for a live output, or None."""
+        if not isinstance(output_id, str) or not output_id.isalnum():
+            return None
+        entry_dir = os.path.join(self.root, output_id)
+        try:
+            with open(os.path.join(entry_dir, META_FILENAME)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta['created'] + self.retention_seconds < time.time():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        meta['path'] = os.path.join(entry_dir, OUTPUT_FILENAME)
+        return meta
+
+    def put(self, output_id, src_path, download_name='vertical_video.mp4', move=True, extra=None, asset_paths=()):
+        """Stores src_path under output_id and returns its metadata.
+
+        asset_paths are side files (poster, sprites) kept alongside the output
+        under their base names; meta['assets'] lists those names.
+        """
+        self.purge_expired()
+        self._ensure_capacity(os.path.getsize(src_path))
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f'.incoming-{uuid.uuid4().hex}')
+        os.makedirs(staging)
+        try:
+            output_path = os.path.join(staging, OUTPUT_FILENAME)
+            if move:
+                shutil.move(src_path, output_path)
+            else:
+                shutil.copyfile(src_path, output_path)
+            assets = []
+            for asset_path in asset_paths:
+                name = os.path.basename(asset_path)
+                shutil.copyfile(asset_path, os.path.join(staging, name))
+                assets.append(name)
+            meta = {
+                'output_id': output_id,
+                'etag': sha256_file(output_path),
+                'size': os.path.getsize(output_path),
+                'created': time.time(),
+                'download_name': download_name,
+                'assets': assets,
+            }
+            meta.update(extra or {})
+            with open(os.path.join(staging, META_FILENAME), 'w') as f:
+                json.dump(meta, f)
+            entry_dir = os.path.join(self.root, output_id)
+            with self._lock:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(staging, entry_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        meta['path'] = os.path.join(entry_dir, OUTPUT_FILENAME)
+        return meta
+
+    def asset_path(self, output_id, name):
+        """Returns the path of a side file stored with a live output, or None."""
+        meta = self.get(output_id)
+        if meta is None or name not in meta.get('assets', ()):
+            return None
+        return os.path.join(os.path.dirname(meta['path']), name)
+
+    def purge_expired(self):
+        """Deletes outputs past their retention window. Returns how many were removed."""
+        removed = 0
+        cutoff = time.time() - self.retention_seconds
+        for output_id, entry_dir, _size, created in self._entries():
+            if created < cutoff:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def usage(self):
+        """Returns the total size in bytes of all retained outputs."""
+        return sum(size for _output_id, _entry_dir, size, _created in self._entries())
+
+    def _ensure_capacity(self, needed_bytes):
+        """Drops the oldest outputs until needed_bytes fit inside the quota."""
+        entries = sorted(self._entries(), key=lambda e: e[3])
+        used = sum(e[2] for e in entries)
+        for _output_id, entry_dir, size, _created in entries:
+            if used + needed_bytes <= self.quota_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            used -= size
+
+    def _entries(self):
+        """Yields (output_id, entry_dir, size, created) for every stored output."""
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                with open(os.path.join(entry.path, META_FILENAME)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield entry.name, entry.path, meta.get('size', 0), meta.get('created', 0)
@@ -0,0 +1,918 @@
+"""
+Core conversion pipeline shared by the Streamlit apps, the Flask API and the CLI.
+
+This module only depends on the standard library so that CLI and worker
+processes start quickly; UI frameworks and Pillow are never imported here.
+
+Typical use::
+
+    pipeline = Pipeline()
+    job = ConversionJob('in.mp4', 'out.mp4', crop_percent=0.09, zoom_level=1.2)
+    result = pipeline.run(job)
+    if not result.success:
+        print(result.error, result.log)
+"""
+import json
+import math
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits or rusage
+    resource = None
+
+from .ffmpeg_log import (ERROR_CORRUPT_INPUT, ERROR_DISK_FULL, ERROR_FILTER, ERROR_INVALID_INPUT, ERROR_IO,
+                         ERROR_MISSING_STREAM, ERROR_OUT_OF_MEMORY, ERROR_UNSUPPORTED_CODEC, FFmpegLog)
+from .resources import PRESET_LOOKAHEAD, MemoryModel, cpu_count
+
+OUTPUT_WIDTH = 1080
+OUTPUT_HEIGHT = 1920
+
+# Preview clips: a short excerpt at a third of the output resolution.
+PREVIEW_SCALE = 1 / 3
+PREVIEW_SECONDS = 2.5
+PREVIEW_PRESET = 'ultrafast'
+PREVIEW_CRF = 30
+
+# Seek-preview assets written next to the encode when ConversionJob.assets_dir is set:
+# a poster frame and tiled thumbnail sprites indexed by a WebVTT file.
+POSTER_FILENAME = 'poster.jpg'
+POSTER_SECONDS = 1.0
+SPRITE_PATTERN = 'sprite_%03d.jpg'
+SPRITE_VTT_FILENAME = 'sprite.vtt'
+SPRITE_INTERVAL_SECONDS = 2.0
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 5
+THUMB_WIDTH = 180
+THUMB_HEIGHT = 320
+
+# Stitched clips are normalized to one frame rate and audio format before the concat.
+STITCH_FPS = 30
+STITCH_AUDIO_RATE = 48000
+
+# Inputs matching these constraints can be stream-copied instead of re-encoded.
+REMUX_VIDEO_CODECS = ('h264',)
+REMUX_PIXEL_FORMATS = ('yuv420p', 'yuvj420p')
+REMUX_AUDIO_CODECS = ('aac', 'mp3')
+FAST_PATH_REMUX = 'remux'
+
+# Input section of `ffmpeg -i`, read when ffprobe is not installed
+BANNER_DURATION = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+BANNER_STREAM = re.compile(r'\s*Stream #\S+: (Video|Audio): (\w+)(.*)')
+BANNER_DISPLAYMATRIX = re.compile(r'displaymatrix: rotation of (-?\d+(?:\.\d+)?) degrees')
+BANNER_ROTATE_TAG = re.compile(r'^\s*rotate\s*: (-?\d+)', re.MULTILINE)
+
+# Error codes reported in ConversionResult.error
+ERROR_FFMPEG_MISSING = 'ffmpeg_missing'
+ERROR_FFMPEG_FAILED = 'ffmpeg_failed'
+ERROR_TIMEOUT = 'timeout'
+ERROR_UNEXPECTED = 'unexpected'
+ERROR_RESOURCE_LIMIT = 'resource_limit'
+# Failures recognized from ffmpeg's log (see ffmpeg_log.FATAL_PATTERNS); the encode is killed on sight
+LOG_ERRORS = (ERROR_INVALID_INPUT, ERROR_CORRUPT_INPUT, ERROR_UNSUPPORTED_CODEC, ERROR_MISSING_STREAM,
+              ERROR_FILTER, ERROR_IO, ERROR_DISK_FULL, ERROR_OUT_OF_MEMORY)
+
+
+@dataclass(frozen=True)
+class EncoderSettings:
+    """Everything about an encode that is independent of the input and the framing.
+
+    Fields left as None are not passed to ffmpeg, so ffmpeg's defaults apply.
+    """
+    preset: str = 'medium'
+    crf: int = 23
+    tune: str = None
+    scale_flags: str = None          # e.g. 'bilinear'; None keeps ffmpeg's default (bicubic)
+    blur: str = '20:10'              # boxblur luma_radius:luma_power for the background
+    background: str = 'blur'         # 'blur' (blurred fill) or 'black' (letterbox padding)
+    audio_bitrate: str = None        # e.g. '128k'; None keeps ffmpeg's default
+    audio_channels: int = None
+    max_threads: int = None          # None: the CPU budget, frame threads; otherwise min(budget, max_threads), sliced
+    rc_lookahead: int = None
+    faststart: bool = False
+    max_duration: float = None       # Output-side duration limit in seconds
+    max_bitrate_kbps: int = None     # VBV cap (-maxrate); -bufsize defaults to twice this
+
+
+@dataclass
+class ConversionJob:
+    """One input converted to one vertical output with a given framing.
+
+    start_time/end_time (seconds, optional) select the part of the input to
+    convert; see validate_trim. With assets_dir, a poster frame and a seek
+    sprite with its WebVTT index are written there from the same decode.
+    video_only drops the audio (used for segments that are joined later).
+    """
+    input_path: str
+    output_path: str
+    crop_percent: float = 0.09
+    zoom_level: float = 1.0
+    settings: EncoderSettings = field(default_factory=EncoderSettings)
+    start_time: float = None
+    end_time: float = None
+    assets_dir: str = None
+    video_only: bool = False
+
+    @property
+    def is_trimmed(self):
+        return bool(self.start_time) or self.end_time is not None
+
+    def input_trim_args(self):
+        """Input-side options that seek to the trim start and stop reading at its end.
+
+        Seeking before -i jumps to the nearest keyframe without decoding the
+        skipped part; because the video is re-encoded, ffmpeg then discards the
+        frames up to the exact start (accurate_seek), so the cut is frame-exact.
+        """
+        return _trim_args(self.start_time, self.end_time)
+
+
+@dataclass
+class StitchClip:
+    """One clip of a stitched output, with its own framing and optional trim (see validate_trim)."""
+    input_path: str
+    crop_percent: float = 0.09
+    zoom_level: float = 1.0
+    start_time: float = None
+    end_time: float = None
+
+
+@dataclass
+class StitchJob:
+    """Ordered clips joined into one vertical output with a single decode and encode.
+
+    Every clip is framed with its own crop and zoom, converted to fps and to
+    stereo audio at STITCH_AUDIO_RATE (silence for clips without audio), and
+    the results are concatenated in the filter graph before the encoder.
+    """
+    clips: list
+    output_path: str
+    settings: EncoderSettings = field(default_factory=EncoderSettings)
+    fps: float = STITCH_FPS
+
+
+def _trim_args(start_time, end_time):
+    args = []
+    if start_time:
+        args += ['-ss', f'{start_time:.3f}']
+    if end_time is not None:
+        args += ['-t', f'{end_time - (start_time or 0):.3f}']
+    return args
+
+
+def validate_trim(start_time, end_time, duration=None, max_length=None):
+    """Normalizes a requested trim range, raising ValueError with a user-facing message.
+
+    Returns (start_time, end_time) where start_time is None for "from the
+    beginning" and end_time is None for "to the end".
+    """
+    start_time = float(start_time) if start_time not in (None, '') else None
+    end_time = float(end_time) if end_time not in (None, '') else None
+    if start_time is not None and start_time < 0:
+        raise ValueError("Trim start cannot be negative")
+    if duration is not None:
+        if start_time is not None and start_time >= duration:
+            raise ValueError(f"Trim start {start_time:.1f}s is past the end of the video ({duration:.1f}s)")
+        if end_time is not None and end_time >= duration:
+            end_time = None
+    if end_time is not None and end_time <= (start_time or 0):
+        raise ValueError("Trim end must be after trim start")
+    if max_length is not None:
+        end = end_time if end_time is not None else duration
+        if end is not None and end - (start_time or 0) > max_length:
+            raise ValueError(f"Selected range is {end - (start_time or 0):.0f}s; the maximum is {max_length:.0f}s")
+    return (start_time or None), end_time
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of Pipeline.run; error is None on success, otherwise one of the ERROR_* codes.
+
+    log holds the tail of ffmpeg's output. For ERROR_RESOURCE_LIMIT and the
+    LOG_ERRORS its first line explains the failure.
+    """
+    success: bool
+    log: str = ''
+    error: str = None
+    elapsed_seconds: float = 0.0
+    command: list = None
+    output_path: str = None
+    fast_path: str = None            # FAST_PATH_REMUX when the input was stream-copied
+    assets: dict = None              # 'poster', 'sprite_vtt' and 'sprites' paths when assets_dir was set
+    peak_rss_bytes: int = None       # ffmpeg's peak resident memory (POSIX only)
+    cpu_seconds: float = None        # ffmpeg's user + system CPU time (POSIX only)
+
+
+def _scale_filter(width, height, flags, extra=''):
+    options = f'{width}:{height}{extra}'
+    if flags:
+        options += f':flags={flags}'
+    return f'scale={options}'
+
+
+def _scaled_blur(blur, factor):
+    """Scales a boxblur 'radius:power' spec so a smaller canvas looks equally blurred."""
+    radius, _, power = blur.partition(':')
+    radius = max(1, round(float(radius) * factor))
+    return f'{radius}:{power}' if power else str(radius)
+
+
+def _even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+
+def build_filter_graph(crop_percent, zoom_level, settings, width=OUTPUT_WIDTH, height=OUTPUT_HEIGHT,
+                       source='0:v', tag=''):
+    """Returns the -filter_complex graph that frames the input on a width x height canvas.
+
+    Smaller canvases (preview proxies) get the same graph with the blur radius
+    scaled proportionally, so they look like a downscaled final output.
+    source is the input stream label; tag suffixes the internal labels so
+    several graphs can share one filter_complex (see build_stitch_graph).
+    """
+    crop = f'crop=in_w:in_h*(1-2*{crop_percent}):0:in_h*{crop_percent}'
+    blur = _scaled_blur(settings.blur, width / OUTPUT_WIDTH) if width != OUTPUT_WIDTH else settings.blur
+    main_width = int(width * zoom_level)
+
+    if settings.background == 'black':
+        main = _scale_filter(main_width, -2, settings.scale_flags)
+        return (
+            f'[{source}]{crop},{main},'
+            f"crop='min(iw,{width})':'min(ih,{height})',"
+            f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black'
+        )
+
+    main = _scale_filter(main_width, -1, settings.scale_flags)
+    background = _scale_filter(width, height, settings.scale_flags, ':force_original_aspect_ratio=increase')
+    return (
+        f'[{source}]{crop},split[fg{tag}][bgsrc{tag}];'
+        f'[fg{tag}]{main}[main{tag}];'
+        f'[bgsrc{tag}]{background},boxblur={blur},crop={width}:{height}[bg{tag}];'
+        f'[bg{tag}][main{tag}]overlay=(W-w)/2:(H-h)/2'
+    )
+
+
+def build_stitch_graph(clips, settings, fps=STITCH_FPS):
+    """Returns the graph that frames, normalizes and concatenates clips into [vout] and [aout].
+
+    clips is a list of (StitchClip, seconds, has_audio), one per ffmpeg input
+    in order. Clips without audio get silence of their length, so every
+    concat segment has both streams.
+    """
+    chains = []
+    segments = ''
+    for index, (clip, seconds, has_audio) in enumerate(clips):
+        chains.append(f'[{index}:v]fps={fps},setpts=PTS-STARTPTS[src{index}]')
+        chains.append(build_filter_graph(clip.crop_percent, clip.zoom_level, settings, source=f'src{index}',
+                                         tag=str(index)) + f',setsar=1,format=yuv420p[v{index}]')
+        audio_format = f'aformat=sample_fmts=fltp:sample_rates={STITCH_AUDIO_RATE}:channel_layouts=stereo'
+        if has_audio:
+            chains.append(f'[{index}:a]aresample={STITCH_AUDIO_RATE},{audio_format},asetpts=PTS-STARTPTS[a{index}]')
+        else:
+            chains.append(f'anullsrc=r={STITCH_AUDIO_RATE}:cl=stereo,atrim=duration={seconds:.3f},'
+                          f'{audio_format}[a{index}]')
+        segments += f'[v{index}][a{index}]'
+    chains.append(f'{segments}concat=n={len(clips)}:v=1:a=1[vout][aout]')
+    return ';'.join(chains)
+
+
+def build_asset_graph(source):
+    """Returns the filter chains that turn the [source] stream into [poster] and [sprite] outputs."""
+    thumb = _scale_filter(THUMB_WIDTH, THUMB_HEIGHT, 'fast_bilinear')
+    return (
+        f'[{source}]split[postersrc][spritesrc];'
+        f'[postersrc]trim=start={POSTER_SECONDS},setpts=PTS-STARTPTS[poster];'
+        f'[spritesrc]fps=1/{SPRITE_INTERVAL_SECONDS},{thumb},tile={SPRITE_COLUMNS}x{SPRITE_ROWS}[sprite]'
+    )
+
+
+def asset_output_args(assets_dir, max_duration=None):
+    """Returns the extra ffmpeg outputs that write the poster and sprite sheets into assets_dir."""
+    limit = ['-t', str(max_duration)] if max_duration else []
+    return (
+        ['-map', '[poster]', '-frames:v', '1', '-q:v', '3', '-update', '1', '-f', 'image2', '-y',
+         os.path.join(assets_dir, POSTER_FILENAME)] +
+        ['-map', '[sprite]'] + limit + ['-q:v', '5', '-start_number', '0', '-f', 'image2', '-y',
+                                        os.path.join(assets_dir, SPRITE_PATTERN)]
+    )
+
+
+def write_sprite_vtt(assets_dir, duration):
+    """Indexes the sprite sheets in assets_dir with a WebVTT file; returns the asset paths."""
+    per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+    count = max(1, math.ceil(duration / SPRITE_INTERVAL_SECONDS))
+    written = 0
+    while os.path.exists(os.path.join(assets_dir, SPRITE_PATTERN % written)):
+        written += 1
+    if written:
+        # Never point cues at sheets ffmpeg did not write (e.g. when duration was only a guess)
+        count = min(count, written * per_sheet)
+    lines = ['WEBVTT', '']
+    for index in range(count):
+        sheet, cell = divmod(index, per_sheet)
+        x = (cell % SPRITE_COLUMNS) * THUMB_WIDTH
+        y = (cell // SPRITE_COLUMNS) * THUMB_HEIGHT
+        start = index * SPRITE_INTERVAL_SECONDS
+        end = min(duration, start + SPRITE_INTERVAL_SECONDS)
+        lines += [f'{_vtt_time(start)} --> {_vtt_time(end)}',
+                  f'{SPRITE_PATTERN % sheet}#xywh={x},{y},{THUMB_WIDTH},{THUMB_HEIGHT}', '']
+    vtt_path = os.path.join(assets_dir, SPRITE_VTT_FILENAME)
+    with open(vtt_path, 'w') as f:
+        f.write('\n'.join(lines))
+    sprites = [os.path.join(assets_dir, SPRITE_PATTERN % sheet) for sheet in range((count - 1) // per_sheet + 1)]
+    poster = os.path.join(assets_dir, POSTER_FILENAME)
+    return {'poster': poster if os.path.exists(poster) else None, 'sprite_vtt': vtt_path, 'sprites': sprites}
+
+
+def _vtt_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f'{hours:02d}:{minutes:02d}:{seconds:06.3f}'
+
+
+def _split_top_level(text):
+    """Splits a banner stream description on the commas that are not inside parentheses."""
+    parts, depth, current = [], 0, ''
+    for char in text:
+        depth += (char == '(') - (char == ')')
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    parts.append(current.strip())
+    return parts
+
+
+def parse_banner(banner):
+    """Parses the input section ffmpeg prints for `ffmpeg -i` into probe()'s fields.
+
+    Fields that the banner does not show are None (rotation defaults to 0).
+    """
+    info = {'width': None, 'height': None, 'duration': None, 'codec_name': None, 'pix_fmt': None,
+            'rotation': 0, 'audio_codec': None}
+    match = BANNER_DURATION.search(banner)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    video_metadata = []  # Lines below the first video stream, where its rotation is shown
+    in_video = False
+    for line in banner.splitlines():
+        stream = BANNER_STREAM.match(line)
+        if stream is None:
+            if in_video:
+                video_metadata.append(line)
+            continue
+        in_video = False
+        kind, codec, rest = stream.groups()
+        if kind == 'Audio' and info['audio_codec'] is None:
+            info['audio_codec'] = codec
+        elif kind == 'Video' and info['codec_name'] is None:
+            info['codec_name'] = codec
+            in_video = True
+            # e.g. "h264 (High) (avc1 / 0x31637661), yuv420p(tv, bt709), 1080x1920 [SAR 1:1 DAR 9:16], ..."
+            for index, part in enumerate(_split_top_level(rest)[1:]):
+                geometry = re.match(r'(\d+)x(\d+)\b', part)
+                if geometry:
+                    info['width'], info['height'] = int(geometry.group(1)), int(geometry.group(2))
+                    break
+                if index == 0:
+                    info['pix_fmt'] = re.match(r'\w*', part).group() or None
+
+    # Like probe(): the display matrix wins over the older rotate tag
+    metadata = '\n'.join(video_metadata)
+    rotation = BANNER_DISPLAYMATRIX.search(metadata) or BANNER_ROTATE_TAG.search(metadata)
+    if rotation:
+        info['rotation'] = int(float(rotation.group(1))) % 360
+    return info
+
+
+def thread_count(settings, limit=None):
+    """Returns the encoder thread count for settings, or None to let ffmpeg decide.
+
+    Counts are capped by the container's CPU budget (resources.cpu_count)
+    and by limit, e.g. a pipeline's share when conversions run in parallel.
+    ffmpeg only decides on its own when nothing constrains it, since it
+    sizes its pools from the host's core count.
+    """
+    cpus = cpu_count()
+    if limit is not None:
+        cpus = min(cpus, limit)
+    if settings.max_threads is None:
+        return cpus if cpus < (os.cpu_count() or 1) else None
+    return max(1, min(cpus, settings.max_threads))
+
+
+def uses_sliced_threads(settings):
+    """True if settings opt into sliced threading by setting max_threads.
+
+    A count that only comes from the CPU budget keeps x264's frame threading,
+    which compresses better and keeps the output bytes of those profiles.
+    """
+    return settings.max_threads is not None
+
+
+class Pipeline:
+    """Probes inputs and runs ffmpeg conversions.
+
+    memory_limit_bytes and cpu_limit_seconds are rlimits (address space and
+    CPU time) applied to every ffmpeg child, so runaway jobs fail fast with
+    ERROR_RESOURCE_LIMIT (Linux only: they are set with prlimit). With memory_budget_bytes, run() lowers threads and
+    lookahead until the job's estimated peak RSS fits the budget; the
+    estimate is calibrated with the peak RSS measured for each finished job.
+    max_threads caps every job's threads, so pipelines running side by side
+    can share the CPU budget (see resources.threads_per_worker).
+    """
+
+    def __init__(self, ffmpeg='ffmpeg', ffprobe='ffprobe', memory_limit_bytes=None, cpu_limit_seconds=None,
+                 memory_budget_bytes=None, max_threads=None):
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.memory_limit_bytes = memory_limit_bytes
+        self.cpu_limit_seconds = cpu_limit_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_threads = max_threads
+        self.memory_model = MemoryModel()
+
+    def is_available(self):
+        """Check if FFmpeg is installed and runnable."""
+        try:
+            subprocess.run([self.ffmpeg, '-version'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            return True
+        except (subprocess.CalledProcessError, FileNotFoundError, PermissionError):
+            return False
+
+    def probe(self, input_path):
+        """Uses ffprobe to get stream information, or None if the input is unreadable.
+
+        Returns the first video stream's width, height, duration, codec_name,
+        pix_fmt and rotation, plus audio_codec (None when there is no audio).
+        Where ffprobe is not installed (the serverless API only ships ffmpeg)
+        the same fields are read from the banner of `ffmpeg -i`.
+        """
+        command = [
+            self.ffprobe, '-v', 'error',
+            '-show_entries', 'stream=codec_type,codec_name,width,height,pix_fmt,duration:'
+                             'stream_tags=rotate:stream_side_data=rotation:format=duration',
+            '-of', 'json', input_path
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+        except FileNotFoundError:
+            info = self._banner_info(input_path)
+            if info is None or None in (info['width'], info['height'], info['duration']):
+                return None
+            return info
+        except subprocess.CalledProcessError:
+            return None
+        try:
+            data = json.loads(result.stdout)
+            streams = data.get('streams', [])
+            info = next(s for s in streams if s.get('codec_type') == 'video')
+            audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+            duration = info.get('duration') or data.get('format', {}).get('duration')
+            if 'width' not in info or 'height' not in info or duration is None:
+                return None
+            rotation = info.get('tags', {}).get('rotate', 0)
+            for side_data in info.get('side_data_list', []):
+                rotation = side_data.get('rotation', rotation)
+            info['duration'] = float(duration)
+            info['rotation'] = int(float(rotation)) % 360
+            info['audio_codec'] = audio.get('codec_name') if audio else None
+            return info
+        except (json.JSONDecodeError, StopIteration, KeyError, ValueError):
+            return None
+
+    def duration(self, input_path):
+        """Returns the input's duration in seconds, or None.
+
+        Falls back to the banner of `ffmpeg -i` where ffprobe is not installed
+        (the serverless API only ships ffmpeg).
+        """
+        return self.summarize(input_path)[0]
+
+    def summarize(self, input_path):
+        """Returns (duration or None, has_audio), from ffprobe or else the `ffmpeg -i` banner."""
+        info = self.probe(input_path)
+        if info is not None:
+            return info['duration'], info.get('audio_codec') is not None
+        return self._banner_summary(input_path)
+
+    def _banner_summary(self, input_path):
+        """Returns (duration or None, has_audio) parsed from the banner of `ffmpeg -i`."""
+        info = self._banner_info(input_path) or {}
+        return info.get('duration'), info.get('audio_codec') is not None
+
+    def _banner_info(self, input_path):
+        """Returns probe()'s fields parsed from the banner of `ffmpeg -i` (any may be None), or None."""
+        try:
+            result = subprocess.run([self.ffmpeg, '-hide_banner', '-i', input_path],
+                                    capture_output=True, text=True, errors='replace')
+        except OSError:
+            return None
+        return parse_banner(result.stderr)
+
+    def can_remux(self, job, info):
+        """True if the input already is the target output and only needs a stream copy."""
+        return (
+            info is not None
+            and job.crop_percent == 0 and job.zoom_level == 1
+            and not job.is_trimmed  # Stream copy could only cut on keyframes
+            and (info['width'], info['height']) == (OUTPUT_WIDTH, OUTPUT_HEIGHT)
+            and info['rotation'] == 0
+            and info.get('codec_name') in REMUX_VIDEO_CODECS
+            and info.get('pix_fmt') in REMUX_PIXEL_FORMATS
+        )
+
+    def build_remux_command(self, job, info):
+        """Returns the ffmpeg arguments that stream-copy an already vertical input with faststart."""
+        cmd = [self.ffmpeg, '-i', job.input_path, '-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy']
+        if info.get('audio_codec') in REMUX_AUDIO_CODECS or info.get('audio_codec') is None:
+            cmd += ['-c:a', 'copy']
+        else:
+            # Only the audio needs converting for the MP4 container
+            cmd += ['-c:a', 'aac']
+            if job.settings.audio_bitrate:
+                cmd += ['-b:a', job.settings.audio_bitrate]
+        if job.settings.max_duration:
+            cmd += ['-t', str(job.settings.max_duration)]
+        cmd += ['-movflags', '+faststart', '-f', 'mp4', '-y', job.output_path]
+        return cmd
+
+    def build_command(self, job):
+        """Returns the ffmpeg argument list for a conversion job."""
+        settings = job.settings
+        threads = thread_count(settings, self.max_threads)
+        cmd = [self.ffmpeg] + job.input_trim_args() + ['-i', job.input_path]
+        cmd += self._thread_args(settings, threads)
+
+        graph = build_filter_graph(job.crop_percent, job.zoom_level, settings)
+        if job.assets_dir:
+            # Split the composited frames so the poster and sprite reuse this decode and graph
+            graph += ',split[vout][assets];' + build_asset_graph('assets')
+            cmd += ['-filter_complex', graph, '-map', '[vout]', '-map', '0:a?']
+        else:
+            cmd += ['-filter_complex', graph]
+
+        cmd += self._video_args(settings, threads)
+
+        if job.video_only:
+            cmd += ['-an']
+        else:
+            cmd += self._audio_args(settings)
+
+        if settings.max_duration:
+            cmd += ['-t', str(settings.max_duration)]
+
+        cmd += ['-f', 'mp4', '-y', job.output_path]
+        if job.assets_dir:
+            cmd += asset_output_args(job.assets_dir, settings.max_duration)
+        return cmd
+
+    def build_assets_command(self, job):
+        """Returns a decode-only command that writes the assets from a finished output (after a remux)."""
+        return [
+            self.ffmpeg, '-i', job.output_path, '-filter_complex', build_asset_graph('0:v')
+        ] + asset_output_args(job.assets_dir)
+
+    def build_concat_command(self, list_path, job):
+        """Returns the ffmpeg arguments that join video-only segments without re-encoding.
+
+        list_path is a concat-demuxer list of the segments. The audio for the
+        whole range of job is encoded from its input in the same run, so there
+        are no AAC priming gaps at the segment joins.
+        """
+        cmd = [self.ffmpeg, '-f', 'concat', '-safe', '0', '-i', list_path]
+        cmd += job.input_trim_args() + ['-i', job.input_path]
+        cmd += ['-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy'] + self._audio_args(job.settings)
+        if job.settings.max_duration:
+            cmd += ['-t', str(job.settings.max_duration)]
+        if job.settings.faststart:
+            cmd += ['-movflags', '+faststart']
+        cmd += ['-f', 'mp4', '-y', job.output_path]
+        return cmd
+
+    def build_stitch_command(self, job, clips):
+        """Returns the ffmpeg arguments for a StitchJob; clips is the plan from plan_stitch."""
+        settings = job.settings
+        threads = thread_count(settings, self.max_threads)
+        cmd = [self.ffmpeg]
+        for clip, _, _ in clips:
+            cmd += _trim_args(clip.start_time, clip.end_time) + ['-i', clip.input_path]
+        cmd += self._thread_args(settings, threads)
+        cmd += ['-filter_complex', build_stitch_graph(clips, settings, job.fps), '-map', '[vout]', '-map', '[aout]']
+        cmd += self._video_args(settings, threads) + self._audio_args(settings)
+        if settings.max_duration:
+            cmd += ['-t', str(settings.max_duration)]
+        cmd += ['-f', 'mp4', '-y', job.output_path]
+        return cmd
+
+    @staticmethod
+    def _thread_args(settings, threads):
+        if threads is None:
+            return []
+        if uses_sliced_threads(settings):
+            return ['-threads', str(threads), '-thread_type', 'slice']
+        return ['-threads', str(threads)]
+
+    @staticmethod
+    def _video_args(settings, threads):
+        args = ['-c:v', 'libx264', '-preset', settings.preset, '-crf', str(settings.crf), '-pix_fmt', 'yuv420p']
+        if settings.tune:
+            args += ['-tune', settings.tune]
+        x264_params = []
+        if threads is not None:
+            x264_params.append(f'threads={threads}')
+            if uses_sliced_threads(settings):
+                x264_params += ['sliced-threads=1', 'sync-lookahead=0']
+        if settings.rc_lookahead is not None:
+            x264_params.append(f'rc-lookahead={settings.rc_lookahead}')
+        if x264_params:
+            args += ['-x264-params', ':'.join(x264_params)]
+        if settings.max_bitrate_kbps:
+            args += ['-maxrate', f'{settings.max_bitrate_kbps}k', '-bufsize', f'{2 * settings.max_bitrate_kbps}k']
+        if settings.faststart:
+            args += ['-movflags', '+faststart']
+        return args
+
+    @staticmethod
+    def _audio_args(settings):
+        args = ['-c:a', 'aac']
+        if settings.audio_bitrate:
+            args += ['-b:a', settings.audio_bitrate]
+        if settings.audio_channels:
+            args += ['-ac', str(settings.audio_channels)]
+        return args
+
+    def build_preview_command(self, job, start=0.0, seconds=PREVIEW_SECONDS, scale=PREVIEW_SCALE):
+        """Returns the ffmpeg arguments that render a short proxy-resolution excerpt of a job.
+
+        The excerpt goes through the same filter graph as the full conversion,
+        with input-side seeking and an ultrafast encode without audio.
+        """
+        width = _even(OUTPUT_WIDTH * scale)
+        height = _even(OUTPUT_HEIGHT * scale)
+        graph = build_filter_graph(job.crop_percent, job.zoom_level, job.settings, width, height)
+        return [
+            self.ffmpeg, '-ss', f'{start:.3f}', '-t', f'{seconds:.3f}', '-i', job.input_path,
+            '-filter_complex', graph,
+            '-c:v', 'libx264', '-preset', PREVIEW_PRESET, '-crf', str(PREVIEW_CRF), '-pix_fmt', 'yuv420p',
+            '-an', '-movflags', '+faststart', '-f', 'mp4', '-y', job.output_path
+        ]
+
+    def run(self, job, timeout=None, allow_remux=True):
+        """Runs a conversion job and returns a ConversionResult.
+
+        When the framing is neutral (no crop, 1x zoom) the input is probed, and
+        inputs that already are 1080x1920 H.264 are remuxed instead of re-encoded;
+        result.fast_path reports when that happened.
+        """
+        if job.assets_dir:
+            os.makedirs(job.assets_dir, exist_ok=True)
+        info = None
+        if allow_remux and job.crop_percent == 0 and job.zoom_level == 1 and not job.is_trimmed:
+            info = self.probe(job.input_path)
+            if self.can_remux(job, info):
+                result = self.execute(self.build_remux_command(job, info), job.output_path, timeout)
+                if result.success:
+                    result.fast_path = FAST_PATH_REMUX
+                    # Nothing was decoded, so the assets need a (decode-only) pass of their own
+                    if job.assets_dir and self.execute(self.build_assets_command(job), timeout=timeout).success:
+                        result.assets = self._index_assets(job)
+                    return result
+        raw_estimate = None
+        if self.memory_budget_bytes:
+            job, raw_estimate = self.fit_to_memory(job, info or self.probe(job.input_path))
+        result = self.execute(self.build_command(job), job.output_path, timeout)
+        if raw_estimate and result.success:
+            self.memory_model.record(raw_estimate, result.peak_rss_bytes)
+        if result.success and job.assets_dir:
+            result.assets = self._index_assets(job)
+        return result
+
+    def plan_stitch(self, job):
+        """Returns [(clip, seconds, has_audio)] for a StitchJob and the largest clip's probe info (or None).
+
+        Raises ValueError for an empty job, an unreadable clip or a trim
+        outside its clip.
+        """
+        if not job.clips:
+            raise ValueError("Nothing to stitch")
+        clips = []
+        largest = None
+        for number, clip in enumerate(job.clips, 1):
+            info = self.probe(clip.input_path)
+            if info is not None:
+                duration, has_audio = info['duration'], info['audio_codec'] is not None
+                if largest is None or info['width'] * info['height'] > largest['width'] * largest['height']:
+                    largest = info
+            else:
+                duration, has_audio = self._banner_summary(clip.input_path)
+            if duration is None:
+                raise ValueError(f"Could not read clip {number} ({os.path.basename(clip.input_path)})")
+            end = min(clip.end_time, duration) if clip.end_time is not None else duration
+            seconds = end - (clip.start_time or 0)
+            if seconds <= 0:
+                raise ValueError(f"Trim of clip {number} starts after the clip ends")
+            clips.append((clip, seconds, has_audio))
+        return clips, largest
+
+    def stitch(self, job, timeout=None):
+        """Frames and joins the clips of a StitchJob in one ffmpeg run; returns a ConversionResult.
+
+        Unlike converting each clip and concatenating the outputs, every
+        frame is decoded and encoded once. Raises ValueError like plan_stitch.
+        """
+        clips, largest = self.plan_stitch(job)
+        raw_estimate = None
+        if self.memory_budget_bytes:
+            job, raw_estimate = self.fit_to_memory(job, largest)
+        result = self.execute(self.build_stitch_command(job, clips), job.output_path, timeout)
+        if raw_estimate and result.success:
+            self.memory_model.record(raw_estimate, result.peak_rss_bytes)
+        return result
+
+    def fit_to_memory(self, job, info):
+        """Returns (job, raw estimate) with lookahead, then threads, lowered to fit memory_budget_bytes.
+
+        Lookahead goes first because it costs a little compression, while
+        fewer threads cost speed. Returns the job unchanged when the input
+        size is unknown.
+        """
+        if info is None:
+            return job, None
+        settings = job.settings
+        initial_threads = threads = thread_count(settings, self.max_threads) or cpu_count()
+        initial_lookahead = lookahead = (
+            settings.rc_lookahead if settings.rc_lookahead is not None else PRESET_LOOKAHEAD.get(settings.preset, 40)
+        )
+        width, height = info['width'], info['height']
+
+        def estimate(threads, lookahead):
+            return self.memory_model.raw_estimate(width, height, OUTPUT_WIDTH, OUTPUT_HEIGHT, threads, lookahead)
+
+        while estimate(threads, lookahead) * self.memory_model.correction > self.memory_budget_bytes:
+            if lookahead > 10:
+                lookahead = max(10, lookahead // 2)
+            elif threads > 1:
+                threads = max(1, threads // 2)
+            else:
+                break  # Smallest configuration; the rlimit, if any, has the final say
+        if (threads, lookahead) != (initial_threads, initial_lookahead):
+            # Only pin (and so slice) the threads when they had to be lowered
+            settings = replace(settings, rc_lookahead=lookahead,
+                               max_threads=threads if threads != initial_threads else settings.max_threads)
+            job = replace(job, settings=settings)
+        return job, estimate(threads, lookahead)
+
+    def _index_assets(self, job):
+        """Writes the sprite WebVTT for a finished job and returns its asset paths."""
+        duration = self.duration(job.output_path)
+        if duration is None:
+            duration = (job.end_time or job.settings.max_duration or 0) - (job.start_time or 0)
+        return write_sprite_vtt(job.assets_dir, max(duration, 0.1))
+
+    def execute(self, cmd, output_path=None, timeout=None):
+        """Runs an ffmpeg command line and returns a ConversionResult.
+
+        On POSIX the child runs under the pipeline's rlimits and is reaped
+        with wait4, so the result carries its own peak RSS and CPU time.
+        stderr is read as it is written into a bounded FFmpegLog; a line that
+        shows the job cannot succeed kills ffmpeg at once and sets the
+        matching error code.
+        """
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                       text=True, errors='replace')
+            self._apply_limits(process)
+            log = FFmpegLog()
+            usage, timed_out = self._wait(process, log, timeout)
+        except FileNotFoundError:
+            return ConversionResult(False, "FFmpeg command not found.", ERROR_FFMPEG_MISSING, 0.0, cmd, output_path)
+        except Exception as e:
+            return ConversionResult(False, f"An unexpected error occurred: {str(e)}", ERROR_UNEXPECTED,
+                                    time.monotonic() - started, cmd, output_path)
+
+        elapsed = time.monotonic() - started
+        tail = log.text()
+        result = ConversionResult(process.returncode == 0 and log.error is None, tail, None, elapsed, cmd, output_path)
+        if usage is not None:
+            result.peak_rss_bytes = usage.ru_maxrss * 1024  # Linux reports kilobytes
+            result.cpu_seconds = usage.ru_utime + usage.ru_stime
+        if result.success:
+            return result
+        limit_message = self._limit_message(process.returncode, log, result)
+        if limit_message:
+            result.error, result.log = ERROR_RESOURCE_LIMIT, f"{limit_message}\n{tail}"
+        elif log.error is not None:
+            result.error, result.log = log.error, f"{log.summary()}\n{tail}"
+        elif timed_out:
+            result.error = ERROR_TIMEOUT
+        else:
+            result.error = ERROR_FFMPEG_FAILED
+        return result
+
+    def _apply_limits(self, process):
+        """Caps a freshly started child's address space and CPU time.
+
+        Set from the parent with prlimit rather than in a preexec_fn, which
+        can deadlock when the parent has threads (the API server and our own
+        reader threads). ffmpeg is still loading its libraries at this point,
+        long before it allocates frame buffers.
+        """
+        if resource is None or not hasattr(resource, 'prlimit'):
+            return
+        limits = []
+        if self.memory_limit_bytes:
+            limits.append((resource.RLIMIT_AS, (self.memory_limit_bytes, self.memory_limit_bytes)))
+        if self.cpu_limit_seconds:
+            # SIGXCPU at the soft limit, SIGKILL shortly after if ignored
+            seconds = int(self.cpu_limit_seconds)
+            limits.append((resource.RLIMIT_CPU, (seconds, seconds + 5)))
+        for limit, values in limits:
+            try:
+                resource.prlimit(process.pid, limit, values)
+            except ProcessLookupError:
+                return  # Already exited
+            except (OSError, ValueError):
+                # Never leave an unlimited ffmpeg running
+                process.kill()
+                process.wait()
+                raise
+
+    def _wait(self, process, log, timeout):
+        """Feeds stderr into log and reaps process. Returns (rusage or None, timed_out).
+
+        A fatal log line or the timeout kills the process from another thread.
+        """
+        if not hasattr(os, 'wait4'):
+            # Popen.wait reaps under Popen's own lock, so Popen.kill is safe from the reader thread
+            log.on_fatal = process.kill
+            reader = threading.Thread(target=log.consume, args=(process.stderr,), daemon=True)
+            reader.start()
+            try:
+                process.wait(timeout=timeout)
+                timed_out = False
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                timed_out = True
+            reader.join()
+            process.stderr.close()
+            return None, timed_out
+
+        # Popen.kill polls (and may reap) the child, racing wait4 below. Kills go
+        # straight to the pid instead, and only until the child has exited.
+        lock = threading.Lock()
+        running = True
+        timed_out = threading.Event()
+
+        def kill(expired=False):
+            with lock:
+                if running:
+                    if expired:
+                        timed_out.set()
+                    os.kill(process.pid, signal.SIGKILL)
+
+        log.on_fatal = kill
+        reader = threading.Thread(target=log.consume, args=(process.stderr,), daemon=True)
+        reader.start()
+        timer = threading.Timer(timeout, kill, kwargs={'expired': True}) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            if hasattr(os, 'waitid'):
+                # Wait for the exit without reaping, so the pid cannot be reused while kills are armed
+                os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            with lock:
+                running = False
+            # wait4 instead of Popen.wait, which discards the child's rusage
+            _pid, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        finally:
+            with lock:
+                running = False
+            if timer:
+                timer.cancel()
+        reader.join()
+        process.stderr.close()
+        return usage, timed_out.is_set()
+
+    def _limit_message(self, returncode, log, result):
+        """Explains a failure caused by the rlimits, or returns None."""
+        if self.cpu_limit_seconds and returncode in (-signal.SIGXCPU, -signal.SIGKILL) and \
+                (result.cpu_seconds or 0) >= self.cpu_limit_seconds - 1:
+            return f"FFmpeg exceeded the CPU time limit of {self.cpu_limit_seconds:.0f}s"
+        if self.memory_limit_bytes and log.error == ERROR_OUT_OF_MEMORY:
+            peak = f", peak {result.peak_rss_bytes / 1048576:.0f} MB resident" if result.peak_rss_bytes else ''
+            return (f"FFmpeg ran out of memory under the {self.memory_limit_bytes / 1048576:.0f} MB limit{peak}; "
+                    "try a smaller input, fewer threads or a shorter lookahead")
+        return None
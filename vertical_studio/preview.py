@@ -0,0 +1,95 @@
+"""
+WYSIWYG preview clips rendered by the production filter graph.
+
+A preview is a short excerpt of the input pushed through exactly the same
+ffmpeg graph as the final conversion, only at proxy resolution with an
+ultrafast encode. Rendered clips are cached on disk by input and framing
+parameters, so moving a slider back to an earlier value is instant.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from dataclasses import asdict
+
+from .pipeline import PREVIEW_SCALE, PREVIEW_SECONDS, ConversionJob, ConversionResult
+
+DEFAULT_PREVIEW_DIR = os.path.join(tempfile.gettempdir(), 'vs_preview')
+DEFAULT_MAX_ENTRIES = 64
+PREVIEW_TIMEOUT_SECONDS = 30
+
+
+def preview_start(range_end, range_start=0.0, seconds=PREVIEW_SECONDS):
+    """Picks an excerpt start inside [range_start, range_end], skipping the first second if it can."""
+    range_start = range_start or 0.0
+    if range_end is None:
+        return range_start
+    return range_start + max(0.0, min(1.0, range_end - range_start - seconds))
+
+
+def upload_key(uploaded_file):
+    """Identifies a Streamlit upload across reruns, so cached previews survive slider changes."""
+    return getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+
+class PreviewCache:
+    """Renders preview clips through a Pipeline and keeps the most recent ones on disk."""
+
+    def __init__(self, pipeline, cache_dir=DEFAULT_PREVIEW_DIR, max_entries=DEFAULT_MAX_ENTRIES):
+        self.pipeline = pipeline
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def render(self, input_path, crop_percent, zoom_level, settings, start=0.0,
+               seconds=PREVIEW_SECONDS, input_key=None):
+        """Returns a ConversionResult whose output_path is the preview clip.
+
+        input_key identifies the input content (e.g. an upload id or hash); it
+        defaults to the path, size and mtime of input_path.
+        """
+        if input_key is None:
+            stats = os.stat(input_path)
+            input_key = f'{os.path.abspath(input_path)}:{stats.st_size}:{stats.st_mtime_ns}'
+        params = {
+            'input': input_key, 'crop': round(crop_percent, 4), 'zoom': round(zoom_level, 4),
+            'settings': asdict(settings), 'start': round(start, 3), 'seconds': seconds, 'scale': PREVIEW_SCALE,
+        }
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+        clip_path = os.path.join(self.cache_dir, f'{key}.mp4')
+
+        if os.path.exists(clip_path):
+            os.utime(clip_path)
+            return self._cached_result(clip_path)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial_path = os.path.join(self.cache_dir, f'.{key}-{uuid.uuid4().hex}.mp4')
+        job = ConversionJob(input_path, partial_path, crop_percent, zoom_level, settings)
+        command = self.pipeline.build_preview_command(job, start, seconds)
+        result = self.pipeline.execute(command, partial_path, timeout=PREVIEW_TIMEOUT_SECONDS)
+        if result.success:
+            os.replace(partial_path, clip_path)
+            result.output_path = clip_path
+            self._evict()
+        elif os.path.exists(partial_path):
+            os.remove(partial_path)
+        return result
+
+    def _cached_result(self, clip_path):
+        return ConversionResult(True, 'Preview served from cache', output_path=clip_path)
+
+    def _evict(self):
+        """Keeps only the max_entries most recently used clips."""
+        clips = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.mp4') and not entry.name.startswith('.'):
+                try:
+                    clips.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        clips.sort(reverse=True)
+        for _mtime, path in clips[self.max_entries:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
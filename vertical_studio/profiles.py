@@ -0,0 +1,91 @@
+"""
+Named encoding profiles shared by every front end.
+
+A profile is a labeled EncoderSettings: preset, CRF, tune, scaler flags,
+blur strength, audio policy (bitrate and channels) and thread policy
+(max_threads, lookahead). Front ends select profiles by name instead of
+hardcoding settings, so an operator can move traffic to a cheaper profile
+under load by changing one name (e.g. VS_API_PROFILE for the Flask API).
+
+benchmark_profiles.py encodes a reference clip with every profile and
+records the measured speed and size in BENCHMARKS_PATH; load_benchmarks()
+returns those records for display and for choosing between profiles.
+"""
+import json
+import os
+from dataclasses import dataclass
+
+from .pipeline import EncoderSettings
+
+BENCHMARKS_PATH = os.environ.get(
+    'VS_PROFILE_BENCHMARKS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profile_benchmarks.json')
+)
+
+
+@dataclass(frozen=True)
+class Profile:
+    """A named set of encoder settings with a short label for selectors."""
+    name: str
+    label: str
+    settings: EncoderSettings
+    description: str = ''
+
+
+PROFILES = {profile.name: profile for profile in (
+    Profile('draft', 'Draft', EncoderSettings(preset='ultrafast', crf=30, blur='20:10'),
+            "Ultrafast preset for quick checks; largest files"),
+    Profile('fast', 'Fast', EncoderSettings(preset='faster', crf=25, blur='20:10'),
+            "Faster preset with a lighter background blur"),
+    Profile('default', 'Balanced', EncoderSettings(preset='medium', crf=23, blur='40:20'),
+            "Medium preset; the original batch output"),
+    # Interactive local conversions: bilinear scaling, reduced blur, sliced
+    # x264 threads with a short lookahead and lighter audio.
+    Profile('interactive', 'Fast (web-ready)', EncoderSettings(
+        preset='faster', crf=25, tune='fastdecode', scale_flags='bilinear', blur='20:10',
+        audio_bitrate='128k', audio_channels=2, max_threads=8, rc_lookahead=10, faststart=True
+    ), "Faster preset tuned for quick local turnaround and streaming playback"),
+    Profile('interactive-draft', 'Ultra Fast (web-ready)', EncoderSettings(
+        preset='ultrafast', crf=28, tune='fastdecode', scale_flags='bilinear', blur='20:10',
+        audio_bitrate='128k', audio_channels=2, max_threads=8, rc_lookahead=10, faststart=True
+    ), "Ultrafast preset with the interactive audio and thread policy"),
+    Profile('interactive-balanced', 'Balanced (web-ready)', EncoderSettings(
+        preset='medium', crf=23, tune='fastdecode', blur='40:20',
+        audio_bitrate='128k', audio_channels=2, max_threads=8, faststart=True
+    ), "Medium preset with the interactive audio and thread policy"),
+    # Serverless instances: fewer threads and a shorter lookahead.
+    Profile('serverless', 'Cloud', EncoderSettings(
+        preset='ultrafast', crf=26, tune='fastdecode', scale_flags='bilinear', blur='20:10',
+        audio_bitrate='96k', audio_channels=2, max_threads=4, rc_lookahead=5, faststart=True
+    ), "Ultrafast preset sized for serverless CPU and memory limits"),
+    # The Flask API: letterbox on black, mono audio to save space, 60 second cap.
+    Profile('api', 'API', EncoderSettings(
+        preset='ultrafast', crf=32, background='black',
+        audio_bitrate='32k', audio_channels=1, max_duration=60
+    ), "Smallest, cheapest output: black letterbox, mono audio, 60s cap"),
+)}
+
+
+def get_profile(name):
+    """Returns the Profile called name. Raises ValueError for unknown names."""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown profile '{name}' (choose from {', '.join(sorted(PROFILES))})")
+
+
+def load_benchmarks(path=BENCHMARKS_PATH):
+    """Returns {profile name: benchmark record} from the last benchmark run, or {} if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f).get('profiles', {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def describe(name, benchmarks=None):
+    """Selector text for a profile: its label plus the measured speed and size, if benchmarked."""
+    label = PROFILES[name].label
+    record = (benchmarks or {}).get(name)
+    if not record:
+        return label
+    return f"{label} ({record['speed']:.1f}x realtime, {record['megabytes_per_minute']:.1f} MB/min)"
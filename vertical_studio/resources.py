@@ -0,0 +1,197 @@
+"""
+Resource limits of the machine or container the pipeline runs in.
+
+os.cpu_count() reports the host's cores, not the CPU quota or affinity
+mask of the container, so ffmpeg would start one thread per host core on
+a one-vCPU slice and thrash. cpu_count() returns the cores this process
+can actually use; thread counts and pool sizes are derived from it.
+
+ffmpeg's memory grows with the input resolution, the encoder's lookahead
+and its thread count. On small serverless instances a 4K input can blow
+through the memory ceiling, so the pipeline estimates a job's peak RSS up
+front and scales threads and lookahead down until it fits. MemoryModel
+calibrates that estimate against the peak RSS measured for finished jobs.
+"""
+import math
+import os
+import threading
+
+# --- Configuration ---
+# Explicit memory ceiling for ffmpeg jobs; otherwise the cgroup or Lambda limit is used.
+MEMORY_LIMIT_ENV = 'VS_MEMORY_LIMIT_MB'
+# Fraction of the ceiling a single job may plan to use (the Python process needs the rest).
+MEMORY_BUDGET_FRACTION = float(os.environ.get('VS_MEMORY_BUDGET_FRACTION', '0.75'))
+
+# Explicit CPU budget (cores, may be fractional); otherwise the cgroup quota and affinity mask are used.
+CPU_LIMIT_ENV = 'VS_CPU_LIMIT'
+
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_CPU_DIRS = ('/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct')
+CGROUP_V2_MEMORY_MAX = '/sys/fs/cgroup/memory.max'
+CGROUP_V1_MEMORY_LIMIT = '/sys/fs/cgroup/memory/memory.limit_in_bytes'
+# cgroup v1 reports "no limit" as a huge page-aligned number
+UNLIMITED_THRESHOLD = 1 << 60
+
+# x264's default rc-lookahead per preset, used when settings leave it unset.
+PRESET_LOOKAHEAD = {
+    'ultrafast': 0, 'superfast': 0, 'veryfast': 10, 'faster': 20, 'fast': 30,
+    'medium': 40, 'slow': 50, 'slower': 60, 'veryslow': 60, 'placebo': 60,
+}
+
+# Rough peak-RSS model, in frames of the given size. Calibrated at run time.
+BASE_BYTES = 80 * 1024 * 1024        # ffmpeg, codecs and libc arenas
+DECODE_FRAMES_PER_THREAD = 1          # frame-threaded decoding keeps one frame per thread
+DECODE_EXTRA_FRAMES = 4               # references and reorder buffer
+GRAPH_FRAMES = 6                      # crop, scales, blur and overlay working frames
+ENCODE_FRAMES_PER_THREAD = 2
+ENCODE_EXTRA_FRAMES = 12              # references, B-frames and padding
+LOOKAHEAD_FRAME_COST = 1.3            # a lookahead frame plus its half-resolution copy
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _read_text(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_quota():
+    """Returns the cgroup CPU quota in cores (e.g. 0.5 or 2.0), or None if there is none.
+
+    Reads cpu.max on cgroup v2 and cpu.cfs_quota_us / cpu.cfs_period_us on v1.
+    """
+    fields = (_read_text(CGROUP_V2_CPU_MAX) or '').split()
+    if len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit() and int(fields[1]):
+        return int(fields[0]) / int(fields[1])
+    for directory in CGROUP_V1_CPU_DIRS:
+        quota = _read_text(os.path.join(directory, 'cpu.cfs_quota_us'))
+        period = _read_int(os.path.join(directory, 'cpu.cfs_period_us'))
+        # v1 reports "no quota" as -1
+        if quota and quota.isdigit() and period:
+            return int(quota) / period
+    return None
+
+
+def affinity_count():
+    """Returns how many CPUs the scheduler lets this process run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def cpu_info():
+    """Returns the CPU budget and where it came from, for cpu_count() and diagnostics.
+
+    The budget is VS_CPU_LIMIT if set, otherwise the smaller of the affinity
+    mask and the cgroup quota (rounded up, since a 1.5-core quota still
+    benefits from a second thread).
+    """
+    host = os.cpu_count() or 1
+    affinity = affinity_count()
+    quota = cpu_quota()
+    if os.environ.get(CPU_LIMIT_ENV):
+        limit, source = float(os.environ[CPU_LIMIT_ENV]), 'env'
+    elif quota is not None and quota < affinity:
+        limit, source = quota, 'cgroup'
+    elif affinity < host:
+        limit, source = affinity, 'affinity'
+    else:
+        limit, source = host, 'host'
+    return {
+        'cpus': max(1, math.ceil(limit)), 'source': source, 'host_cpus': host,
+        'affinity_cpus': affinity, 'cgroup_quota': quota,
+    }
+
+
+def cpu_count():
+    """Returns the number of CPUs this process may keep busy (at least 1)."""
+    return cpu_info()['cpus']
+
+
+def threads_per_worker(workers):
+    """Splits the CPU budget between workers parallel conversions; at least 1 thread each."""
+    return max(1, cpu_count() // max(1, workers))
+
+
+def memory_limit_bytes():
+    """Returns the memory ceiling for this process in bytes, or None if unknown.
+
+    Checked in order: VS_MEMORY_LIMIT_MB, the cgroup v2 then v1 limit, and
+    AWS_LAMBDA_FUNCTION_MEMORY_SIZE (which Vercel functions also set).
+    """
+    if os.environ.get(MEMORY_LIMIT_ENV):
+        return int(os.environ[MEMORY_LIMIT_ENV]) * 1024 * 1024
+    for path in (CGROUP_V2_MEMORY_MAX, CGROUP_V1_MEMORY_LIMIT):
+        limit = _read_int(path)
+        if limit is not None and limit < UNLIMITED_THRESHOLD:
+            return limit
+    if os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '').isdigit():
+        return int(os.environ['AWS_LAMBDA_FUNCTION_MEMORY_SIZE']) * 1024 * 1024
+    return None
+
+
+def memory_budget_bytes():
+    """Returns how much memory one conversion may plan to use, or None if unlimited."""
+    limit = memory_limit_bytes()
+    return int(limit * MEMORY_BUDGET_FRACTION) if limit else None
+
+
+def frame_bytes(width, height):
+    """Size of one 8-bit 4:2:0 frame."""
+    return width * height * 3 // 2
+
+
+class MemoryModel:
+    """Estimates ffmpeg's peak RSS for a conversion, corrected by measured peaks."""
+
+    def __init__(self, correction=1.0, smoothing=0.3):
+        self.correction = correction
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def raw_estimate(self, input_width, input_height, output_width, output_height, threads, lookahead):
+        """Uncalibrated peak-RSS estimate in bytes."""
+        source = frame_bytes(input_width, input_height)
+        output = frame_bytes(output_width, output_height)
+        decode = source * (threads * DECODE_FRAMES_PER_THREAD + DECODE_EXTRA_FRAMES)
+        graph = source + output * GRAPH_FRAMES
+        encode = output * (threads * ENCODE_FRAMES_PER_THREAD + ENCODE_EXTRA_FRAMES + lookahead * LOOKAHEAD_FRAME_COST)
+        return BASE_BYTES + decode + graph + int(encode)
+
+    def estimate(self, *args):
+        """Calibrated peak-RSS estimate in bytes; takes the same arguments as raw_estimate."""
+        return int(self.raw_estimate(*args) * self.correction)
+
+    def record(self, raw_estimate, measured_bytes):
+        """Folds a measured peak RSS into the correction factor."""
+        if not raw_estimate or not measured_bytes:
+            return
+        with self._lock:
+            ratio = measured_bytes / raw_estimate
+            self.correction += self.smoothing * (ratio - self.correction)
+
+
+def ffmpeg_rlimits():
+    """Pipeline keyword arguments for the ffmpeg rlimits set in the environment.
+
+    VS_FFMPEG_ADDRESS_SPACE_MB caps virtual memory (set it well above the
+    expected RSS: thread stacks and allocator arenas count too) and
+    VS_FFMPEG_CPU_SECONDS caps CPU time. Both are off by default.
+    """
+    address_space_mb = os.environ.get('VS_FFMPEG_ADDRESS_SPACE_MB')
+    cpu_seconds = os.environ.get('VS_FFMPEG_CPU_SECONDS')
+    return {
+        'memory_limit_bytes': int(address_space_mb) * 1024 * 1024 if address_space_mb else None,
+        'cpu_limit_seconds': float(cpu_seconds) if cpu_seconds else None,
+    }
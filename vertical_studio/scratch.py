@@ -0,0 +1,236 @@
+"""
+Managed scratch storage for per-job workspaces.
+
+Every upload or conversion gets its own uniquely named workspace directory.
+The manager keeps the total size of all workspaces under a byte quota by
+evicting the least recently used idle ones, and reclaims workspaces that
+were abandoned (e.g. an upload whose conversion was never requested) once
+they exceed their time-to-live. Small jobs are placed on tmpfs when one is
+available; large or unknown-size jobs spill to disk.
+"""
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# --- Configuration ---
+SCRATCH_DIRNAME = 'vs_scratch'
+WORKSPACE_PREFIX = 'job_'
+META_FILENAME = '.vs_meta'
+DEFAULT_QUOTA_BYTES = int(os.environ.get('VS_SCRATCH_QUOTA_MB', '1024')) * 1024 * 1024
+DEFAULT_TTL_SECONDS = int(os.environ.get('VS_SCRATCH_TTL_SECONDS', '3600'))
+DEFAULT_TMPFS_THRESHOLD_BYTES = int(os.environ.get('VS_SCRATCH_TMPFS_MB', '64')) * 1024 * 1024
+REAP_INTERVAL_SECONDS = 60
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ScratchQuotaExceeded(Exception):
+    """Raised when a workspace cannot fit inside the scratch quota."""
+
+
+class UnknownWorkspace(KeyError):
+    """Raised when a job id does not name an existing workspace."""
+
+
+def _tree_size(path):
+    """Returns the total size in bytes of all regular files below path."""
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _default_tmpfs_root():
+    """Returns /dev/shm when it exists and is writable, otherwise None."""
+    candidate = '/dev/shm'
+    if os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+        return candidate
+    return None
+
+
+class ScratchStorage:
+    """Allocates, tracks and reclaims per-job scratch workspaces."""
+
+    def __init__(self, disk_root=None, tmpfs_root='auto', quota_bytes=DEFAULT_QUOTA_BYTES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, tmpfs_threshold_bytes=DEFAULT_TMPFS_THRESHOLD_BYTES):
+        if tmpfs_root == 'auto':
+            tmpfs_root = _default_tmpfs_root()
+        self.disk_root = os.path.join(disk_root or tempfile.gettempdir(), SCRATCH_DIRNAME)
+        self.tmpfs_root = os.path.join(tmpfs_root, SCRATCH_DIRNAME) if tmpfs_root else None
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.tmpfs_threshold_bytes = tmpfs_threshold_bytes
+        self._lock = threading.RLock()
+        self._active = {}
+        self._last_reclaim = 0.0
+        self._reaper = None
+
+    # --- Allocation ---
+
+    def allocate(self, expected_bytes=0):
+        """Creates a new workspace sized for expected_bytes and returns its job id."""
+        self.maybe_reclaim()
+        with self._lock:
+            self.ensure_capacity(expected_bytes)
+            job_id = uuid.uuid4().hex
+            path = os.path.join(self._pick_root(expected_bytes), WORKSPACE_PREFIX + job_id)
+            os.makedirs(path)
+            with open(os.path.join(path, META_FILENAME), 'w') as f:
+                f.write(str(int(expected_bytes)))
+            return job_id
+
+    def path(self, job_id):
+        """Returns the workspace directory for job_id and marks it as recently used."""
+        if not isinstance(job_id, str) or not _JOB_ID_RE.match(job_id):
+            raise UnknownWorkspace(job_id)
+        for root in self._roots():
+            path = os.path.join(root, WORKSPACE_PREFIX + job_id)
+            if os.path.isdir(path):
+                self._touch(path)
+                return path
+        raise UnknownWorkspace(job_id)
+
+    def release(self, job_id):
+        """Deletes the workspace for job_id if it still exists."""
+        with self._lock:
+            try:
+                path = self.path(job_id)
+            except UnknownWorkspace:
+                return
+            shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def hold(self, job_id):
+        """Pins an existing workspace against eviction while the block runs."""
+        path = self.path(job_id)
+        with self._lock:
+            self._active[job_id] = self._active.get(job_id, 0) + 1
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._active[job_id] -= 1
+                if not self._active[job_id]:
+                    del self._active[job_id]
+
+    @contextmanager
+    def job(self, expected_bytes=0):
+        """Allocates a pinned workspace for one request and releases it afterwards."""
+        job_id = self.allocate(expected_bytes)
+        try:
+            with self.hold(job_id) as path:
+                yield job_id, path
+        finally:
+            self.release(job_id)
+
+    # --- Quota and eviction ---
+
+    def usage(self):
+        """Returns the bytes charged against the quota by all workspaces."""
+        return sum(charged for _job_id, _path, charged, _atime in self._workspaces())
+
+    def ensure_capacity(self, needed_bytes):
+        """Evicts idle workspaces, least recently used first, until needed_bytes fit."""
+        with self._lock:
+            workspaces = sorted(self._workspaces(), key=lambda w: w[3])
+            used = sum(w[2] for w in workspaces)
+            for job_id, path, charged, _atime in workspaces:
+                if used + needed_bytes <= self.quota_bytes:
+                    break
+                if job_id in self._active:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                used -= charged
+            if used + needed_bytes > self.quota_bytes:
+                raise ScratchQuotaExceeded(
+                    f"Scratch quota exceeded: {needed_bytes} bytes requested, "
+                    f"{self.quota_bytes - used} of {self.quota_bytes} bytes available"
+                )
+
+    def reclaim_orphans(self):
+        """Removes idle workspaces not used within the TTL. Returns how many were removed."""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            self._last_reclaim = time.time()
+            for job_id, path, _charged, atime in self._workspaces():
+                if atime < cutoff and job_id not in self._active:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        return removed
+
+    def maybe_reclaim(self):
+        """Runs reclaim_orphans if it has not run recently (for hosts without a reaper thread)."""
+        if time.time() - self._last_reclaim >= REAP_INTERVAL_SECONDS:
+            self.reclaim_orphans()
+
+    def start_reaper(self, interval=REAP_INTERVAL_SECONDS):
+        """Starts a daemon thread that reclaims orphaned workspaces periodically."""
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return self._reaper
+
+            def reap():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.reclaim_orphans()
+                    except OSError:
+                        pass
+
+            self._reaper = threading.Thread(target=reap, name='scratch-reaper', daemon=True)
+            self._reaper.start()
+            return self._reaper
+
+    # --- Internals ---
+
+    def _roots(self):
+        return [root for root in (self.tmpfs_root, self.disk_root) if root]
+
+    def _pick_root(self, expected_bytes):
+        """Chooses tmpfs for small jobs that fit comfortably, disk otherwise."""
+        if self.tmpfs_root and 0 < expected_bytes <= self.tmpfs_threshold_bytes:
+            try:
+                os.makedirs(self.tmpfs_root, exist_ok=True)
+                stats = os.statvfs(self.tmpfs_root)
+                if stats.f_bavail * stats.f_frsize >= 2 * expected_bytes:
+                    return self.tmpfs_root
+            except OSError:
+                pass
+        os.makedirs(self.disk_root, exist_ok=True)
+        return self.disk_root
+
+    def _touch(self, path):
+        try:
+            os.utime(os.path.join(path, META_FILENAME))
+        except OSError:
+            pass
+
+    def _workspaces(self):
+        """Yields (job_id, path, charged_bytes, last_used) for every workspace on disk."""
+        for root in self._roots():
+            try:
+                entries = list(os.scandir(root))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir(follow_symlinks=False):
+                    continue
+                meta_path = os.path.join(entry.path, META_FILENAME)
+                try:
+                    with open(meta_path) as f:
+                        reserved = int(f.read().strip() or 0)
+                    last_used = os.stat(meta_path).st_mtime
+                except (OSError, ValueError):
+                    reserved, last_used = 0, entry.stat(follow_symlinks=False).st_mtime
+                charged = max(reserved, _tree_size(entry.path))
+                yield entry.name[len(WORKSPACE_PREFIX):], entry.path, charged, last_used
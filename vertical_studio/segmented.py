@@ -0,0 +1,230 @@
+"""
+Resumable conversion in segments, for hosts that cap each invocation's run time.
+
+The selected range is split into segments that are encoded one by one as
+video-only MP4s. Each segment starts a fresh encoder, so it opens with an
+IDR frame and the joins fall on GOP boundaries. Finished segments and a
+manifest are kept under a token. When the time budget of an invocation runs
+short, advance() returns and the next call with the same token continues at
+the first unfinished segment. Once every segment is done, the segments are
+joined with the concat demuxer (stream copy) while the audio for the whole
+range is encoded in the same run. A join that runs out of time is retried
+by the next call, like an unfinished segment.
+
+The manifest directory must survive between invocations: on serverless
+hosts point VS_SEGMENT_DIR at storage shared by all instances.
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, replace
+
+from .fsutil import atomic_write_json
+from .pipeline import ConversionJob, ConversionResult, EncoderSettings, ERROR_TIMEOUT
+
+# --- Configuration ---
+DEFAULT_SEGMENT_ROOT = os.environ.get(
+    'VS_SEGMENT_DIR', os.path.join(tempfile.gettempdir(), 'vs_segments')
+)
+DEFAULT_SEGMENT_SECONDS = float(os.environ.get('VS_SEGMENT_SECONDS', '10'))
+MIN_SEGMENT_SECONDS = 1.0
+# Unfinished conversions are deleted after this long without progress
+STALE_SECONDS = int(os.environ.get('VS_SEGMENT_TTL_SECONDS', '3600'))
+MANIFEST_FILENAME = 'manifest.json'
+CONCAT_LIST_FILENAME = 'segments.txt'
+# Time reserved for the final join (stream copy plus audio encode)
+CONCAT_RESERVE_SECONDS = 5.0
+# Invocations that may time out during the join before the conversion fails
+MAX_JOIN_ATTEMPTS = 3
+# Safety factor on the slowest encode speed seen so far
+ESTIMATE_MARGIN = 1.25
+
+
+@dataclass
+class SegmentProgress:
+    """Outcome of one advance() call.
+
+    finished is True once the output is written. result is set when the
+    output was written or when encoding failed outright (result.success is
+    False); otherwise the caller should call again with the same token.
+    """
+    token: str
+    done_segments: int
+    total_segments: int
+    finished: bool = False
+    result: ConversionResult = None
+    meta: dict = None
+
+
+def plan_segments(start, end, segment_seconds):
+    """Splits [start, end) into consecutive segments of at most segment_seconds."""
+    count = max(1, math.ceil((end - start) / segment_seconds - 1e-9))  # Tolerate float noise in exact multiples
+    length = (end - start) / count
+    return [{'start': start + i * length, 'end': start + (i + 1) * length if i < count - 1 else end, 'done': False}
+            for i in range(count)]
+
+
+class SegmentedConversion:
+    """Runs a ConversionJob in resumable, time-boxed steps."""
+
+    def __init__(self, pipeline, root=DEFAULT_SEGMENT_ROOT, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+        self.pipeline = pipeline
+        self.root = root
+        self.segment_seconds = segment_seconds
+
+    def create(self, job, duration, meta=None):
+        """Plans job (whose input lasts duration seconds) and returns its continuation token.
+
+        meta is stored with the manifest and returned by every advance(), e.g.
+        to find the input again in a later invocation.
+        """
+        self.purge_stale()
+        start = job.start_time or 0.0
+        end = job.end_time if job.end_time is not None else duration
+        if job.settings.max_duration:
+            end = min(end, start + job.settings.max_duration)
+        token = uuid.uuid4().hex
+        os.makedirs(self._dir(token))
+        self._save(token, {
+            'job': {'crop_percent': job.crop_percent, 'zoom_level': job.zoom_level,
+                    'start_time': job.start_time, 'end_time': end, 'settings': asdict(job.settings)},
+            'segments': plan_segments(start, end, self.segment_seconds),
+            'seconds_per_second': None,
+            'meta': meta or {},
+        })
+        return token
+
+    def load(self, token):
+        """Returns the manifest for token, or None if it is unknown or expired."""
+        if not isinstance(token, str) or not token.isalnum():
+            return None
+        try:
+            with open(os.path.join(self._dir(token), MANIFEST_FILENAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def advance(self, token, input_path, output_path, deadline):
+        """Encodes segments until done or until time.monotonic() would pass deadline.
+
+        Returns a SegmentProgress, or None if the token is unknown.
+        """
+        manifest = self.load(token)
+        if manifest is None:
+            return None
+        job = self._job(manifest, input_path, output_path)
+        segments = manifest['segments']
+
+        encoded = False
+        index = 0
+        while index < len(segments):
+            segment = segments[index]
+            if segment['done']:
+                index += 1
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            seconds = segment['end'] - segment['start']
+            rate = (manifest['seconds_per_second'] or 0) * ESTIMATE_MARGIN
+            if rate * seconds > remaining:
+                if encoded:
+                    break  # Would not finish in time; leave it for the next invocation
+                # Even a fresh budget is too short for it: split it to fit so every call makes progress
+                if remaining / rate >= MIN_SEGMENT_SECONDS:
+                    segments[index:index + 1] = plan_segments(segment['start'], segment['end'], remaining / rate)
+                    self._save(token, manifest)
+                    continue
+                # Cannot be split further: try it anyway, a timeout ends the conversion below
+
+            result = self.pipeline.run(replace(
+                job, output_path=self._segment_path(token, segment), start_time=segment['start'],
+                end_time=segment['end'], video_only=True, assets_dir=None,
+                settings=replace(job.settings, max_duration=None, faststart=False)
+            ), timeout=remaining, allow_remux=False)
+
+            if result.error == ERROR_TIMEOUT:
+                # Too long for one invocation: split it and carry on next time
+                if seconds / 2 < MIN_SEGMENT_SECONDS:
+                    return self._progress(token, manifest, result=result)
+                segments[index:index + 1] = plan_segments(segment['start'], segment['end'], seconds / 2)
+                self._save(token, manifest)
+                break
+            if not result.success:
+                return self._progress(token, manifest, result=result)
+
+            segment['done'] = True
+            segment['file'] = os.path.basename(self._segment_path(token, segment))
+            speed = result.elapsed_seconds / max(seconds, 0.001)
+            manifest['seconds_per_second'] = max(speed, manifest['seconds_per_second'] or 0)
+            self._save(token, manifest)
+            encoded = True
+            index += 1
+
+        if not all(segment['done'] for segment in segments):
+            return self._progress(token, manifest)
+        if encoded and deadline - time.monotonic() < CONCAT_RESERVE_SECONDS:
+            return self._progress(token, manifest)  # Join at the start of the next invocation
+        result = self._join(token, manifest, job, deadline)
+        if result.error == ERROR_TIMEOUT:
+            # The segments are fine; keep them and retry the join with a fresh budget
+            manifest['join_timeouts'] = manifest.get('join_timeouts', 0) + 1
+            self._save(token, manifest)
+            if manifest['join_timeouts'] < MAX_JOIN_ATTEMPTS:
+                return self._progress(token, manifest)
+        return self._progress(token, manifest, result=result)
+
+    def discard(self, token):
+        """Deletes a conversion's segments and manifest."""
+        if isinstance(token, str) and token.isalnum():
+            shutil.rmtree(self._dir(token), ignore_errors=True)
+
+    def purge_stale(self):
+        """Deletes conversions that made no progress within STALE_SECONDS."""
+        cutoff = time.time() - STALE_SECONDS
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir() and os.stat(os.path.join(entry.path, MANIFEST_FILENAME)).st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _join(self, token, manifest, job, deadline):
+        list_path = os.path.join(self._dir(token), CONCAT_LIST_FILENAME)
+        with open(list_path, 'w') as f:
+            for segment in manifest['segments']:
+                f.write(f"file '{segment['file']}'\n")
+        return self.pipeline.execute(
+            self.pipeline.build_concat_command(list_path, job), job.output_path,
+            timeout=max(1.0, deadline - time.monotonic())
+        )
+
+    def _job(self, manifest, input_path, output_path):
+        spec = dict(manifest['job'])
+        settings = EncoderSettings(**spec.pop('settings'))
+        return ConversionJob(input_path, output_path, settings=settings, **spec)
+
+    def _progress(self, token, manifest, result=None):
+        segments = manifest['segments']
+        return SegmentProgress(
+            token, sum(1 for segment in segments if segment['done']), len(segments),
+            finished=bool(result and result.success), result=result, meta=manifest['meta']
+        )
+
+    def _dir(self, token):
+        return os.path.join(self.root, token)
+
+    def _segment_path(self, token, segment):
+        # Named by start time, so re-planned (split) segments never collide
+        return os.path.join(self._dir(token), f"seg_{segment['start']:012.3f}.mp4")
+
+    def _save(self, token, manifest):
+        atomic_write_json(os.path.join(self._dir(token), MANIFEST_FILENAME), manifest)
@@ -0,0 +1,202 @@
+"""
+Target-file-size encoding.
+
+Instead of guessing a CRF and re-encoding until the output fits a byte
+budget, a few short excerpts spread over the selected range are encoded
+through the real filter graph at two CRF values. x264's bitrate falls
+roughly exponentially with CRF, so a straight line fitted to
+log(bytes per second) against CRF predicts the whole output's size for any
+CRF. The final pass uses the CRF that meets the budget, with a VBV cap at
+the budget's average bitrate as a safety net.
+"""
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass, field, replace
+
+from .pipeline import ERROR_TIMEOUT, ConversionResult, Pipeline, build_filter_graph, thread_count
+
+SAMPLE_COUNT = 3
+SAMPLE_SECONDS = 2.0
+SAMPLE_CRFS = (20, 30)
+MIN_CRF = 0
+MAX_CRF = 51
+DEFAULT_AUDIO_KBPS = 128   # ffmpeg's AAC default for stereo
+CONTAINER_OVERHEAD = 1.01  # MP4 index and headers
+BUDGET_MARGIN = 0.97       # Aim slightly under the budget to absorb prediction error
+SAMPLE_TIMEOUT_SECONDS = 60  # Per sample encode; a caller's overall timeout can cut it shorter
+BITRATE = re.compile(r'\s*(\d+(?:\.\d*)?)([kKMG]?)(i?)(B?)\s*')  # ffmpeg's syntax: 128k, 1M, 128000, 16KiB
+
+
+class TargetSizeError(ValueError):
+    """Raised when a byte budget cannot be met (e.g. smaller than the audio alone)."""
+
+
+@dataclass
+class SizePlan:
+    """The chosen CRF for a byte budget, with the prediction it is based on."""
+    target_bytes: int
+    duration: float
+    crf: float
+    max_bitrate_kbps: int
+    predicted_bytes: int
+    samples: list = field(default_factory=list)   # (crf, bytes_per_second) measurements
+    actual_bytes: int = None
+
+    @property
+    def error_percent(self):
+        """Signed prediction error of the final output, in percent of the prediction."""
+        if self.actual_bytes is None or not self.predicted_bytes:
+            return None
+        return 100.0 * (self.actual_bytes - self.predicted_bytes) / self.predicted_bytes
+
+
+def _sample_windows(start, length, count=SAMPLE_COUNT, seconds=SAMPLE_SECONDS):
+    """Returns (start, seconds) windows spread evenly over [start, start + length]."""
+    if length <= count * seconds:
+        return [(start, length)]
+    return [(start + (i + 0.5) * length / count - seconds / 2, seconds) for i in range(count)]
+
+
+def _fit_line(points):
+    """Least-squares fit of y = a + b*x; returns (a, b)."""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    b = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return mean_y - b * mean_x, b
+
+
+def _parse_bitrate(value):
+    """Returns an ffmpeg bitrate option value ('128k', '1M', '128000') in bits per second."""
+    match = BITRATE.fullmatch(str(value))
+    if not match:
+        raise TargetSizeError(f"Unrecognised audio bitrate {value!r}")
+    number, prefix, binary, in_bytes = match.groups()
+    scale = (1024 if binary else 1000) ** ' KMG'.index(prefix.upper() or ' ')
+    return float(number) * scale * (8 if in_bytes else 1)
+
+
+def _audio_bytes_per_second(settings, has_audio):
+    if not has_audio:
+        return 0.0
+    if not settings.audio_bitrate:
+        return DEFAULT_AUDIO_KBPS * 1000 / 8
+    return _parse_bitrate(settings.audio_bitrate) / 8
+
+
+def _encode_samples(pipeline, job, windows, work_dir, deadline=None):
+    """Encodes every window once per SAMPLE_CRFS value (one decode per window); returns (crf, bytes/s) points.
+
+    The video arguments are the final encode's (threads, lookahead, VBV cap),
+    with only the CRF changed, so the samples predict its size. deadline is a
+    time.monotonic() value that all the sample encodes together must finish by.
+    """
+    if pipeline.memory_budget_bytes:
+        job, _ = pipeline.fit_to_memory(job, pipeline.probe(job.input_path))
+    settings = job.settings
+    graph = build_filter_graph(job.crop_percent, job.zoom_level, settings)
+    threads = thread_count(settings, pipeline.max_threads)
+    outputs = [f'[v{i}]' for i in range(len(SAMPLE_CRFS))]
+    totals = {crf: 0 for crf in SAMPLE_CRFS}
+    total_seconds = 0.0
+
+    for index, (start, seconds) in enumerate(windows):
+        cmd = [pipeline.ffmpeg, '-ss', f'{start:.3f}', '-t', f'{seconds:.3f}', '-i', job.input_path]
+        cmd += Pipeline._thread_args(settings, threads)
+        cmd += ['-filter_complex', f'{graph},split={len(outputs)}{"".join(outputs)}']
+        paths = []
+        for label, crf in zip(outputs, SAMPLE_CRFS):
+            path = os.path.join(work_dir, f'sample_{index}_{crf}.mp4')
+            paths.append(path)
+            cmd += ['-map', label] + Pipeline._video_args(replace(settings, crf=crf), threads)
+            cmd += ['-an', '-f', 'mp4', '-y', path]
+        timeout = SAMPLE_TIMEOUT_SECONDS
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise TargetSizeError("Ran out of time while encoding size samples")
+        result = pipeline.execute(cmd, timeout=timeout)
+        if result.error == ERROR_TIMEOUT and deadline is not None and time.monotonic() >= deadline:
+            raise TargetSizeError("Ran out of time while encoding size samples")
+        if not result.success:
+            raise TargetSizeError(f"Sample encode failed: {result.log[-300:]}")
+        for path, crf in zip(paths, SAMPLE_CRFS):
+            totals[crf] += os.path.getsize(path)
+        total_seconds += seconds
+
+    return [(crf, totals[crf] / total_seconds) for crf in SAMPLE_CRFS]
+
+
+def plan_target_size(pipeline, job, target_bytes, duration, has_audio=True, timeout=None):
+    """Encodes short samples of job and returns the SizePlan that meets target_bytes.
+
+    duration is the length of the output in seconds (after trimming). With
+    timeout, all sample encodes together must finish within that many seconds.
+    """
+    if duration <= 0:
+        raise TargetSizeError(f"Nothing to encode: the selected range is {duration:g}s long")
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    audio_bytes = _audio_bytes_per_second(job.settings, has_audio) * duration
+    video_budget = (target_bytes * BUDGET_MARGIN / CONTAINER_OVERHEAD) - audio_bytes
+    if video_budget <= 0:
+        raise TargetSizeError(
+            f"A {target_bytes / 1e6:.1f} MB budget is too small for {duration:.0f}s of audio alone"
+        )
+
+    work_dir = tempfile.mkdtemp(prefix='vs_size_')
+    try:
+        windows = _sample_windows(job.start_time or 0.0, duration)
+        samples = _encode_samples(pipeline, job, windows, work_dir, deadline)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    a, b = _fit_line([(crf, math.log(rate)) for crf, rate in samples])
+    target_rate = video_budget / duration
+    crf = (math.log(target_rate) - a) / b if b < 0 else MAX_CRF
+    crf = min(MAX_CRF, max(MIN_CRF, math.ceil(crf * 2) / 2))  # x264 accepts fractional CRF
+
+    predicted_video = math.exp(a + b * crf) * duration
+    predicted_bytes = int((min(predicted_video, video_budget / BUDGET_MARGIN) + audio_bytes) * CONTAINER_OVERHEAD)
+    # Cap the average video bitrate at the budget so content the samples missed cannot blow it
+    max_bitrate_kbps = max(1, int(video_budget * 8 / duration / 1000))
+    return SizePlan(target_bytes, duration, crf, max_bitrate_kbps, predicted_bytes, samples)
+
+
+def convert_to_target_size(pipeline, job, target_bytes, duration=None, timeout=None):
+    """Plans and runs a conversion whose output fits target_bytes. Returns (ConversionResult, SizePlan).
+
+    timeout covers the whole operation: the sample encodes and the final encode share it.
+    """
+    started = time.monotonic()
+    # Works without ffprobe too (the serverless API only ships ffmpeg)
+    input_duration, has_audio = pipeline.summarize(job.input_path)
+    if input_duration is None:
+        has_audio = True  # Unreadable banner: budget for audio to be safe
+    start = job.start_time or 0.0
+    if input_duration is not None and start >= input_duration:
+        raise TargetSizeError(f"The start time {start:g}s is past the end of the {input_duration:g}s input")
+    if duration is None:
+        if input_duration is None:
+            raise TargetSizeError("Could not read the input duration")
+        end = job.end_time if job.end_time is not None else input_duration
+        duration = end - start
+    if job.settings.max_duration:
+        duration = min(duration, job.settings.max_duration)
+
+    remaining = None if timeout is None else timeout - (time.monotonic() - started)
+    plan = plan_target_size(pipeline, job, target_bytes, duration, has_audio, timeout=remaining)
+    if timeout is not None:
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            return ConversionResult(False, "No time left for the final encode after size sampling", ERROR_TIMEOUT,
+                                    time.monotonic() - started, [], job.output_path), plan
+    sized_job = replace(job, settings=replace(job.settings, crf=plan.crf, max_bitrate_kbps=plan.max_bitrate_kbps))
+    result = pipeline.run(sized_job, timeout=remaining, allow_remux=False)
+    if result.success and os.path.exists(job.output_path):
+        plan.actual_bytes = os.path.getsize(job.output_path)
+    return result, plan
@@ -0,0 +1,220 @@
+"""
+Hot-folder watcher that feeds completed files to a bounded worker pool.
+
+Directories are monitored with filesystem notifications when the optional
+``watchdog`` package is installed, and by periodic polling otherwise. A file
+is only considered landed once its size and mtime have stayed unchanged for
+a settle period, so clips that are still being written are never picked up.
+Every file's progress is recorded in a JSON ledger that is replaced
+atomically on each change. A file that failed is not retried until its size
+or mtime changes.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from .fsutil import atomic_write_json
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Polling fallback
+    FileSystemEventHandler = object
+    Observer = None
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+RESCAN_INTERVAL = 30.0
+
+
+class _DirtyPaths(FileSystemEventHandler):
+    """Collects paths reported by watchdog so the main loop only re-checks those."""
+
+    def __init__(self):
+        self.paths = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        with self.lock:
+            self.paths.add(getattr(event, 'dest_path', None) or event.src_path)
+        self.wakeup.set()
+
+    def drain(self):
+        with self.lock:
+            paths, self.paths = self.paths, set()
+        return paths
+
+
+class FolderWatcher:
+    """Detects files that finished landing in a directory and converts them in a worker pool."""
+
+    def __init__(self, directories, handler, ledger_path, extensions, workers=2, queue_size=None,
+                 recursive=False, ignore_dirs=(), settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.handler = handler
+        self.ledger_path = ledger_path
+        self.extensions = tuple(extensions)
+        self.workers = workers
+        self.recursive = recursive
+        self.ignore_dirs = [os.path.abspath(d) + os.sep for d in ignore_dirs]
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.stop_event = threading.Event()
+        self._candidates = {}
+        self._ledger_lock = threading.Lock()
+        self._ledger = self._load_ledger()
+
+    # --- Ledger ---
+
+    def _load_ledger(self):
+        try:
+            with open(self.ledger_path) as f:
+                ledger = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Files that were in flight when a previous run stopped get picked up again
+        for entry in ledger.values():
+            if entry.get('status') in ('queued', 'converting'):
+                entry['status'] = 'interrupted'
+        return ledger
+
+    def _record(self, path, **fields):
+        with self._ledger_lock:
+            entry = self._ledger.setdefault(path, {})
+            entry.update(fields)
+            atomic_write_json(self.ledger_path, self._ledger)
+
+    def _already_handled(self, path, stats):
+        # 'failed' counts too: converting the same bytes again would fail again
+        entry = self._ledger.get(path)
+        return (entry is not None and entry.get('mtime_ns') == stats.st_mtime_ns
+                and entry.get('size') == stats.st_size
+                and entry.get('status') in ('queued', 'converting', 'done', 'failed'))
+
+    # --- Detection ---
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        if name.startswith('.') or not name.lower().endswith(self.extensions):
+            return False
+        return not any(path.startswith(prefix) for prefix in self.ignore_dirs)
+
+    def _scan(self):
+        """Returns every candidate file currently present in the watched directories."""
+        found = []
+        for directory in self.directories:
+            if self.recursive:
+                for dirpath, _dirnames, filenames in os.walk(directory):
+                    found.extend(os.path.join(dirpath, f) for f in filenames)
+            else:
+                try:
+                    found.extend(entry.path for entry in os.scandir(directory) if entry.is_file())
+                except FileNotFoundError:
+                    pass
+        return [path for path in found if self._wanted(path)]
+
+    def _observe(self, path, now):
+        """Tracks a path's size/mtime; files stay candidates until they settle."""
+        try:
+            stats = os.stat(path)
+        except FileNotFoundError:
+            self._candidates.pop(path, None)
+            return
+        if self._already_handled(path, stats):
+            self._candidates.pop(path, None)
+            return
+        signature = (stats.st_size, stats.st_mtime_ns)
+        previous = self._candidates.get(path)
+        if previous is None or previous[0] != signature:
+            self._candidates[path] = (signature, now)
+
+    def _dispatch_settled(self, now):
+        """Queues candidates whose size and mtime have not changed for the settle period."""
+        for path, (signature, since) in list(self._candidates.items()):
+            if now - since < self.settle_seconds or signature[0] == 0:
+                continue
+            try:
+                self.queue.put_nowait((path, signature))
+            except queue.Full:
+                return  # Back-pressure: try again on the next tick
+            del self._candidates[path]
+            self._record(path, status='queued', size=signature[0], mtime_ns=signature[1],
+                         landed_at=signature[1] / 1e9, queued_at=time.time())
+
+    # --- Workers ---
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, (size, mtime_ns) = item
+            started = time.time()
+            self._record(path, status='converting', started_at=started)
+            try:
+                success, message, output_path = self.handler(path)
+            except Exception as e:
+                success, message, output_path = False, f"Unexpected error: {e}", None
+            finished = time.time()
+            self._record(
+                path, status='done' if success else 'failed', finished_at=finished,
+                output=output_path, message=None if success else message[-500:],
+                encode_seconds=round(finished - started, 3),
+                latency_seconds=round(finished - mtime_ns / 1e9, 3)
+            )
+
+    # --- Main loop ---
+
+    def run(self):
+        """Watches until stop() is called (or KeyboardInterrupt), then drains the pool."""
+        threads = [threading.Thread(target=self._worker, name=f'convert-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        dirty = _DirtyPaths()
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            for directory in self.directories:
+                observer.schedule(dirty, directory, recursive=self.recursive)
+            observer.start()
+
+        last_full_scan = 0.0
+        try:
+            while not self.stop_event.is_set():
+                now = time.time()
+                if observer is None or now - last_full_scan >= RESCAN_INTERVAL:
+                    # Polling mode, or a periodic safety net for missed notifications
+                    paths = self._scan()
+                    last_full_scan = now
+                else:
+                    paths = [p for p in dirty.drain() if self._wanted(p)]
+                for path in paths:
+                    self._observe(path, now)
+                # Re-check unsettled candidates even if no new event arrived for them
+                for path in list(self._candidates):
+                    self._observe(path, now)
+                self._dispatch_settled(now)
+                dirty.wakeup.wait(self.poll_interval)
+                dirty.wakeup.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            for _ in threads:
+                self.queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Conversion worker for the durable job queue.
+
+API nodes enqueue conversions with POST /jobs; workers claim them, encode
+from the shared content store into the shared output store, and report the
+result. Run as many workers on as many machines as needed, as long as they
+all see the same queue and store directories (VS_JOB_QUEUE_PATH,
+VS_CONTENT_STORE_DIR, VS_OUTPUT_STORE_DIR). A worker that dies mid-encode
+stops heartbeating and its job is retried by another worker.
+
+Examples:
+    python worker.py
+    python worker.py --processes 4 --ffmpeg /usr/local/bin/ffmpeg
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from vertical_studio.content_store import ContentStore
+from vertical_studio.jobqueue import DEFAULT_LEASE_SECONDS, SQLiteJobQueue
+from vertical_studio.output_store import OutputStore
+from vertical_studio.pipeline import ConversionJob, EncoderSettings, Pipeline
+from vertical_studio.resources import cpu_info, ffmpeg_rlimits, memory_budget_bytes, threads_per_worker
+from vertical_studio.scratch import ScratchStorage
+from vertical_studio.sizing import TargetSizeError, convert_to_target_size
+
+POLL_INTERVAL_SECONDS = 2.0
+
+
+class Worker:
+    """Claims queued jobs one at a time and converts them."""
+
+    def __init__(self, queue, pipeline, content_store, output_store, scratch, worker_id=None,
+                 lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.content_store = content_store
+        self.output_store = output_store
+        self.scratch = scratch
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stops after the current job."""
+        self._stop.set()
+
+    def run(self, once=False):
+        """Processes jobs until stopped (or, with once, until the queue is empty)."""
+        while not self._stop.is_set():
+            job = self.queue.claim(self.worker_id, self.lease_seconds)
+            if job is None:
+                if once:
+                    return
+                self._stop.wait(POLL_INTERVAL_SECONDS)
+                continue
+            self.process(job)
+
+    def process(self, job):
+        """Converts one claimed job, heartbeating until it finishes."""
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job.job_id, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            success, message, meta = self.convert(job.payload)
+        except Exception as e:
+            # Infrastructure trouble (storage, ffmpeg crash): let another attempt try
+            self.queue.fail(job.job_id, self.worker_id, f"Worker error: {e}", retry=True)
+            print(f"[RETRY] {job.job_id}: {e}")
+            return
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        if success:
+            self.queue.complete(job.job_id, self.worker_id, {'output_id': meta['output_id'], 'message': message})
+            print(f"[OK] {job.job_id} -> {meta['output_id']}")
+        else:
+            # The same input and settings would fail again
+            self.queue.fail(job.job_id, self.worker_id, message, retry=False)
+            print(f"[FAIL] {job.job_id}: {message}")
+
+    def convert(self, payload):
+        """Runs the conversion described by payload. Returns (success, message, output meta)."""
+        meta = self.output_store.get(payload['output_id'])
+        if meta is not None:
+            return True, "Reused retained output", meta
+
+        input_hash = payload['input_hash']
+        with self.scratch.job(expected_bytes=self.content_store.size(input_hash) or 0) as (_job_id, work_dir), \
+                self.content_store.hold(input_hash) as input_path:
+            output_path = os.path.join(work_dir, 'output.mp4')
+            assets_dir = os.path.join(work_dir, 'assets') if payload.get('thumbnails') else None
+            job = ConversionJob(
+                input_path, output_path, payload['crop'], payload['zoom'], EncoderSettings(**payload['settings']),
+                start_time=payload['start_time'], end_time=payload['end_time'], assets_dir=assets_dir
+            )
+            if payload.get('target_bytes'):
+                try:
+                    result, plan = convert_to_target_size(self.pipeline, job, payload['target_bytes'],
+                                                          timeout=payload['timeout'])
+                except TargetSizeError as e:
+                    return False, str(e), None
+                extra = {'target_bytes': plan.target_bytes, 'predicted_bytes': plan.predicted_bytes, 'crf': plan.crf}
+            else:
+                result = self.pipeline.run(job, timeout=payload['timeout'])
+                extra = {'fast_path': result.fast_path, 'peak_rss_bytes': result.peak_rss_bytes,
+                         'cpu_seconds': result.cpu_seconds}
+            if not result.success or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+                return False, f"FFmpeg error ({result.error}): {result.log[-300:]}", None
+            asset_paths = [os.path.join(assets_dir, name) for name in sorted(os.listdir(assets_dir))] if assets_dir else []
+            meta = self.output_store.put(payload['output_id'], output_path, payload['download_name'], extra=extra,
+                                         asset_paths=asset_paths)
+        return True, "Success", meta
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id, self.lease_seconds):
+                print(f"[WARN] Lost the lease on {job_id}")
+                return
+
+
+def run_worker(args):
+    worker = Worker(
+        SQLiteJobQueue(args.queue) if args.queue else SQLiteJobQueue(),
+        Pipeline(ffmpeg=args.ffmpeg, memory_budget_bytes=memory_budget_bytes(),
+                 max_threads=threads_per_worker(args.processes), **ffmpeg_rlimits()),
+        ContentStore(), OutputStore(), ScratchStorage(),
+        lease_seconds=args.lease
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        worker.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Claim and run queued vertical conversions.")
+    parser.add_argument('--queue', help="SQLite queue file (default $VS_JOB_QUEUE_PATH)")
+    parser.add_argument('--ffmpeg', default='ffmpeg', help="ffmpeg binary (default: from PATH)")
+    parser.add_argument('--processes', type=int, default=1, help="Worker processes on this machine (default 1)")
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS,
+                        help=f"Seconds a claim stays valid without a heartbeat (default {DEFAULT_LEASE_SECONDS})")
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    cpu = cpu_info()
+    print(f"Starting {args.processes} worker process(es) with {threads_per_worker(args.processes)} ffmpeg thread(s) each "
+          f"({cpu['cpus']} CPUs from {cpu['source']}; Ctrl+C to stop)...")
+    if args.processes == 1:
+        run_worker(args)
+        return
+    processes = [multiprocessing.Process(target=run_worker, args=(args,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()